@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+# makes the rag_app package importable when run as `python bench/run_bench.py`
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from dotenv import load_dotenv
+
+
+load_dotenv(override=True)
+
+EVALUATION_DATA_FILE = os.path.join(os.path.dirname(SCRIPT_DIR), "evaluator", "evaluation_data.csv")
+
+
+def percentiles(values: list[float]) -> dict:
+    values_ms = np.asarray(values) * 1000
+    return {
+        "count": len(values),
+        "mean_ms": float(values_ms.mean()),
+        "p50_ms": float(np.percentile(values_ms, 50)),
+        "p95_ms": float(np.percentile(values_ms, 95)),
+        "p99_ms": float(np.percentile(values_ms, 99)),
+    }
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_level(pipeline, prompts: list[str], concurrency: int, stream: bool) -> tuple[dict, dict]:
+    """Replays prompts with `concurrency` queries in flight; returns throughput and per-stage timings."""
+    stage_timings = {}
+
+    def run_query(question: str):
+        query_run = pipeline.submit(question, stream=stream)
+        if stream:
+            for _ in query_run.stream_answer():
+                pass
+        query_run.wait()
+        return query_run.timings
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for timings in executor.map(run_query, prompts):
+            for stage, timing in timings.items():
+                stage_timings.setdefault(stage, []).append(timing["duration"])
+    wall_time = time.perf_counter() - start
+
+    throughput = {"queries": len(prompts), "wall_time_s": wall_time, "qps": len(prompts) / wall_time}
+    return throughput, {stage: percentiles(durations) for stage, durations in stage_timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and throughput benchmark of the RAG query path.")
+    parser.add_argument("--prompts-file", default=EVALUATION_DATA_FILE)
+    parser.add_argument("--limit", type=int, default=None, help="replay only the first N prompts")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--stream", action="store_true", help="generate answers through the streaming path")
+    parser.add_argument("--live-gemini", action="store_true", help="call Gemini instead of the local stand-ins")
+    parser.add_argument("--fake-image-encoder", action="store_true", help="replace Visualized-BGE with a stand-in")
+    parser.add_argument("--embed-latency", type=float, default=0.1)
+    parser.add_argument("--first-token-latency", type=float, default=0.4)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--image-encoder-latency", type=float, default=0.05)
+    parser.add_argument("--warm-cache", action="store_true", help="use the persistent embedding cache")
+    parser.add_argument("--rerank", action="store_true", help="enable the cross-encoder rerank stage")
+    parser.add_argument("--no-search-batching", action="store_true", help="send one Milvus search per query")
+    parser.add_argument(
+        "--backend", choices=["milvus", "mmap"], default=os.getenv("VECTOR_BACKEND", "milvus"),
+        help="vector search backend, see rag_app/mmap_backend.py",
+    )
+    parser.add_argument("--service-url", default=None, help="send the queries to a running rag_app/service.py")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.rerank:
+        os.environ["RERANK"] = "true"
+    if args.no_search_batching:
+        os.environ["SEARCH_BATCHING"] = "false"
+    os.environ["VECTOR_BACKEND"] = args.backend
+    if not args.warm_cache:
+        # a fresh cache per run, so every query pays for its embeddings
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "embedding_cache.db")
+
+    from rag_app.ask_llm import create_gemini_model
+    from rag_app.encoder import get_image_encoder
+    from rag_app.milvus_utils import get_milvus_client
+    from rag_app.query_pipeline import QueryPipeline
+    from rag_app.service_client import QueryServiceClient
+    from bench.stand_ins import install_gemini_stand_ins, install_image_encoder_stand_in
+
+    prompts = pd.read_csv(args.prompts_file)["prompt"].tolist()[:args.limit]
+    gemini_model = milvus_client = None
+    # with --service-url, models, stand-ins and caches are whatever the service was started with
+    if not args.service_url:
+        if args.live_gemini:
+            gemini_model = create_gemini_model(os.getenv("GEMINI_API_KEY"))
+        else:
+            gemini_model = install_gemini_stand_ins(args.embed_latency, args.first_token_latency, args.tokens_per_second)
+        if args.fake_image_encoder:
+            install_image_encoder_stand_in(args.image_encoder_latency)
+        else:
+            get_image_encoder()
+        milvus_client = get_milvus_client(uri=os.getenv("MILVUS_ENDPOINT"))
+
+    report = {
+        "commit": git_commit(),
+        "config": vars(args),
+        "levels": {},
+    }
+    for concurrency in args.concurrency:
+        pipeline = QueryServiceClient(args.service_url) if args.service_url else QueryPipeline(
+            milvus_client, gemini_model, os.getenv("TEXT_COLLECTION_NAME"), os.getenv("IMAGE_COLLECTION_NAME"),
+            max_workers=2 * concurrency,
+        )
+        throughput, stages = run_level(pipeline, prompts, concurrency, args.stream)
+        report["levels"][str(concurrency)] = {**throughput, "stages": stages}
+        print(f"concurrency={concurrency}: {throughput['qps']:.2f} QPS, "
+              f"total p50 {stages['total']['p50_ms']:.0f}ms, p95 {stages['total']['p95_ms']:.0f}ms")
+    report["max_rss_mb"] = max_rss_mb()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
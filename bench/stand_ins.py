@@ -0,0 +1,119 @@
+import time
+import hashlib
+import numpy as np
+import google.generativeai as genai
+
+import rag_app.encoder as encoder
+
+
+def fake_vector(content: str, dim: int) -> list[float]:
+    """Deterministic unit vector derived from the content, so repeated inputs embed identically."""
+    seed = int.from_bytes(hashlib.sha256(content.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeEmbedContent:
+    """Stand-in for genai.embed_content with a fixed per-request latency."""
+
+    def __init__(self, dim: int = 768, latency: float = 0.1):
+        self.dim = dim
+        self.latency = latency
+
+    def __call__(self, model: str, content, **kwargs) -> dict:
+        time.sleep(self.latency)
+        if isinstance(content, str):
+            return {"embedding": fake_vector(content, self.dim)}
+        return {"embedding": [fake_vector(text, self.dim) for text in content]}
+
+
+class FakeFinishReason:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class FakeCandidate:
+    def __init__(self, finish_reason: FakeFinishReason = None):
+        self.finish_reason = finish_reason
+
+
+class FakeUsageMetadata:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class FakePromptFeedback:
+    block_reason = None
+
+
+class FakeChunk:
+    """Stand-in for a GenerateContentResponse chunk, with the attributes ask_llm reads."""
+
+    def __init__(self, text: str, finish_reason: str = None):
+        self.text = text
+        self.parts = [text] if text else []
+        self.candidates = [FakeCandidate(FakeFinishReason(finish_reason) if finish_reason else None)]
+
+
+class FakeResponse:
+    """Stand-in for the response of generate_content; iterating it yields the chunks of a streamed answer."""
+
+    def __init__(self, chunks, prompt_tokens: int, answer_tokens: int):
+        self._chunks = chunks
+        self.prompt_feedback = FakePromptFeedback()
+        self.usage_metadata = FakeUsageMetadata(prompt_tokens, answer_tokens)
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    @property
+    def text(self) -> str:
+        return "".join(chunk.text for chunk in self._chunks)
+
+
+class FakeGenerativeModel:
+    """Stand-in for genai.GenerativeModel: answers after first_token_latency and streams tokens_per_second."""
+
+    def __init__(self, first_token_latency: float = 0.4, tokens_per_second: float = 200.0, answer_tokens: int = 150):
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+
+    def _chunks(self, prompt: str):
+        time.sleep(self.first_token_latency)
+        words = [f"token{i}" for i in range(self.answer_tokens)]
+        for i in range(0, len(words), 10):
+            time.sleep(10 / self.tokens_per_second)
+            last = i + 10 >= len(words)
+            yield FakeChunk(" ".join(words[i:i + 10]) + " ", "STOP" if last else None)
+
+    def generate_content(self, prompt: str, generation_config=None, stream: bool = False):
+        chunks = self._chunks(prompt)
+        return FakeResponse(chunks if stream else list(chunks), len(prompt.split()), self.answer_tokens)
+
+
+class FakeImageEncoder:
+    """Stand-in for the Visualized-BGE encoder with a fixed per-call latency."""
+
+    def __init__(self, dim: int = 768, latency: float = 0.05):
+        self.dim = dim
+        self.latency = latency
+
+    def encode_text(self, text: str) -> list[float]:
+        time.sleep(self.latency)
+        return fake_vector(f"text:{text}", self.dim)
+
+    def encode_image(self, image_path: str) -> list[float]:
+        time.sleep(self.latency)
+        return fake_vector(f"image:{image_path}", self.dim)
+
+
+def install_gemini_stand_ins(embed_latency: float, first_token_latency: float, tokens_per_second: float):
+    """Routes Gemini embedding calls to a local stand-in and returns a stand-in generative model."""
+    genai.embed_content = FakeEmbedContent(latency=embed_latency)
+    return FakeGenerativeModel(first_token_latency, tokens_per_second)
+
+
+def install_image_encoder_stand_in(latency: float):
+    encoder._image_encoder = FakeImageEncoder(latency=latency)
@@ -1,12 +1,23 @@
-import pandas as pd
 import os
 import ssl
+import json
+import argparse
 import certifi
 from glob import glob
-from tqdm import tqdm
 
-from rag_app.encoder import emb_text, emb_image
-from rag_app.milvus_utils import get_milvus_client, create_text_collection, create_image_collection
+from rag_app.encoder import emb_text_batched, emb_images
+from rag_app.chunker import chunk_articles
+from rag_app.dataset import read_articles, IMAGE_EXTENSIONS
+from rag_app.lexical_index import BM25Index, LEXICAL_INDEX_PATH
+from rag_app.quantization import TEXT_QUANTIZATION, IMAGE_QUANTIZATION
+from rag_app.ingest import (
+    image_row_id, diff_ids, store_full_vectors, can_update_text_collection, can_update_image_collection
+)
+from rag_app import telemetry
+from rag_app.milvus_utils import (
+    get_milvus_client, create_text_collection, create_image_collection, get_stored_ids, upsert_rows, delete_rows,
+    mark_collection_updated, IMAGE_URLS_MAX_CAPACITY
+)
 
 from dotenv import load_dotenv
 
@@ -18,6 +29,7 @@ IMAGE_COLLECTION_NAME = os.getenv("IMAGE_COLLECTION_NAME")
 MILVUS_ENDPOINT = os.getenv("MILVUS_ENDPOINT")
 ARTICLES_FILENAME = os.getenv("ARTICLES_FILENAME")
 IMAGES_DATA_DIR = os.getenv("IMAGES_DATA_DIR")
+TEXT_EMBEDDINGS_CHECKPOINT = os.getenv("TEXT_EMBEDDINGS_CHECKPOINT", "./data/text_embeddings.jsonl")
 
 milvus_client = get_milvus_client(uri=MILVUS_ENDPOINT, token=None)
 
@@ -27,72 +39,134 @@ print(f"Milvus DB: {MILVUS_ENDPOINT}, Text Collection: {TEXT_COLLECTION_NAME}, I
 
 
 def get_articles(articles_filename: str = ARTICLES_FILENAME):
-    input_filename = articles_filename
-    return pd.read_csv(input_filename)
+    return read_articles(articles_filename)
 
 
 def get_images(img_data_dir: str = IMAGES_DATA_DIR):
-    image_list = glob(os.path.join(img_data_dir, "*.png"))
-    return image_list
-
-
-# TEXT COLLECTION
-
-text_df = get_articles()
-
-dim = len(emb_text("test"))
-create_text_collection(
-    milvus_client=milvus_client,
-    collection_name=TEXT_COLLECTION_NAME,
-    dim=dim,
-    drop_old=True
-)
+    image_list = []
+    for extension in IMAGE_EXTENSIONS.values():
+        image_list.extend(glob(os.path.join(img_data_dir, f"*{extension}")))
+    return sorted(image_list)
 
-print("Generating text embeddings")
-try:
-    doc_embeddings = emb_text(text_df.text)
-except Exception as e:
-    print(
-        f"Failed to generate embeddings:\n{e}"
-    )
-
-data = []
-for index, row in text_df.iterrows():
-    data.append({
-        "vector": doc_embeddings[index],
-        "text": row.text,
-        "article_url": row.article_url, 
-        "image_url": row.image
-        })
-print("Total number of loaded documents:", len(data))
 
-mr = milvus_client.insert(collection_name=TEXT_COLLECTION_NAME, data=data)
-print("Total number of inserted documents:", mr["insert_count"])
+def insert_text_collection(incremental: bool = False):
+    text_df = chunk_articles(get_articles())
+    text_df = text_df.drop_duplicates(subset="id").reset_index(drop=True)
+    print(f"Articles split into {len(text_df)} chunks")
 
+    # the lexical index is cheap to build, so it always covers the full current corpus
+    BM25Index.build(text_df.id.tolist(), text_df.text.tolist()).save(LEXICAL_INDEX_PATH)
+    print(f"Lexical index saved in: {LEXICAL_INDEX_PATH}")
 
-# IMAGE COLLECTION
+    incremental = incremental and can_update_text_collection(milvus_client, TEXT_COLLECTION_NAME)
 
-image_list = get_images()
-
-dim = len(emb_image(image_list[0]))
-create_image_collection(
-    milvus_client=milvus_client,
-    collection_name=IMAGE_COLLECTION_NAME,
-    dim=dim,
-    drop_old=True
-)
+    ids_to_delete = set()
+    if incremental:
+        ids_to_add, ids_to_delete = diff_ids(get_stored_ids(milvus_client, TEXT_COLLECTION_NAME), set(text_df.id))
+        text_df = text_df[text_df.id.isin(ids_to_add)].reset_index(drop=True)
+        print(f"Chunks to add: {len(text_df)}, chunks to delete: {len(ids_to_delete)}")
 
-image_dict = {}
-for image_path in tqdm(image_list, desc="Generating image embeddings: "):
+    print("Generating text embeddings")
     try:
-        image_dict[image_path] = emb_image(image_path)
+        doc_embeddings = emb_text_batched(text_df.text.tolist(), checkpoint_path=TEXT_EMBEDDINGS_CHECKPOINT)
     except Exception as e:
-        print(f"Failed to generate embedding for {image_path}. Skipped.")
-        continue
-print("Number of encoded images:", len(image_dict))
+        raise SystemExit(
+            f"Failed to generate embeddings:\n{e}\nFinished embeddings are kept in {TEXT_EMBEDDINGS_CHECKPOINT}; rerun to resume."
+        )
+
+    if not incremental and not doc_embeddings:
+        print(f"No chunks to insert, {TEXT_COLLECTION_NAME} is left as it is")
+        return
+
+    if not incremental:
+        # the old collection is only dropped once all embeddings are available
+        create_text_collection(
+            milvus_client=milvus_client,
+            collection_name=TEXT_COLLECTION_NAME,
+            dim=len(doc_embeddings[0]),
+            drop_old=True
+        )
+
+    stored_embeddings = TEXT_QUANTIZATION.encode(doc_embeddings) if doc_embeddings else []
+    data = []
+    for index, row in text_df.iterrows():
+        data.append({
+            "id": row.id,
+            "vector": stored_embeddings[index],
+            "text": row.text,
+            "article_id": row.article_id,
+            "chunk_index": row.chunk_index,
+            "article_url": row.article_url,
+            "image_url": row.image[:IMAGE_URLS_MAX_CAPACITY]
+            })
+    print("Total number of loaded chunks:", len(data))
+
+    print("Total number of inserted chunks:", upsert_rows(milvus_client, TEXT_COLLECTION_NAME, data))
+    print("Total number of deleted chunks:", delete_rows(milvus_client, TEXT_COLLECTION_NAME, list(ids_to_delete)))
+    store_full_vectors(
+        TEXT_COLLECTION_NAME, TEXT_QUANTIZATION, dict(zip(text_df.id, doc_embeddings)), ids_to_delete,
+        rebuild=not incremental,
+    )
+    # merges the segments written batch by batch and drops deleted rows
+    milvus_client.compact(TEXT_COLLECTION_NAME)
+    mark_collection_updated(TEXT_COLLECTION_NAME)
+    # the vectors are stored now, and the embedding cache covers later runs
+    if os.path.exists(TEXT_EMBEDDINGS_CHECKPOINT):
+        os.remove(TEXT_EMBEDDINGS_CHECKPOINT)
+
+
+def insert_image_collection(incremental: bool = False):
+    image_ids = {image_row_id(image_path): image_path for image_path in get_images()}
+
+    incremental = incremental and can_update_image_collection(milvus_client, IMAGE_COLLECTION_NAME)
+
+    ids_to_delete = set()
+    if incremental:
+        ids_to_add, ids_to_delete = diff_ids(get_stored_ids(milvus_client, IMAGE_COLLECTION_NAME), set(image_ids))
+        image_ids = {image_id: image_ids[image_id] for image_id in ids_to_add}
+        print(f"Images to add: {len(image_ids)}, images to delete: {len(ids_to_delete)}")
+
+    image_dict = emb_images(list(image_ids.values()))
+    print("Number of encoded images:", len(image_dict))
+
+    if not incremental and not image_dict:
+        print(f"No images could be encoded, {IMAGE_COLLECTION_NAME} is left as it is")
+        return
+
+    if not incremental:
+        create_image_collection(
+            milvus_client=milvus_client,
+            collection_name=IMAGE_COLLECTION_NAME,
+            dim=len(next(iter(image_dict.values()))),
+            drop_old=True
+        )
+
+    vectors = {
+        image_id: image_dict[image_path] for image_id, image_path in image_ids.items() if image_path in image_dict
+    }
+    stored_vectors = IMAGE_QUANTIZATION.encode(list(vectors.values())) if vectors else []
+    data = [
+        {"id": image_id, "image_path": image_ids[image_id], "vector": vector}
+        for image_id, vector in zip(vectors, stored_vectors)
+    ]
+    print("Total number of images inserted:", upsert_rows(milvus_client, IMAGE_COLLECTION_NAME, data))
+    print("Total number of images deleted:", delete_rows(milvus_client, IMAGE_COLLECTION_NAME, list(ids_to_delete)))
+    store_full_vectors(IMAGE_COLLECTION_NAME, IMAGE_QUANTIZATION, vectors, ids_to_delete, rebuild=not incremental)
+    # merges the segments written batch by batch and drops deleted rows
+    milvus_client.compact(IMAGE_COLLECTION_NAME)
+    mark_collection_updated(IMAGE_COLLECTION_NAME)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed articles and images and store them in Milvus.")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="only embed new or changed articles and images, and delete the ones that disappeared"
+    )
+    args = parser.parse_args()
 
-mr =milvus_client.insert(
-    collection_name=IMAGE_COLLECTION_NAME,
-    data=[{"image_path": k, "vector": v} for k, v in image_dict.items()],
-)
-print("Total number of images inserted:", mr["insert_count"])
\ No newline at end of file
+    with telemetry.span("ingest_text", incremental=args.incremental):
+        insert_text_collection(incremental=args.incremental)
+    with telemetry.span("ingest_images", incremental=args.incremental):
+        insert_image_collection(incremental=args.incremental)
+    print(json.dumps(telemetry.telemetry.snapshot(), indent=2))
@@ -2,20 +2,61 @@ import pandas as pd
 import json
 import re
 import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import load_workbook
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
+from rag_app.dataset import ArticleWriter
+
 
 load_dotenv(override=True)
 
 SINGLE_ARTICLES_FILENAME = os.getenv("SINGLE_ARTICLES_FILENAME")
 WEEKLY_ARTICLES_FILENAME = os.getenv("WEEKLY_ARTICLES_FILENAME")
 ARTICLES_FILENAME = os.getenv("ARTICLES_FILENAME")
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+PARSE_CHUNK_ROWS = int(os.getenv("PARSE_CHUNK_ROWS", 200))
 
 
-def parse_single_articles(input_filename: str):
+def default_html_parser() -> str:
+    parser = os.getenv("PARSE_HTML_PARSER")
+    if parser:
+        return parser
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+
+HTML_PARSER = default_html_parser()
+
+ARTICLE_COLUMNS = ['article_url', 'text', 'image']
+
+
+def iter_excel_chunks(input_filename: str, chunk_rows: int = PARSE_CHUNK_ROWS):
+    """Reads a sheet in read-only mode and yields it as DataFrames of at most chunk_rows rows."""
+    workbook = load_workbook(input_filename, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = list(next(rows))
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_rows:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def clean_single_articles(df: pd.DataFrame) -> pd.DataFrame:
     df = (
-        pd.read_excel(input_filename)
+        df
         .drop(columns=['web-scraper-order', 'web-scraper-start-url', 'image-src'])
         .rename(columns={'thebatch_root-href': 'article_url'})
         .dropna()
@@ -36,32 +77,42 @@ def parse_single_articles(input_filename: str):
     df = df.drop(columns="image")
     df = df.rename(columns={"image_cleaned": "image"})
 
-    return df[['article_url', 'text', 'image']]
+    return df[ARTICLE_COLUMNS]
 
 
-def parse_weekly_articles(input_filename: str):
+def parse_single_articles(input_filename: str):
+    return clean_single_articles(pd.read_excel(input_filename))
+
+
+def extract_articles(html: str, parser: str = HTML_PARSER):
+    articles = []
+
+    raw_articles = html.split('<hr>')
+    for raw_article in raw_articles:
+        article_soup = BeautifulSoup(raw_article, parser)
+        text = article_soup.get_text(separator=' ', strip=True)
+        images = [img['src'] for img in article_soup.find_all('img') if 'src' in img.attrs]
+        articles.append({
+            'text': text,
+            'image': images
+        })
+    return articles
+
+
+def clean_weekly_articles(df: pd.DataFrame, executor: ProcessPoolExecutor = None) -> pd.DataFrame:
     df = (
-        pd.read_excel(input_filename)
+        df
         .drop(columns=['web-scraper-order', 'web-scraper-start-url'])
         .rename(columns={'thebatch_root-href': 'article_url', 'text': 'raw_html'})
         .dropna()
     )
+    if df.empty:
+        return pd.DataFrame(columns=ARTICLE_COLUMNS)
 
-    def extract_articles(html: str):
-        articles = []
-        
-        raw_articles = html.split('<hr>')
-        for raw_article in raw_articles:
-            article_soup = BeautifulSoup(raw_article, 'html.parser')
-            text = article_soup.get_text(separator=' ', strip=True)
-            images = [img['src'] for img in article_soup.find_all('img') if 'src' in img.attrs]
-            articles.append({
-                'text': text,
-                'image': images
-            })
-        return articles
-
-    df['articles'] = df.raw_html.apply(extract_articles)
+    if executor is None:
+        df['articles'] = df.raw_html.apply(extract_articles)
+    else:
+        df['articles'] = list(executor.map(extract_articles, df.raw_html, chunksize=8))
 
     df_exploded = df.drop(columns='raw_html').explode('articles')
     df_exploded = df_exploded.reset_index()
@@ -74,17 +125,49 @@ def parse_weekly_articles(input_filename: str):
     return full_df
 
 
-def parse_articles(
+def parse_weekly_articles(input_filename: str):
+    return clean_weekly_articles(pd.read_excel(input_filename))
+
+
+def iter_parsed_articles(
         single_filename: str = SINGLE_ARTICLES_FILENAME,
         weekly_filename: str = WEEKLY_ARTICLES_FILENAME,
-        output_filename: str = ARTICLES_FILENAME
+        executor: ProcessPoolExecutor = None,
+        chunk_rows: int = PARSE_CHUNK_ROWS,
     ):
-    
-    single_articles_df = parse_single_articles(single_filename)
-    weekly_articles_df = parse_weekly_articles(weekly_filename)
-
-    all_articles_df = pd.concat([single_articles_df, weekly_articles_df], ignore_index=True)
-    all_articles_df[['article_url', 'text', 'image']].to_csv(output_filename, index=False)
+    """Yields the cleaned articles of both inputs as DataFrames of at most chunk_rows spreadsheet rows."""
+    for chunk in iter_excel_chunks(single_filename, chunk_rows):
+        yield clean_single_articles(chunk)
+    for chunk in iter_excel_chunks(weekly_filename, chunk_rows):
+        yield clean_weekly_articles(chunk, executor)
 
 
-parse_articles()
+def parse_articles(
+        single_filename: str = SINGLE_ARTICLES_FILENAME,
+        weekly_filename: str = WEEKLY_ARTICLES_FILENAME,
+        output_filename: str = ARTICLES_FILENAME,
+        workers: int = PARSE_WORKERS,
+        chunk_rows: int = PARSE_CHUNK_ROWS,
+    ):
+    """Parses both inputs chunk by chunk and appends the articles to output_filename as they are ready.
+
+    With workers > 1 the weekly issues are split into articles in a process pool.
+    """
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        with ArticleWriter(output_filename) as writer:
+            for articles in iter_parsed_articles(single_filename, weekly_filename, executor, chunk_rows):
+                writer.write(articles)
+            print(f"Saved {writer.rows} articles in: {output_filename}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean the scraped articles.")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS, help="processes parsing the weekly issues")
+    parser.add_argument("--chunk-rows", type=int, default=PARSE_CHUNK_ROWS, help="spreadsheet rows read at a time")
+    args = parser.parse_args()
+
+    parse_articles(workers=args.workers, chunk_rows=args.chunk_rows)
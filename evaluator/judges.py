@@ -0,0 +1,132 @@
+import os
+import time
+import asyncio
+
+from deepeval.test_case import LLMTestCaseParams
+from deepeval.metrics import AnswerRelevancyMetric, FaithfulnessMetric, HallucinationMetric, GEval
+from deepeval.dataset import EvaluationDataset
+from deepeval.models.base_model import DeepEvalBaseLLM
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from dotenv import load_dotenv
+
+
+load_dotenv(override=True)
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = "gemini-2.0-flash-lite-preview-02-05"
+JUDGE_TEMPERATURE = 0.7
+# identifies the judge in cached verdicts; change it when the judge model or its settings change
+JUDGE_MODEL_NAME = f"{GEMINI_MODEL}:temperature={JUDGE_TEMPERATURE}"
+
+EVALUATION_DATA_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "evaluation_data.csv")
+
+
+class AsyncRateLimiter:
+    """Spaces out async calls so that at most requests_per_minute start in any minute."""
+
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60.0 / requests_per_minute
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class TestGoogleGenerativeAI(DeepEvalBaseLLM):
+    """Class to implement Google Generative AI for DeepEval"""
+
+    def __init__(self, model, rate_limiter: AsyncRateLimiter = None):
+        self.model = model
+        self.rate_limiter = rate_limiter
+
+    def load_model(self):
+        return self.model
+
+    def generate(self, prompt: str) -> str:
+        chat_model = self.load_model()
+        return chat_model.invoke(prompt).content
+
+    async def a_generate(self, prompt: str) -> str:
+        if self.rate_limiter:
+            await self.rate_limiter.wait()
+        chat_model = self.load_model()
+        res = await chat_model.ainvoke(prompt)
+        return res.content
+
+    def get_model_name(self):
+        return "Google Generative AI Model"
+
+
+def create_judge(rate_limiter: AsyncRateLimiter = None) -> TestGoogleGenerativeAI:
+    custom_model_gemini = ChatGoogleGenerativeAI(
+        model=GEMINI_MODEL,
+        convert_system_message_to_human=True,
+        google_api_key=GEMINI_API_KEY,
+        temperature=JUDGE_TEMPERATURE,
+        top_k=1,
+        top_p=0.9,
+        max_output_tokens=8192,
+        verbose=True
+    )
+    return TestGoogleGenerativeAI(model=custom_model_gemini, rate_limiter=rate_limiter)
+
+
+def build_metrics(judge: DeepEvalBaseLLM) -> list:
+    """The judge metrics every case is evaluated with; metrics keep per-case state, so build them per case."""
+    answer_relevancy_metric = AnswerRelevancyMetric(
+        threshold=0.7,
+        model=judge,
+        include_reason=True
+    )
+
+    bias_metric = FaithfulnessMetric(
+        threshold=0.7,
+        model=judge,
+        include_reason=True
+    )
+
+    hallucination_metric = HallucinationMetric(
+        threshold=0.6,
+        model=judge,
+        include_reason=True
+    )
+
+    correctness_metric = GEval(
+        threshold=0.7,
+        name="Correctness",
+        evaluation_steps=[
+            "Check whether the facts in 'actual output' contradict any facts in 'expected output'",
+            "Heavily penalize omission of detail",
+            "Vague language, or contradicting OPINIONS, are not okay"
+        ],
+        evaluation_params=[
+            LLMTestCaseParams.INPUT,
+            LLMTestCaseParams.ACTUAL_OUTPUT,
+            LLMTestCaseParams.EXPECTED_OUTPUT
+        ],
+        model=judge
+    )
+
+    return [answer_relevancy_metric, bias_metric, hallucination_metric, correctness_metric]
+
+
+def load_dataset(file_path: str = EVALUATION_DATA_FILE) -> EvaluationDataset:
+    dataset = EvaluationDataset()
+    dataset.add_test_cases_from_csv_file(
+        file_path=file_path,
+        input_col_name="prompt",
+        actual_output_col_name="response",
+        expected_output_col_name="ground_truth",
+        context_col_name="context",
+        context_col_delimiter=";",
+        retrieval_context_col_name="context",
+        retrieval_context_col_delimiter=";"
+    )
+    return dataset
@@ -1,5 +1,7 @@
+import hashlib
 import logging
 import sys
+
 import pandas as pd
 
 from whylogs.core.schema import DatasetSchema
@@ -25,16 +27,90 @@ def llm_schema():
     sys.stdout = _stdout
     return schema
 
-def base_clean_schema(metric_name):
-    schema = udf_schema()
+def langkit_udf_specs():
+    """UDF specs registered so far; read on every call, since notebooks register more along the way."""
+    return tuple(udf_schema().multicolumn_udfs)
+
+def langkit_metric_names():
+    return sorted({name for udf_spec in langkit_udf_specs() for name in udf_spec.udfs})
 
-    final_udf_spec = []
-    for udf_spec in schema.multicolumn_udfs:
-        if metric_name in udf_spec.udfs:
-            final_udf_spec.append(udf_spec)
-    schema.multicolumn_udfs = final_udf_spec
+def base_clean_schema(metric_names):
+    if isinstance(metric_names, str):
+        metric_names = [metric_names]
+    schema = udf_schema()
+    schema.multicolumn_udfs = [
+        udf_spec for udf_spec in langkit_udf_specs() if any(name in udf_spec.udfs for name in metric_names)
+    ]
     return schema
 
+def dataset_hash(dataset):
+    digest = hashlib.sha256(repr(list(dataset.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(dataset, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+class LangkitScores:
+    """Langkit metrics of one dataset, each scored once and shared by all helpers."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.annotated = dataset
+        self._profile_view = None
+
+    def missing(self, metric_names):
+        return [name for name in metric_names if name not in self.annotated.columns]
+
+    def score(self, metric_names):
+        missing = self.missing(metric_names)
+        if not missing:
+            return
+        # UDF specs compute several metrics at once, so one spec may add more columns than requested
+        annotated, _ = base_clean_schema(missing).apply_udfs(self.dataset)
+        new_columns = [col for col in annotated.columns if col not in self.annotated.columns]
+        self.annotated = pd.concat([self.annotated, annotated[new_columns]], axis=1)
+        self._profile_view = None
+
+    @property
+    def profile_view(self):
+        # the metric columns are already computed, so the profile is logged without UDFs
+        if self._profile_view is None:
+            self._profile_view = TransientLogger().log(self.annotated, schema=DatasetSchema()).profile().view()
+        return self._profile_view
+
+
+_scores_cache = {}
+
+def langkit_scores(dataset, metric_names=None):
+    """Annotated dataset and profile for the given metrics, all registered langkit metrics by default.
+
+    Scores are memoized per dataset hash and only metrics that are not scored yet
+    are computed, in one pass, so viewing metrics of the same dataset again only
+    slices the cached result. Call prefetch_langkit_scores(dataset) once after
+    registering the metrics to score them all up front.
+    """
+    key = dataset_hash(dataset)
+    scores = _scores_cache.get(key)
+    if scores is None:
+        scores = _scores_cache[key] = LangkitScores(dataset)
+    registered = langkit_metric_names()
+    if metric_names is None:
+        metric_names = registered
+    unknown = [name for name in scores.missing(metric_names) if name not in registered]
+    if unknown:
+        raise ValueError(f"Unknown langkit metrics: {unknown}")
+    scores.score(metric_names)
+    return scores
+
+def prefetch_langkit_scores(dataset):
+    """Scores every registered langkit metric of the dataset in one apply_udfs pass.
+
+    Metrics registered later, e.g. custom UDFs, are scored when first viewed.
+    """
+    return langkit_scores(dataset)
+
+def clear_langkit_scores():
+    _scores_cache.clear()
+
 def base_show_queries(annotated_dataset, metric_name, n, ascending):
     if ascending == None and metric_name in ["response.relevance_to_prompt"]:
         sorted_annotated_dataset = annotated_dataset.sort_values(by=[metric_name], ascending=True)
@@ -49,14 +125,14 @@ def base_show_queries(annotated_dataset, metric_name, n, ascending):
 
 
 def show_langkit_critical_queries(dataset, metric_name, n=3, ascending=None):
-    annotated_dataset, _ = base_clean_schema(metric_name).apply_udfs(dataset)
+    annotated_dataset = langkit_scores(dataset, [metric_name]).annotated
     return base_show_queries(annotated_dataset, metric_name, n, ascending)
 
 
-def base_visualize_metric(dataset_or_profile, metric_name, schema, numeric):
+def base_visualize_metric(dataset_or_profile, metric_name, numeric):
     logging.getLogger("whylogs.viz.notebook_profile_viz").setLevel(logging.ERROR)
     if type(dataset_or_profile) == pd.DataFrame:
-        prof_view = TransientLogger().log(dataset_or_profile, schema=schema).profile().view()
+        prof_view = langkit_scores(dataset_or_profile, [metric_name]).profile_view
     else:
         prof_view = dataset_or_profile.view()
 
@@ -68,10 +144,9 @@ def base_visualize_metric(dataset_or_profile, metric_name, schema, numeric):
         return viz.double_histogram(metric_name)
     
 def visualize_langkit_metric(dataset_or_profile, metric_name, numeric=None):
-    schema=base_clean_schema(metric_name)
     if numeric == None:
         if metric_name in ["prompt.has_patterns", "response.has_patterns"]:
             numeric = False
         else:
             numeric = True
-    return base_visualize_metric(dataset_or_profile, metric_name, schema, numeric)
+    return base_visualize_metric(dataset_or_profile, metric_name, numeric)
@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import asyncio
+import argparse
+
+# makes judges.py importable when run from the repository root
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from judges import AsyncRateLimiter, create_judge, build_metrics, load_dataset, JUDGE_MODEL_NAME, EVALUATION_DATA_FILE
+
+
+EVAL_VERDICT_CACHE = os.getenv(
+    "EVAL_VERDICT_CACHE", os.path.join(os.path.dirname(os.path.realpath(__file__)), "verdict_cache.db")
+)
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", 8))
+EVAL_REQUESTS_PER_MINUTE = int(os.getenv("EVAL_REQUESTS_PER_MINUTE", 60))
+
+
+def metric_signature(metric) -> dict:
+    """Settings that change a metric's verdict; part of the cache key."""
+    return {
+        "metric": type(metric).__name__,
+        "name": getattr(metric, "name", None),
+        "threshold": metric.threshold,
+        "evaluation_steps": getattr(metric, "evaluation_steps", None),
+        "evaluation_params": [str(param) for param in getattr(metric, "evaluation_params", None) or []],
+    }
+
+
+def case_content(test_case) -> dict:
+    return {
+        "input": test_case.input,
+        "actual_output": test_case.actual_output,
+        "expected_output": test_case.expected_output,
+        "context": test_case.context,
+        "retrieval_context": test_case.retrieval_context,
+    }
+
+
+def verdict_key(metric, test_case, judge_model: str = JUDGE_MODEL_NAME) -> str:
+    payload = json.dumps(
+        {"metric": metric_signature(metric), "case": case_content(test_case), "judge": judge_model}, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """Judge verdicts stored in SQLite as soon as they are made, so an interrupted run resumes where it stopped."""
+
+    def __init__(self, path: str = EVAL_VERDICT_CACHE):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, metric TEXT NOT NULL, score REAL, success INTEGER NOT NULL, "
+            "reason TEXT, judged_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> dict:
+        row = self._conn.execute("SELECT metric, score, success, reason FROM verdicts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        metric, score, success, reason = row
+        return {"metric": metric, "score": score, "success": bool(success), "reason": reason}
+
+    def put(self, key: str, verdict: dict):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO verdicts (key, metric, score, success, reason, judged_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, verdict["metric"], verdict["score"], int(verdict["success"]), verdict["reason"], time.time()),
+        )
+        self._conn.commit()
+
+
+async def judge_case(test_case, metric, cache: VerdictCache, semaphore: asyncio.Semaphore) -> dict:
+    key = verdict_key(metric, test_case)
+    verdict = cache.get(key)
+    if verdict is not None:
+        return {**verdict, "cached": True}
+
+    async with semaphore:
+        try:
+            await metric.a_measure(test_case, _show_indicator=False)
+        except Exception as e:
+            # errors are not cached, the next run retries them
+            return {"metric": metric.__name__, "score": None, "success": False, "reason": None, "error": str(e)}
+    verdict = {
+        "metric": metric.__name__,
+        "score": metric.score,
+        "success": bool(metric.success),
+        "reason": getattr(metric, "reason", None),
+    }
+    cache.put(key, verdict)
+    return {**verdict, "cached": False}
+
+
+async def run_evaluation(test_cases: list, concurrency: int, requests_per_minute: int, cache: VerdictCache) -> list:
+    judge = create_judge(AsyncRateLimiter(requests_per_minute))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    tasks, case_ids = [], []
+    for case_id, test_case in enumerate(test_cases):
+        for metric in build_metrics(judge):
+            tasks.append(judge_case(test_case, metric, cache, semaphore))
+            case_ids.append(case_id)
+
+    results = []
+    for case_id, verdict in zip(case_ids, await asyncio.gather(*tasks)):
+        results.append({"case": case_id, "input": test_cases[case_id].input, **verdict})
+    return results
+
+
+def summarize(results: list) -> dict:
+    summary = {}
+    for result in results:
+        metric = summary.setdefault(result["metric"], {"passed": 0, "failed": 0, "errors": 0, "cached": 0, "scores": []})
+        if "error" in result:
+            metric["errors"] += 1
+            continue
+        metric["passed" if result["success"] else "failed"] += 1
+        metric["cached"] += result["cached"]
+        metric["scores"].append(result["score"])
+    for metric in summary.values():
+        scores = metric.pop("scores")
+        metric["mean_score"] = sum(scores) / len(scores) if scores else None
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Judge the evaluation cases concurrently, reusing cached verdicts of unchanged cases."
+    )
+    parser.add_argument("--data", default=EVALUATION_DATA_FILE)
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY, help="metrics judged at the same time")
+    parser.add_argument("--requests-per-minute", type=int, default=EVAL_REQUESTS_PER_MINUTE, help="judge LLM calls")
+    parser.add_argument("--cache", default=EVAL_VERDICT_CACHE)
+    parser.add_argument("--output", default=None, help="write every verdict and the summary to this JSON file")
+    args = parser.parse_args()
+
+    test_cases = list(load_dataset(args.data).test_cases)
+    start = time.perf_counter()
+    results = asyncio.run(
+        run_evaluation(test_cases, args.concurrency, args.requests_per_minute, VerdictCache(args.cache))
+    )
+    summary = summarize(results)
+    print(json.dumps(summary, indent=2))
+    print(f"Judged {len(test_cases)} cases in {time.perf_counter() - start:.1f}s")
+
+    for result in results:
+        if "error" in result:
+            print(f"[error] case {result['case']} {result['metric']}: {result['error']}")
+        elif not result["success"]:
+            print(f"[failed] case {result['case']} {result['metric']} ({result['score']}): {result['reason']}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"summary": summary, "results": results}, file, indent=2)
+    sys.exit(0 if all(result["success"] for result in results) else 1)
@@ -1,68 +1,254 @@
-import pandas as pd
 import json
 import os
 import io
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from PIL import Image
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+from rag_app import telemetry
+from rag_app.dataset import read_articles, IMAGE_EXTENSIONS
+
 
 load_dotenv(override=True)
 
 ARTICLES_FILENAME = os.getenv("ARTICLES_FILENAME")
 IMAGES_DATA_DIR = os.getenv("IMAGES_DATA_DIR")
 IMAGES_DATASET_CONFIG_FILE = os.getenv("IMAGES_DATASET_CONFIG_FILE")
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", 16))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", 30))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", 3))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "png").lower()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 85))
+
+DOWNLOAD_MANIFEST_FILE = "download_manifest.json"
+# the manifest is saved after this many new images, so an interrupted run keeps most of its progress
+MANIFEST_SAVE_EVERY = int(os.getenv("MANIFEST_SAVE_EVERY", 100))
+IMAGE_SIZE = (448, 448)
+
 
-os.makedirs(IMAGES_DATA_DIR, exist_ok=True)
+def image_name(image_url: str) -> str:
+    """File name stem of an image, from its URL without the common host prefix."""
+    return image_url[51:].replace('/', '_').replace('.', '_')
 
 
 def create_image_dataset_config(
-        articles_filename: str = ARTICLES_FILENAME, 
+        articles_filename: str = ARTICLES_FILENAME,
         output_folder: str = IMAGES_DATA_DIR,
         img_config_file:str = IMAGES_DATASET_CONFIG_FILE
     ):
-    
-    all_articles_df = pd.read_csv(articles_filename)
+
+    all_articles_df = read_articles(articles_filename)
     all_articles_df.info()
 
-    all_articles_df['image'] = all_articles_df['image'].str.strip('"').str.strip("[]").str.split(',')
-    unique_images = all_articles_df.explode('image').image.dropna().unique()
-    cleaned_image_urls = {el.replace("'", "") for el in unique_images if len(el) > 5}
+    cleaned_image_urls = set(all_articles_df.explode('image').image.dropna().unique())
 
     images = {}
     for el in cleaned_image_urls:
         if el is not None:
-            image_name = el[51:].replace('/', '_').replace('.', '_')
-            images[image_name] = el
+            images[image_name(el)] = el
 
     with open(f'{output_folder}{img_config_file}', 'w') as file:
         json.dump(images, file)
-    
+
     return images
 
 
-def save_images_locally(output_folder=IMAGES_DATA_DIR):
-    
+def create_session(pool_size: int = DOWNLOAD_WORKERS, retries: int = DOWNLOAD_RETRIES) -> requests.Session:
+    """Session with a connection pool sized for the download workers and retries with backoff."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def load_manifest(output_folder: str) -> dict:
+    manifest_path = os.path.join(output_folder, DOWNLOAD_MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as file:
+        return json.load(file)
+
+
+def save_manifest(manifest: dict, output_folder: str):
+    manifest_path = os.path.join(output_folder, DOWNLOAD_MANIFEST_FILE)
+    with open(f"{manifest_path}.tmp", "w") as file:
+        json.dump(manifest, file)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+
+def is_downloaded(manifest: dict, image_name: str, image_url: str, output_path: str) -> bool:
+    """True if output_path holds the image of image_url.
+
+    Entries are added once the image is completely written, so a file without an
+    entry may be left over from an interrupted run and is downloaded again.
+    """
+    return manifest.get(image_name, {}).get("url") == image_url and os.path.exists(output_path)
+
+
+def fetch_image(session: requests.Session, image_url: str, etag: str = None, timeout: float = DOWNLOAD_TIMEOUT):
+    """Returns (content, etag); content is None when the server reports the image unchanged."""
+    headers = {"If-None-Match": etag} if etag else {}
+    with telemetry.span("download_image", url=image_url) as span:
+        response = session.get(image_url, headers=headers, timeout=timeout)
+        span["status"] = response.status_code
+        span["bytes"] = len(response.content)
+    if response.status_code == 304:
+        return None, etag
+    response.raise_for_status()
+    return response.content, response.headers.get("ETag")
+
+
+def resize_and_save(
+        content: bytes,
+        output_path: str,
+        size: tuple = IMAGE_SIZE,
+        image_format: str = IMAGE_FORMAT,
+        quality: int = IMAGE_QUALITY,
+    ) -> str:
+    image = Image.open(io.BytesIO(content))
+    image = image.resize(size)
+    # written next to the target and renamed, so an interrupted save never leaves a truncated image
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        if image_format == "png":
+            image.save(tmp_path, format='PNG')
+        elif image_format == "webp":
+            image = image if image.mode in ("RGB", "RGBA") else image.convert("RGBA")
+            image.save(tmp_path, format='WEBP', quality=quality, method=6)
+        else:
+            # JPEG has no alpha channel, transparent areas are flattened onto white
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            background.save(tmp_path, format='JPEG', quality=quality, optimize=True)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    # a copy saved earlier in another format would be ingested twice
+    stem = os.path.splitext(output_path)[0]
+    for extension in IMAGE_EXTENSIONS.values():
+        if f"{stem}{extension}" != output_path and os.path.exists(f"{stem}{extension}"):
+            os.remove(f"{stem}{extension}")
+    return output_path
+
+
+def download_images(
+        img_dataset: dict,
+        output_folder: str = IMAGES_DATA_DIR,
+        session: requests.Session = None,
+        max_workers: int = DOWNLOAD_WORKERS,
+        timeout: float = DOWNLOAD_TIMEOUT,
+        revalidate: bool = False,
+        process_workers: int = None,
+        image_format: str = IMAGE_FORMAT,
+        quality: int = IMAGE_QUALITY,
+    ) -> dict:
+    """Downloads {image_name: url} into output_folder concurrently.
+
+    Images already on disk for the same URL and format are skipped; with revalidate=True
+    they are re-requested with their stored ETag and only replaced if the server has a
+    newer version. Decoding, resizing and encoding run in a process pool.
+    """
+    if image_format not in IMAGE_EXTENSIONS:
+        raise ValueError(f"Unsupported image format {image_format}, expected one of {', '.join(IMAGE_EXTENSIONS)}.")
+    session = session or create_session(max_workers)
+    manifest = load_manifest(output_folder)
+    stats = {"downloaded": 0, "skipped": 0, "failed": 0}
+
+    to_fetch = {}
+    for image_name, image_url in img_dataset.items():
+        output_path = os.path.join(output_folder, f"{image_name}{IMAGE_EXTENSIONS[image_format]}")
+        entry = manifest.get(image_name, {})
+        up_to_date = is_downloaded(manifest, image_name, image_url, output_path)
+        if up_to_date and not revalidate:
+            stats["skipped"] += 1
+        else:
+            to_fetch[image_name] = (image_url, entry.get("etag") if up_to_date else None, output_path)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as download_pool, \
+                ProcessPoolExecutor(max_workers=process_workers) as process_pool:
+            downloads = {
+                download_pool.submit(fetch_image, session, image_url, etag, timeout): image_name
+                for image_name, (image_url, etag, _) in to_fetch.items()
+            }
+            # downloads and resizes are handled as they complete, so the manifest follows the files on disk
+            resizes = {}
+            pending = set(downloads)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in downloads:
+                        image_name = downloads[future]
+                        image_url, _, output_path = to_fetch[image_name]
+                        try:
+                            content, etag = future.result()
+                        except Exception as e:
+                            print(f"Failed to download {image_url}: {e}")
+                            telemetry.incr("download_failures_total")
+                            stats["failed"] += 1
+                            continue
+                        if content is None:
+                            stats["skipped"] += 1
+                            continue
+                        resize = process_pool.submit(
+                            resize_and_save, content, output_path, IMAGE_SIZE, image_format, quality
+                        )
+                        resizes[resize] = (image_name, {"url": image_url, "etag": etag})
+                        pending.add(resize)
+                        continue
+
+                    image_name, entry = resizes.pop(future)
+                    try:
+                        print(f"Image saved in: {future.result()}")
+                    except Exception as e:
+                        print(f"Failed to save {image_name}: {e}")
+                        stats["failed"] += 1
+                        continue
+                    manifest[image_name] = entry
+                    stats["downloaded"] += 1
+                    if stats["downloaded"] % MANIFEST_SAVE_EVERY == 0:
+                        save_manifest(manifest, output_folder)
+    finally:
+        # images saved before a failure or an interrupt are not downloaded again
+        save_manifest(manifest, output_folder)
+    for outcome, count in stats.items():
+        telemetry.incr("images_total", count, outcome=outcome)
+    print(f"Downloaded: {stats['downloaded']}, skipped: {stats['skipped']}, failed: {stats['failed']}")
+    return stats
+
+
+def save_images_locally(output_folder=IMAGES_DATA_DIR, revalidate: bool = False):
+    os.makedirs(output_folder, exist_ok=True)
+
     img_dataset = create_image_dataset_config(
-        ARTICLES_FILENAME, 
+        ARTICLES_FILENAME,
         output_folder,
         IMAGES_DATASET_CONFIG_FILE
     )
 
-    for image_name in img_dataset:
-        image_url = img_dataset[image_name]
-        try:
-            image = requests.get(image_url).content
-            image = Image.open(io.BytesIO(image))
-
-            image = image.resize((448, 448))
+    return download_images(img_dataset, output_folder, revalidate=revalidate)
 
-            output_path = os.path.join(output_folder, f"{image_name}.png")
-
-            image.save(output_path, format='PNG')
-            print(f"Image saved in: {output_path}")
-        except Exception as e:
-            print(e)
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the article images.")
+    parser.add_argument(
+        "--revalidate", action="store_true",
+        help="re-check images already on disk against the server ETag instead of skipping them"
+    )
+    args = parser.parse_args()
 
-save_images_locally()
+    save_images_locally(revalidate=args.revalidate)
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+from rag_app.index_specs import INDEX_PRESETS, TEXT_INDEX_SPEC, IMAGE_INDEX_SPEC, get_index_spec
+from rag_app.quantization import QuantizationSpec, TEXT_QUANTIZATION, IMAGE_QUANTIZATION, get_full_vector_store
+from rag_app.milvus_utils import get_milvus_client, rebuild_index, search_vectors
+
+from dotenv import load_dotenv
+
+
+load_dotenv(override=True)
+
+TEXT_COLLECTION_NAME = os.getenv("TEXT_COLLECTION_NAME")
+IMAGE_COLLECTION_NAME = os.getenv("IMAGE_COLLECTION_NAME")
+MILVUS_ENDPOINT = os.getenv("MILVUS_ENDPOINT")
+
+
+def load_vectors(
+    milvus_client, collection_name: str, quantization: QuantizationSpec = QuantizationSpec(), batch_size: int = 1000
+):
+    """Ids and full-precision vectors of the collection, the ground truth of exact search.
+
+    Quantized collections store float16 or packed binary vectors, so their full-precision
+    vectors are read from the sidecar store instead.
+    """
+    if quantization.quantized:
+        return get_full_vector_store().get_all(collection_name)
+    iterator = milvus_client.query_iterator(
+        collection_name=collection_name, batch_size=batch_size, filter="", output_fields=["vector"]
+    )
+    ids, vectors = [], []
+    try:
+        while batch := iterator.next():
+            ids.extend(row["id"] for row in batch)
+            vectors.extend(row["vector"] for row in batch)
+    finally:
+        iterator.close()
+    return ids, np.asarray(vectors, dtype=np.float32)
+
+
+def exact_top_k(matrix: np.ndarray, queries: np.ndarray, k: int, metric_type: str) -> np.ndarray:
+    """Brute-force baseline: row indices of the k best matches of every query."""
+    if metric_type == "COSINE":
+        matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    if metric_type == "L2":
+        scores = -((queries[:, None, :] - matrix[None, :, :]) ** 2).sum(axis=2)
+    else:
+        scores = queries @ matrix.T
+    top_k = np.argpartition(-scores, kth=min(k, scores.shape[1] - 1), axis=1)[:, :k]
+    order = np.take_along_axis(scores, top_k, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top_k, order, axis=1)
+
+
+def measure_recall(milvus_client, collection_name: str, index_spec, quantization: QuantizationSpec, ids: list,
+                   matrix: np.ndarray, n_queries: int = 100, k: int = 10, seed: int = 0) -> dict:
+    """Uses stored vectors as queries and compares the index results with exact full-precision search.
+
+    Queries go through the search path of the app, so quantized collections are searched
+    with encoded queries on their mapped index and rescored.
+    """
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(ids), size=min(n_queries, len(ids)), replace=False)
+    queries = matrix[query_rows]
+    expected = exact_top_k(matrix, queries, k, index_spec.metric_type)
+
+    recalls, latencies = [], []
+    for query, expected_rows in zip(queries, expected):
+        start = time.perf_counter()
+        hits = search_vectors(milvus_client, collection_name, query.tolist(), [], k, index_spec, quantization)
+        latencies.append(time.perf_counter() - start)
+        expected_ids = {ids[row] for row in expected_rows}
+        recalls.append(len(expected_ids & {hit["id"] for hit in hits}) / len(expected_ids))
+
+    search_spec = quantization.index_spec(index_spec)
+    return {
+        "collection": collection_name,
+        "storage": quantization.storage,
+        "index_type": search_spec.index_type,
+        "metric_type": search_spec.metric_type,
+        "build_params": search_spec.build_params,
+        "search_params": search_spec.search_params,
+        "queries": len(queries),
+        f"recall@{k}": float(np.mean(recalls)),
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p95_ms": float(np.percentile(latencies, 95) * 1000),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild the vector index of a collection and report its recall against exact search."
+    )
+    parser.add_argument("--collection", choices=["text", "image"], default="text")
+    parser.add_argument("--index-type", choices=list(INDEX_PRESETS), help="defaults to the configured index")
+    parser.add_argument("--build-params", type=json.loads, default=None, help='JSON, e.g. \'{"M": 32}\'')
+    parser.add_argument("--search-params", type=json.loads, default=None, help='JSON, e.g. \'{"ef": 128}\'')
+    parser.add_argument("--no-rebuild", action="store_true", help="only measure the current index")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    collection_name, configured_spec, quantization = {
+        "text": (TEXT_COLLECTION_NAME, TEXT_INDEX_SPEC, TEXT_QUANTIZATION),
+        "image": (IMAGE_COLLECTION_NAME, IMAGE_INDEX_SPEC, IMAGE_QUANTIZATION),
+    }[args.collection]
+    index_spec = get_index_spec(
+        index_type=args.index_type or configured_spec.index_type,
+        metric_type=configured_spec.metric_type,
+        build_params=args.build_params if args.index_type else {**configured_spec.build_params, **(args.build_params or {})},
+        search_params=args.search_params if args.index_type else {**configured_spec.search_params, **(args.search_params or {})},
+        consistency_level=configured_spec.consistency_level,
+    )
+
+    milvus_client = get_milvus_client(uri=MILVUS_ENDPOINT, token=None)
+    if not args.no_rebuild:
+        # binary collections get the binary counterpart of the requested index
+        build_spec = quantization.index_spec(index_spec)
+        start = time.perf_counter()
+        rebuild_index(milvus_client, collection_name, build_spec)
+        print(f"Rebuilt {build_spec.index_type} index on {collection_name} in {time.perf_counter() - start:.1f}s")
+
+    ids, matrix = load_vectors(milvus_client, collection_name, quantization)
+    report = measure_recall(milvus_client, collection_name, index_spec, quantization, ids, matrix, args.queries, args.k)
+    print(json.dumps(report, indent=2))
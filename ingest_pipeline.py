@@ -0,0 +1,377 @@
+import os
+import json
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pymilvus import MilvusClient
+
+from data_parse import iter_parsed_articles, PARSE_WORKERS, PARSE_CHUNK_ROWS
+from img_download import (
+    create_session, load_manifest, save_manifest, fetch_image, resize_and_save, image_name, is_downloaded,
+    DOWNLOAD_WORKERS, IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_SIZE, MANIFEST_SAVE_EVERY,
+)
+from rag_app.chunker import chunk_articles
+from rag_app.dataset import ArticleWriter, iter_article_batches, IMAGE_EXTENSIONS
+from rag_app.encoder import (
+    emb_text_batch, warm_image_encoder, ImageEmbeddingStream, RateLimiter,
+    EMBED_BATCH_SIZE, EMBED_MAX_WORKERS, EMBED_REQUESTS_PER_MINUTE, IMAGE_BATCH_SIZE,
+)
+from rag_app.lexical_index import BM25Index, LEXICAL_INDEX_PATH
+from rag_app.quantization import TEXT_QUANTIZATION, IMAGE_QUANTIZATION, get_full_vector_store
+from rag_app.stream_pipeline import Stage, Pipeline, INGEST_QUEUE_SIZE
+from rag_app.ingest import image_row_id, can_update_text_collection, can_update_image_collection
+from rag_app.milvus_utils import (
+    get_milvus_client, create_text_collection, create_image_collection, iter_stored_ids, upsert_rows, delete_rows,
+    swap_collection, mark_collection_updated, IMAGE_URLS_MAX_CAPACITY,
+)
+from rag_app import telemetry
+
+from dotenv import load_dotenv
+
+
+load_dotenv(override=True)
+
+TEXT_COLLECTION_NAME = os.getenv("TEXT_COLLECTION_NAME")
+IMAGE_COLLECTION_NAME = os.getenv("IMAGE_COLLECTION_NAME")
+MILVUS_ENDPOINT = os.getenv("MILVUS_ENDPOINT")
+ARTICLES_FILENAME = os.getenv("ARTICLES_FILENAME")
+IMAGES_DATA_DIR = os.getenv("IMAGES_DATA_DIR")
+INGEST_INSERT_BATCH_SIZE = int(os.getenv("INGEST_INSERT_BATCH_SIZE", 1000))
+# full runs build the collections under this suffix and swap them in at the end
+STAGING_SUFFIX = "_staging"
+
+
+class IngestLedger:
+    """Keys seen by one run and the chunk texts of the lexical index, in a temporary SQLite file.
+
+    Keys are grouped by kind, e.g. the chunk ids of the run and the ids stored in the text
+    collection before it, so memory stays flat however large the corpus grows.
+    """
+
+    def __init__(self):
+        self._dir = tempfile.mkdtemp(prefix="ingest-")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(self._dir, "ledger.db"), isolation_level=None, check_same_thread=False
+        )
+        # the file is thrown away after the run, so it needs no durability
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE keys (kind TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (kind, key)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE TABLE texts (id TEXT NOT NULL, text TEXT NOT NULL)")
+
+    def add(self, kind: str, key: str) -> bool:
+        """Records key and returns True if it was not recorded yet."""
+        with self._lock:
+            return self._conn.execute("INSERT OR IGNORE INTO keys VALUES (?, ?)", (kind, key)).rowcount == 1
+
+    def add_many(self, kind: str, batches):
+        for keys in batches:
+            with self._lock:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT OR IGNORE INTO keys VALUES (?, ?)", [(kind, key) for key in keys])
+                self._conn.execute("COMMIT")
+
+    def has(self, kind: str, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM keys WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        return row is not None
+
+    def count(self, kind: str, without: str = None) -> int:
+        """Number of keys of kind, leaving out those also recorded as without."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM keys k WHERE kind = ? "
+                "AND NOT EXISTS (SELECT 1 FROM keys WHERE kind = ? AND key = k.key)", (kind, without)
+            ).fetchone()[0]
+
+    def difference(self, kind: str, without: str) -> list[str]:
+        with self._lock:
+            return [key for key, in self._conn.execute(
+                "SELECT key FROM keys k WHERE kind = ? "
+                "AND NOT EXISTS (SELECT 1 FROM keys WHERE kind = ? AND key = k.key)", (kind, without)
+            )]
+
+    def add_text(self, chunk_id: str, text: str):
+        with self._lock:
+            self._conn.execute("INSERT INTO texts VALUES (?, ?)", (chunk_id, text))
+
+    def texts(self) -> tuple[list[str], object]:
+        """Chunk ids in insertion order and an iterator over their texts, read from disk."""
+        with self._lock:
+            ids = [chunk_id for chunk_id, in self._conn.execute("SELECT id FROM texts ORDER BY rowid")]
+        return ids, (text for text, in self._conn.execute("SELECT text FROM texts ORDER BY rowid"))
+
+    def close(self):
+        self._conn.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+class StreamingIngest:
+    """Parses, downloads, embeds and inserts the corpus in one streaming pipeline.
+
+    Articles flow from the parser into two branches that run concurrently: chunking,
+    text embedding and text inserts, and image download, image encoding and image
+    inserts. Incremental runs update the collections as batches arrive and delete rows
+    that disappeared from the input at the end. Full runs build new collections under
+    a staging name and swap them in at the end, so the current ones keep serving
+    searches until the run has succeeded.
+    """
+
+    def __init__(
+        self, incremental: bool = False, skip_parse: bool = False, queue_size: int = INGEST_QUEUE_SIZE,
+        milvus_client: MilvusClient = None,
+    ):
+        self.milvus_client = milvus_client or get_milvus_client(uri=MILVUS_ENDPOINT)
+        self.skip_parse = skip_parse
+        self.queue_size = queue_size
+        self.ledger = IngestLedger()
+        self.text_incremental = incremental and can_update_text_collection(self.milvus_client, TEXT_COLLECTION_NAME)
+        self.image_incremental = incremental and can_update_image_collection(self.milvus_client, IMAGE_COLLECTION_NAME)
+        if self.text_incremental:
+            self.ledger.add_many("stored_text", iter_stored_ids(self.milvus_client, TEXT_COLLECTION_NAME))
+        if self.image_incremental:
+            self.ledger.add_many("stored_image", iter_stored_ids(self.milvus_client, IMAGE_COLLECTION_NAME))
+        # incremental runs write into the existing collections, full runs create staging ones on the first batch
+        self.text_collection = (
+            TEXT_COLLECTION_NAME if self.text_incremental else TEXT_COLLECTION_NAME + STAGING_SUFFIX
+        )
+        self.image_collection = (
+            IMAGE_COLLECTION_NAME if self.image_incremental else IMAGE_COLLECTION_NAME + STAGING_SUFFIX
+        )
+        self.text_collection_ready = self.text_incremental
+        self.image_collection_ready = self.image_incremental
+
+        self.rate_limiter = RateLimiter(EMBED_REQUESTS_PER_MINUTE)
+        self.session = create_session(DOWNLOAD_WORKERS)
+        self.manifest = load_manifest(IMAGES_DATA_DIR)
+        self.manifest_lock = threading.Lock()
+        self.downloaded = 0
+        # decoding and resizing images is CPU-bound, so it runs in processes
+        self.resize_pool = ProcessPoolExecutor()
+        # one encoder pass for the whole run, opened by the encoding stage
+        self.image_stream = None
+        self.encoding_image_ids = {}
+        self.full_vectors = get_full_vector_store()
+
+    # source
+
+    def articles(self):
+        if self.skip_parse:
+            yield from iter_article_batches(ARTICLES_FILENAME, PARSE_CHUNK_ROWS)
+            return
+        executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS) if PARSE_WORKERS > 1 else None
+        try:
+            with ArticleWriter(ARTICLES_FILENAME) as writer:
+                for articles in iter_parsed_articles(executor=executor):
+                    yield writer.write(articles)
+                print(f"Saved {writer.rows} articles in: {ARTICLES_FILENAME}")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    # text branch
+
+    def chunk(self, articles) -> list[dict]:
+        new_chunks = []
+        for chunk in chunk_articles(articles).to_dict("records"):
+            if not self.ledger.add("text", chunk["id"]):
+                continue
+            # the lexical index always covers the full current corpus
+            self.ledger.add_text(chunk["id"], chunk["text"])
+            if not self.ledger.has("stored_text", chunk["id"]):
+                new_chunks.append(chunk)
+        return new_chunks
+
+    def embed_text(self, chunks: list[dict]) -> list[dict]:
+        embeddings = emb_text_batch([chunk["text"] for chunk in chunks], self.rate_limiter)
+        return [{**chunk, "vector": embedding} for chunk, embedding in zip(chunks, embeddings)]
+
+    def insert_text(self, chunks: list[dict]) -> list:
+        if not self.text_collection_ready:
+            # drops the staging collection a failed run may have left behind
+            create_text_collection(
+                milvus_client=self.milvus_client,
+                collection_name=self.text_collection,
+                dim=len(chunks[0]["vector"]),
+                drop_old=True
+            )
+            self.full_vectors.drop(self.text_collection)
+            self.text_collection_ready = True
+        stored_embeddings = TEXT_QUANTIZATION.encode([chunk["vector"] for chunk in chunks])
+        data = [
+            {
+                "id": chunk["id"],
+                "vector": vector,
+                "text": chunk["text"],
+                "article_id": chunk["article_id"],
+                "chunk_index": chunk["chunk_index"],
+                "article_url": chunk["article_url"],
+                "image_url": chunk["image"][:IMAGE_URLS_MAX_CAPACITY],
+            }
+            for chunk, vector in zip(chunks, stored_embeddings)
+        ]
+        upsert_rows(self.milvus_client, self.text_collection, data)
+        if TEXT_QUANTIZATION.quantized:
+            self.full_vectors.put_many(self.text_collection, {chunk["id"]: chunk["vector"] for chunk in chunks})
+        return []
+
+    # image branch
+
+    def image_urls_of(self, articles) -> list[tuple]:
+        new_urls = []
+        for images in articles.image:
+            for image_url in images:
+                if self.ledger.add("image_url", image_url):
+                    new_urls.append((image_name(image_url), image_url))
+        return new_urls
+
+    def download(self, image: tuple) -> list[str]:
+        name, image_url = image
+        output_path = os.path.join(IMAGES_DATA_DIR, f"{name}{IMAGE_EXTENSIONS[IMAGE_FORMAT]}")
+        with self.manifest_lock:
+            downloaded = is_downloaded(self.manifest, name, image_url, output_path)
+        if downloaded:
+            telemetry.incr("images_total", outcome="skipped")
+            return [output_path]
+        try:
+            content, etag = fetch_image(self.session, image_url)
+            self.resize_pool.submit(
+                resize_and_save, content, output_path, IMAGE_SIZE, IMAGE_FORMAT, IMAGE_QUALITY
+            ).result()
+        except Exception as e:
+            print(f"Failed to download {image_url}: {e}")
+            telemetry.incr("images_total", outcome="failed")
+            return []
+        with self.manifest_lock:
+            self.manifest[name] = {"url": image_url, "etag": etag}
+            self.downloaded += 1
+            if self.downloaded % MANIFEST_SAVE_EVERY == 0:
+                save_manifest(self.manifest, IMAGES_DATA_DIR)
+        telemetry.incr("images_total", outcome="downloaded")
+        return [output_path]
+
+    def encode_images(self, image_paths: list[str]) -> list[tuple]:
+        if self.image_stream is None:
+            # opened in the stage's thread, which waits for the encoder warmed up by run()
+            self.image_stream = ImageEmbeddingStream(IMAGE_BATCH_SIZE)
+        encoded = []
+        for image_path in image_paths:
+            image_id = image_row_id(image_path)
+            if not self.ledger.add("image", image_id) or self.ledger.has("stored_image", image_id):
+                continue
+            self.encoding_image_ids[image_path] = image_id
+            encoded.extend(self.image_stream.put(image_path))
+        return self.image_rows(encoded)
+
+    def flush_images(self) -> list[tuple]:
+        if self.image_stream is None:
+            return []
+        return self.image_rows(self.image_stream.flush())
+
+    def image_rows(self, encoded: list[tuple]) -> list[tuple]:
+        return [(self.encoding_image_ids.pop(image_path), image_path, embedding) for image_path, embedding in encoded]
+
+    def insert_images(self, images: list[tuple]) -> list:
+        if not self.image_collection_ready:
+            create_image_collection(
+                milvus_client=self.milvus_client,
+                collection_name=self.image_collection,
+                dim=len(images[0][2]),
+                drop_old=True
+            )
+            self.full_vectors.drop(self.image_collection)
+            self.image_collection_ready = True
+        stored_vectors = IMAGE_QUANTIZATION.encode([vector for _, _, vector in images])
+        data = [
+            {"id": image_id, "image_path": image_path, "vector": vector}
+            for (image_id, image_path, _), vector in zip(images, stored_vectors)
+        ]
+        upsert_rows(self.milvus_client, self.image_collection, data)
+        if IMAGE_QUANTIZATION.quantized:
+            self.full_vectors.put_many(
+                self.image_collection, {image_id: vector for image_id, _, vector in images}
+            )
+        return []
+
+    def build(self) -> Pipeline:
+        stage = lambda *args, **kwargs: Stage(*args, queue_size=self.queue_size, **kwargs)
+        articles = Stage("parse", source=self.articles())
+
+        text = articles.then(stage("chunk", self.chunk))
+        text = text.then(stage("embed_text", self.embed_text, workers=EMBED_MAX_WORKERS, batch_size=EMBED_BATCH_SIZE))
+        text.then(stage("insert_text", self.insert_text, batch_size=INGEST_INSERT_BATCH_SIZE))
+
+        images = articles.then(stage("image_urls", self.image_urls_of))
+        images = images.then(stage("download", self.download, workers=DOWNLOAD_WORKERS))
+        images = images.then(
+            stage("encode_images", self.encode_images, batch_size=IMAGE_BATCH_SIZE, finish=self.flush_images)
+        )
+        images.then(stage("insert_images", self.insert_images, batch_size=INGEST_INSERT_BATCH_SIZE))
+        return Pipeline(articles)
+
+    def finish(self):
+        """Saves the lexical index, swaps in the collections of a full run and deletes rows that left the input."""
+        ids, texts = self.ledger.texts()
+        BM25Index.build(ids, texts).save(LEXICAL_INDEX_PATH)
+        print(f"Lexical index saved in: {LEXICAL_INDEX_PATH}")
+
+        for collection_name, target, ready, kind in [
+            (TEXT_COLLECTION_NAME, self.text_collection, self.text_collection_ready, "text"),
+            (IMAGE_COLLECTION_NAME, self.image_collection, self.image_collection_ready, "image"),
+        ]:
+            if not ready:
+                # a full run without rows never created its staging collection, the current one stays
+                print(f"Nothing was inserted, {collection_name} is left as it is")
+                continue
+            if target != collection_name:
+                swap_collection(self.milvus_client, target, collection_name)
+                self.full_vectors.rename(target, collection_name)
+                print(f"{collection_name}: replaced with {self.ledger.count(kind)} rows")
+            else:
+                ids_to_delete = self.ledger.difference(f"stored_{kind}", kind)
+                print(f"{collection_name}: {self.ledger.count(kind, f'stored_{kind}')} rows added, "
+                      f"{delete_rows(self.milvus_client, collection_name, ids_to_delete)} deleted")
+                self.full_vectors.delete_many(collection_name, ids_to_delete)
+            # merges the segments written batch by batch and drops deleted rows
+            self.milvus_client.compact(collection_name)
+            mark_collection_updated(collection_name)
+
+    def run(self) -> dict:
+        os.makedirs(IMAGES_DATA_DIR, exist_ok=True)
+        # the image encoder loads while the first articles are parsed and downloaded
+        warm_image_encoder()
+        try:
+            report = self.build().run()
+            self.finish()
+        finally:
+            self.resize_pool.shutdown(cancel_futures=True)
+            if self.image_stream is not None:
+                self.image_stream.close()
+            # images saved before a failure or an interrupt are not downloaded again
+            with self.manifest_lock:
+                save_manifest(self.manifest, IMAGES_DATA_DIR)
+            self.ledger.close()
+        return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parse the articles, download the images, embed both and store them in Milvus in one streaming run."
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="keep the stored rows that are still current and delete the ones that disappeared"
+    )
+    parser.add_argument("--skip-parse", action="store_true", help=f"read the articles from {ARTICLES_FILENAME}")
+    parser.add_argument("--queue-size", type=int, default=INGEST_QUEUE_SIZE, help="items waiting in front of a stage")
+    args = parser.parse_args()
+
+    with telemetry.span("ingest_streaming", incremental=args.incremental):
+        report = StreamingIngest(args.incremental, args.skip_parse, args.queue_size).run()
+    print(json.dumps({"pipeline": report, "telemetry": telemetry.telemetry.snapshot()}, indent=2))
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from rag_app.index_specs import TEXT_INDEX_SPEC, IMAGE_INDEX_SPEC
+from rag_app.quantization import QuantizationSpec, TEXT_QUANTIZATION, IMAGE_QUANTIZATION, exact_scores
+from rag_app.milvus_utils import get_milvus_client, search_vectors
+from index_tool import load_vectors, exact_top_k
+
+from dotenv import load_dotenv
+
+
+load_dotenv(override=True)
+
+TEXT_COLLECTION_NAME = os.getenv("TEXT_COLLECTION_NAME")
+IMAGE_COLLECTION_NAME = os.getenv("IMAGE_COLLECTION_NAME")
+MILVUS_ENDPOINT = os.getenv("MILVUS_ENDPOINT")
+EVALUATION_DATA_FILE = os.path.join("evaluator", "evaluation_data.csv")
+
+
+def embed_prompts(collection: str, prompts: list[str]) -> np.ndarray:
+    """Query vectors of the prompts, embedded the way the app embeds questions for the collection."""
+    import google.generativeai as genai
+    from rag_app.encoder import emb_text, emb_image_text
+
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    if collection == "text":
+        return np.asarray(emb_text(prompts), dtype=np.float32)
+    return np.asarray([emb_image_text(prompt) for prompt in prompts], dtype=np.float32)
+
+
+def encoded_matrix(spec: QuantizationSpec, vectors) -> np.ndarray:
+    """Vectors as stored for spec: float32 rows (float16 values) or packed sign bits."""
+    encoded = spec.encode(vectors)
+    if spec.storage == "binary":
+        return np.stack([np.frombuffer(row, dtype=np.uint8) for row in encoded])
+    return np.asarray(encoded, dtype=np.float32)
+
+
+def approximate_scores(stored: np.ndarray, query: np.ndarray, spec: QuantizationSpec, metric_type: str) -> np.ndarray:
+    if spec.storage == "binary":
+        # Hamming distance on the unpacked sign bits, negated so that higher is better
+        return -(np.unpackbits(stored, axis=1) != np.unpackbits(query)).sum(axis=1)
+    return exact_scores(stored, query, metric_type)
+
+
+def simulate(matrix: np.ndarray, queries: np.ndarray, expected: np.ndarray, spec: QuantizationSpec,
+             metric_type: str, k: int) -> dict:
+    """Recall@k of a storage configuration against exact search, with and without rescoring."""
+    stored = encoded_matrix(spec, matrix)
+    recalls, rescored_recalls = [], []
+    for query, expected_rows in zip(queries, expected):
+        scores = approximate_scores(stored, encoded_matrix(spec, [query])[0], spec, metric_type)
+        candidates = np.argsort(-scores, kind="stable")[:spec.candidate_limit(k)]
+        rescored = candidates[np.argsort(-exact_scores(matrix[candidates], query, metric_type), kind="stable")]
+        recalls.append(len(set(expected_rows) & set(candidates[:k])) / k)
+        rescored_recalls.append(len(set(expected_rows) & set(rescored[:k])) / k)
+
+    return {
+        "storage": spec.storage,
+        "dim": spec.stored_dim(matrix.shape[1]),
+        "bytes_per_vector": spec.bytes_per_vector(matrix.shape[1]),
+        "collection_mb": spec.bytes_per_vector(matrix.shape[1]) * len(matrix) / 2**20,
+        f"recall@{k}": float(np.mean(recalls)),
+        f"recall@{k}_rescored": float(np.mean(rescored_recalls)),
+        "rescore_factor": spec.rescore_factor,
+    }
+
+
+def measure_live(milvus_client, collection_name: str, index_spec, quantization: QuantizationSpec,
+                 ids: list, queries: np.ndarray, expected: np.ndarray, k: int) -> dict:
+    """Recall@k and latency of the configured collection through the search path the app uses."""
+    recalls, latencies = [], []
+    for query, expected_rows in zip(queries, expected):
+        start = time.perf_counter()
+        hits = search_vectors(milvus_client, collection_name, query.tolist(), [], k, index_spec, quantization)
+        latencies.append(time.perf_counter() - start)
+        expected_ids = {ids[row] for row in expected_rows}
+        recalls.append(len(expected_ids & {hit["id"] for hit in hits}) / k)
+    return {
+        "storage": quantization.storage,
+        "dim": quantization.dim,
+        "rescore_factor": quantization.rescore_factor,
+        f"recall@{k}": float(np.mean(recalls)),
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p95_ms": float(np.percentile(latencies, 95) * 1000),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report the recall impact of quantized and truncated vector storage on the evaluation prompts."
+    )
+    parser.add_argument("--collection", choices=["text", "image"], default="text")
+    parser.add_argument("--prompts-file", default=EVALUATION_DATA_FILE)
+    parser.add_argument("--storage", nargs="+", default=["float32", "float16", "binary"])
+    parser.add_argument("--dims", type=int, nargs="+", default=[None], help="Matryoshka truncation dimensions")
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--live", action="store_true", help="also measure the configured collection in Milvus")
+    args = parser.parse_args()
+
+    collection_name, index_spec, quantization = {
+        "text": (TEXT_COLLECTION_NAME, TEXT_INDEX_SPEC, TEXT_QUANTIZATION),
+        "image": (IMAGE_COLLECTION_NAME, IMAGE_INDEX_SPEC, IMAGE_QUANTIZATION),
+    }[args.collection]
+
+    milvus_client = get_milvus_client(uri=MILVUS_ENDPOINT, token=None)
+    ids, matrix = load_vectors(milvus_client, collection_name, quantization)
+    queries = embed_prompts(args.collection, pd.read_csv(args.prompts_file)["prompt"].tolist())
+    expected = exact_top_k(matrix, queries, args.k, index_spec.metric_type)
+    print(f"{collection_name}: {len(ids)} vectors of dimension {matrix.shape[1]}, {len(queries)} prompts")
+
+    report = {"simulated": []}
+    for storage in args.storage:
+        for dim in args.dims:
+            spec = QuantizationSpec(storage=storage, dim=dim, rescore_factor=args.rescore_factor)
+            report["simulated"].append(simulate(matrix, queries, expected, spec, index_spec.metric_type, args.k))
+    if args.live:
+        report["live"] = measure_live(
+            milvus_client, collection_name, index_spec, quantization, ids, queries, expected, args.k
+        )
+    print(json.dumps(report, indent=2))
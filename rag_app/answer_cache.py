@@ -0,0 +1,91 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from rag_app import telemetry
+
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+
+
+class SemanticAnswerCache:
+    """LLM answers keyed on the question embedding and the set of retrieved articles.
+
+    A cached answer is returned for a new question whose embedding has at least
+    `threshold` cosine similarity with a cached question and that retrieved the same
+    articles. Entries expire after `ttl` seconds, the least recently used ones are
+    evicted beyond `max_entries`, and all entries are dropped when `version_fn`
+    reports a new version of the underlying collection.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        version_fn=None,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_fn = version_fn
+        self._version = version_fn() if version_fn else None
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        if self.version_fn is None:
+            return
+        version = self.version_fn()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+            telemetry.incr("answer_cache_invalidations_total")
+
+    def _drop_expired(self, now: float):
+        for entry_id in [entry_id for entry_id, entry in self._entries.items() if now - entry["created_at"] > self.ttl]:
+            del self._entries[entry_id]
+
+    def lookup(self, query_vector, article_keys) -> str:
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query)
+        article_keys = frozenset(article_keys)
+        with self._lock:
+            self._check_version()
+            self._drop_expired(time.time())
+            candidates = [
+                (entry_id, entry) for entry_id, entry in self._entries.items() if entry["article_keys"] == article_keys
+            ]
+            if candidates:
+                similarities = np.stack([entry["vector"] for _, entry in candidates]) @ query
+                best = int(similarities.argmax())
+                if similarities[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    telemetry.incr("answer_cache_hits_total")
+                    return entry["answer"]
+        telemetry.incr("answer_cache_misses_total")
+        return None
+
+    def store(self, query_vector, article_keys, answer: str):
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector /= np.linalg.norm(vector)
+        with self._lock:
+            self._check_version()
+            self._entries[self._next_id] = {
+                "vector": vector,
+                "article_keys": frozenset(article_keys),
+                "answer": answer,
+                "created_at": time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
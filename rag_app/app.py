@@ -1,13 +1,21 @@
 import os
-import ast
+import sys
+from itertools import chain
 import streamlit as st
 
 st.set_page_config(layout="wide")
 
-import google.generativeai as genai
-from encoder import emb_text, emb_image_text
-from milvus_utils import get_milvus_client, get_search_text_results, get_search_image_results
-from ask_llm import get_llm_answer
+# makes the rag_app package importable when run through `streamlit run rag_app/app.py`
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from rag_app.ask_llm import create_gemini_model
+from rag_app.encoder import warm_image_encoder, image_encoder_loaded
+from rag_app.milvus_utils import get_milvus_client
+from rag_app.query_pipeline import QueryPipeline, runtime_stats
+from rag_app.service_client import QueryServiceClient
+from rag_app.thumbnails import get_thumbnail
+from rag_app import telemetry
 
 from dotenv import load_dotenv
 
@@ -18,18 +26,33 @@ TEXT_COLLECTION_NAME = os.getenv("TEXT_COLLECTION_NAME")
 IMAGE_COLLECTION_NAME = os.getenv("IMAGE_COLLECTION_NAME")
 MILVUS_ENDPOINT = os.getenv("MILVUS_ENDPOINT")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_MODEL = "gemini-2.0-flash-lite-preview-02-05"
+# queries are sent to rag_app/service.py when set, otherwise they run in this process
+QUERY_SERVICE_URL = os.getenv("QUERY_SERVICE_URL")
+
+
+# one pipeline serves every session; QUERY_PIPELINE_WORKERS bounds the queries in flight across all users
+@st.cache_resource
+def get_query_pipeline():
+    if QUERY_SERVICE_URL:
+        return QueryServiceClient(QUERY_SERVICE_URL)
+    return QueryPipeline(
+        get_milvus_client(uri=MILVUS_ENDPOINT),
+        create_gemini_model(GEMINI_API_KEY),
+        TEXT_COLLECTION_NAME,
+        IMAGE_COLLECTION_NAME,
+    )
 
-genai.configure(api_key=GEMINI_API_KEY)
 
+query_pipeline = get_query_pipeline()
 
-SYSTEM_PROMPT = """
-Human: You are an AI assistant. You can find answers to the questions from the articles provided.
-"""
 
+@st.cache_resource
+def start_metrics_server():
+    if telemetry.METRICS_PORT:
+        return telemetry.telemetry.start_metrics_server(telemetry.METRICS_PORT)
 
-milvus_client = get_milvus_client(uri=MILVUS_ENDPOINT)
-gemini_model = genai.GenerativeModel(GEMINI_MODEL, system_instruction=SYSTEM_PROMPT)
+
+start_metrics_server()
 
 st.logo("./brain.png", size='large')
 
@@ -61,7 +84,17 @@ st.markdown(
 )
 
 
-retrieved_lines_with_distances = []
+def render_retrieved_articles(retrieved_lines_with_distances: list):
+    for idx, (distance, article_url, image_url, text) in enumerate(retrieved_lines_with_distances, 1):
+        st.sidebar.markdown("---")
+        st.sidebar.markdown(f"**Result {idx}** (*Distance: {distance:.2f}*)")
+        st.sidebar.markdown(f"*Article: {article_url}*")
+        st.sidebar.markdown(f"*Image: {' | '.join(image_url)}*")
+        article = text[:min(len(text), 500)].replace(f'\n', ' ')
+        st.sidebar.markdown(f"> {article}")
+
+
+st.sidebar.subheader("Retrieved Articles:")
 
 with st.form("my_form"):
     question = st.text_area("Enter your question:")
@@ -69,43 +102,53 @@ with st.form("my_form"):
     submitted = st.form_submit_button("Submit")
 
     if question and submitted:
-        # Text part
-        query_vector = emb_text(question)
-        search_res = get_search_text_results(
-            milvus_client, TEXT_COLLECTION_NAME, query_vector, ["article_url", "image_url", "text"]
-        )
-
-        retrieved_lines_with_distances = [
-            (
-                res["distance"],
-                res["entity"]["article_url"],
-                ast.literal_eval(res["entity"]["image_url"]) if str(res["entity"]["image_url"]) != 'nan' else [],
-                res["entity"]["text"].replace(u'\u2019', u'\'')
-            ) for res in search_res[0]
-        ]
-
-        context = "\n".join([line_with_distance[3] for line_with_distance in retrieved_lines_with_distances])
-        answer = get_llm_answer(gemini_model, context, question)
-
-        # Image Part
-        img_query_vector = emb_image_text(question)
-        images_retrieved = get_search_image_results(milvus_client, IMAGE_COLLECTION_NAME, img_query_vector)
-
-        # Final
-        final_answer = f"Gemini: {answer}\n\nSimilar images:"
+        # Text and image paths run concurrently, joined only when rendering
+        query_run = query_pipeline.submit(question, stream=True)
 
         st.chat_message("user").write(question)
-        st.chat_message("assistant").write(final_answer)
-        
-        st.image(images_retrieved, caption=images_retrieved)
 
+        # Retrieved articles are shown before generation starts
+        render_retrieved_articles(query_run.articles)
 
-st.sidebar.subheader("Retrieved Articles:")
-for idx, (distance, article_url, image_url, text) in enumerate(retrieved_lines_with_distances, 1):
-    st.sidebar.markdown("---")
-    st.sidebar.markdown(f"**Result {idx}** (*Distance: {distance:.2f}*)")
-    st.sidebar.markdown(f"*Article: {article_url}*")
-    st.sidebar.markdown(f"*Image: {' | '.join(image_url)}*")
-    article = text[:min(len(text), 500)].replace(f'\n', ' ')
-    st.sidebar.markdown(f"> {article}")
+        with st.chat_message("assistant"):
+            st.write_stream(chain(["Gemini: "], query_run.stream_answer()))
+            st.write("Similar images:")
 
+        # small WebP renders for the page, the stored images stay at model resolution
+        images_retrieved = query_run.images
+        render_thumbnail = query_pipeline.thumbnail if QUERY_SERVICE_URL else get_thumbnail
+        st.image([render_thumbnail(image_path) for image_path in images_retrieved], caption=images_retrieved)
+
+        query_run.wait()
+        st.sidebar.markdown("---")
+        st.sidebar.caption(
+            " | ".join(f"{stage}: {timing['duration']:.2f}s" for stage, timing in query_run.timings.items())
+        )
+        st.sidebar.caption(f"Critical path: {query_run.critical_path}")
+
+# The image encoder is loaded after the page has been served
+if not QUERY_SERVICE_URL and not image_encoder_loaded():
+    warm_image_encoder()
+
+stats = query_pipeline.stats() if QUERY_SERVICE_URL else runtime_stats()
+
+with st.sidebar.expander("Startup"):
+    st.caption(" | ".join(f"{phase}: {duration:.2f}s" for phase, duration in stats["startup"].items()))
+
+with st.sidebar.expander("Debug"):
+    metrics = stats["telemetry"]
+    cache_stats = stats["embedding_cache"]
+    st.caption(
+        f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} entries"
+    )
+    if metrics["timings"]:
+        st.dataframe(
+            [{"metric": name, **{key: round(value, 1) for key, value in timing.items()}}
+             for name, timing in metrics["timings"].items()],
+            hide_index=True,
+        )
+    if metrics["counters"]:
+        st.dataframe(
+            [{"counter": name, "value": value} for name, value in metrics["counters"].items()],
+            hide_index=True,
+        )
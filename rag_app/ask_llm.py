@@ -1,14 +1,30 @@
 import google.generativeai as genai
 from google.generativeai.types import GenerationConfig
 
+from rag_app import telemetry
+
+
+GEMINI_MODEL = "gemini-2.0-flash-lite-preview-02-05"
+
+SYSTEM_PROMPT = """
+Human: You are an AI assistant. You can find answers to the questions from the articles provided.
+"""
+
+# finish reasons of answers Gemini completed; others are cut short and end with a notice
+COMPLETE_FINISH_REASONS = ("STOP", "MAX_TOKENS")
 
 config = GenerationConfig(
     temperature=0.2, top_k=32
 )
 
 
-def get_llm_answer(client: genai.GenerativeModel, context: str, question: str):
-    USER_PROMPT = f"""Use the following pieces of information enclosed in <context> tags \
+def create_gemini_model(api_key: str) -> genai.GenerativeModel:
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(GEMINI_MODEL, system_instruction=SYSTEM_PROMPT)
+
+
+def build_user_prompt(context: str, question: str) -> str:
+    return f"""Use the following pieces of information enclosed in <context> tags \
 to provide an answer to the question enclosed in <question> tags.
 Provide an answer which is factually correct and based in the context.
 <context>
@@ -19,5 +35,45 @@ Provide an answer which is factually correct and based in the context.
 </question>`
 """
 
-    response = client.generate_content(USER_PROMPT, generation_config=config)
-    return response.text
\ No newline at end of file
+
+def record_token_usage(response, span: dict):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    span["prompt_tokens"] = usage.prompt_token_count
+    span["answer_tokens"] = usage.candidates_token_count
+    telemetry.incr("llm_prompt_tokens_total", usage.prompt_token_count)
+    telemetry.incr("llm_answer_tokens_total", usage.candidates_token_count)
+
+
+def get_llm_answer(client: genai.GenerativeModel, context: str, question: str):
+    USER_PROMPT = build_user_prompt(context, question)
+
+    with telemetry.span("llm_generate") as span:
+        response = client.generate_content(USER_PROMPT, generation_config=config)
+        record_token_usage(response, span)
+    return response.text
+
+
+def stream_llm_answer(client: genai.GenerativeModel, context: str, question: str, outcome: dict = None):
+    """Yields the answer as Gemini streams it; the finish reason is stored in outcome once the stream ends."""
+    USER_PROMPT = build_user_prompt(context, question)
+
+    with telemetry.span("llm_generate_stream") as span:
+        response = client.generate_content(USER_PROMPT, generation_config=config, stream=True)
+        finish_reason = None
+        for chunk in response:
+            # chunk.text raises ValueError on chunks that were blocked or carry no parts
+            if chunk.candidates and chunk.candidates[0].finish_reason:
+                finish_reason = chunk.candidates[0].finish_reason
+            if chunk.parts and chunk.text:
+                yield chunk.text
+        record_token_usage(response, span)
+        finish_reason = getattr(finish_reason, "name", finish_reason)
+        if finish_reason is None and response.prompt_feedback.block_reason:
+            finish_reason = response.prompt_feedback.block_reason.name
+        span["finish_reason"] = finish_reason
+        if outcome is not None:
+            outcome["finish_reason"] = finish_reason
+        if finish_reason is not None and finish_reason not in COMPLETE_FINISH_REASONS:
+            yield f"\n\n[Gemini stopped the answer, finish_reason: {finish_reason}]"
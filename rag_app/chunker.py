@@ -0,0 +1,100 @@
+import os
+import re
+import hashlib
+import pandas as pd
+
+
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 256))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 48))
+
+# words and single punctuation marks, a close approximation of subword token counts for English prose
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def chunk_id(parent_id: str, chunk_index: int, text: str) -> str:
+    return hashlib.sha256(f"{parent_id}\x00{chunk_index}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[str]:
+    """Splits text into windows of at most chunk_size tokens, consecutive windows sharing overlap tokens.
+
+    Chunks are slices of the original text, so whitespace and punctuation are kept as they are.
+    """
+    if overlap >= chunk_size:
+        raise ValueError(f"Chunk overlap ({overlap}) must be smaller than the chunk size ({chunk_size}).")
+    spans = [match.span() for match in TOKEN_PATTERN.finditer(text)]
+    if len(spans) <= chunk_size:
+        return [text.strip()] if spans else []
+
+    chunks = []
+    step = chunk_size - overlap
+    for start in range(0, len(spans), step):
+        window = spans[start:start + chunk_size]
+        chunks.append(text[window[0][0]:window[-1][1]])
+        if start + chunk_size >= len(spans):
+            break
+    return chunks
+
+
+def chunk_articles(
+    articles_df: pd.DataFrame, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP
+) -> pd.DataFrame:
+    """One row per chunk with the article metadata, article_id and chunk_index of its article.
+
+    Chunk ids derive from the article content hash, so they change whenever the
+    article text, URL or images change.
+    """
+    rows = []
+    for article in articles_df.itertuples():
+        for chunk_index, chunk in enumerate(chunk_text(article.text, chunk_size, overlap)):
+            rows.append({
+                "id": chunk_id(article.content_hash, chunk_index, chunk),
+                "article_id": article.article_id,
+                "chunk_index": chunk_index,
+                "text": chunk,
+                "article_url": article.article_url,
+                "image": article.image,
+            })
+    return pd.DataFrame(rows, columns=["id", "article_id", "chunk_index", "text", "article_url", "image"])
+
+
+def merge_chunks(chunks: dict, overlap: int = CHUNK_OVERLAP) -> str:
+    """Joins chunks keyed by chunk_index in document order.
+
+    Consecutive chunks share their first overlap tokens with the previous chunk, so
+    those tokens are dropped once; separate passages are joined with a newline.
+    """
+    passages = []
+    previous_index = None
+    for chunk_index, text in sorted(chunks.items()):
+        if previous_index is not None and chunk_index == previous_index + 1:
+            tokens = list(TOKEN_PATTERN.finditer(text))
+            if len(tokens) > overlap:
+                passages[-1] += " " + text[tokens[overlap].start():]
+        else:
+            passages.append(text)
+        previous_index = chunk_index
+    return "\n".join(passages)
+
+
+def collapse_chunk_hits(hits: list[dict], max_articles: int, overlap: int = CHUNK_OVERLAP) -> list[dict]:
+    """Groups chunk search hits by article, best article first.
+
+    Each article keeps the distance of its best chunk and the text of its matched
+    chunks in document order, with the overlap of adjacent chunks merged.
+    """
+    articles = {}
+    for hit in hits:
+        entity = hit["entity"]
+        article = articles.setdefault(entity["article_id"], {"distance": hit["distance"], "entity": dict(entity), "chunks": {}})
+        article["chunks"][entity["chunk_index"]] = entity["text"]
+
+    collapsed = []
+    for article in list(articles.values())[:max_articles]:
+        article["entity"]["text"] = merge_chunks(article["chunks"], overlap)
+        collapsed.append({"distance": article["distance"], "entity": article["entity"]})
+    return collapsed
@@ -0,0 +1,124 @@
+import ast
+import hashlib
+from collections import Counter
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# the articles dataset handed from data_parse.py to img_download.py and data_insert.py
+ARTICLES_SCHEMA = pa.schema([
+    ("article_id", pa.string()),
+    ("content_hash", pa.string()),
+    ("article_url", pa.string()),
+    ("text", pa.string()),
+    ("image", pa.list_(pa.string())),
+])
+DATASET_COLUMNS = ARTICLES_SCHEMA.names
+
+# file extensions of the images saved by img_download.py, per IMAGE_FORMAT
+IMAGE_EXTENSIONS = {"png": ".png", "webp": ".webp", "jpeg": ".jpg"}
+
+
+def article_id(article_url: str, ordinal: int) -> str:
+    """Stable id of the ordinal-th article under article_url; a weekly issue URL holds several articles."""
+    return hashlib.sha256(f"{article_url}\x00{ordinal}".encode("utf-8")).hexdigest()
+
+
+def content_hash(article_url: str, text: str, images: list[str]) -> str:
+    return hashlib.sha256("\x00".join([article_url, text, *images]).encode("utf-8")).hexdigest()
+
+
+def parse_image_list(value) -> list[str]:
+    """Image URLs of a cell: a list, the stringified list of the CSV format, or an empty cell."""
+    if isinstance(value, str):
+        return [str(url) for url in ast.literal_eval(value)] if value.strip().startswith("[") else []
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return []
+    return [str(url) for url in value]
+
+
+def with_article_ids(df: pd.DataFrame, seen_urls: Counter = None) -> pd.DataFrame:
+    """Adds article_id and content_hash to rows of article_url, text and image.
+
+    seen_urls counts the articles per URL over all previous calls, so a dataset
+    written in chunks gets the same ids as one written at once.
+    """
+    seen_urls = Counter() if seen_urls is None else seen_urls
+    df = df.assign(image=df["image"].map(parse_image_list))
+    ids = []
+    for url in df.article_url:
+        ids.append(article_id(url, seen_urls[url]))
+        seen_urls[url] += 1
+    df["article_id"] = ids
+    df["content_hash"] = [
+        content_hash(url, text, images) for url, text, images in zip(df.article_url, df.text, df.image)
+    ]
+    return df[DATASET_COLUMNS]
+
+
+def read_articles(path: str) -> pd.DataFrame:
+    """Loads the articles dataset with a list-typed image column.
+
+    Parquet files are read as they are; CSV files of the previous format are
+    converted on the fly.
+    """
+    if path.endswith(".parquet"):
+        df = pq.read_table(path, schema=ARTICLES_SCHEMA).to_pandas()
+        df["image"] = df["image"].map(parse_image_list)
+        return df
+    df = pd.read_csv(path)
+    if "article_id" not in df.columns:
+        return with_article_ids(df)
+    df["image"] = df["image"].map(parse_image_list)
+    return df[DATASET_COLUMNS]
+
+
+def iter_article_batches(path: str, batch_rows: int = 1000):
+    """Yields the articles dataset as DataFrames of at most batch_rows rows, like read_articles."""
+    if path.endswith(".parquet"):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+            df = pa.Table.from_batches([batch]).cast(ARTICLES_SCHEMA).to_pandas()
+            df["image"] = df["image"].map(parse_image_list)
+            yield df
+        return
+    seen_urls = Counter()
+    for df in pd.read_csv(path, chunksize=batch_rows):
+        if "article_id" not in df.columns:
+            yield with_article_ids(df, seen_urls)
+            continue
+        df["image"] = df["image"].map(parse_image_list)
+        yield df[DATASET_COLUMNS]
+
+
+class ArticleWriter:
+    """Appends article chunks to a Parquet file, or to a CSV file when the name ends with .csv."""
+
+    def __init__(self, output_filename: str):
+        self.output_filename = output_filename
+        self.csv = output_filename.endswith(".csv")
+        self.rows = 0
+        self._seen_urls = Counter()
+        self._parquet_writer = None
+
+    def write(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Appends the articles and returns them with their article_id and content_hash."""
+        df = with_article_ids(df, self._seen_urls)
+        if self.csv:
+            df.to_csv(self.output_filename, mode='a' if self.rows else 'w', header=not self.rows, index=False)
+        else:
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.output_filename, ARTICLES_SCHEMA)
+            self._parquet_writer.write_table(pa.Table.from_pandas(df, schema=ARTICLES_SCHEMA, preserve_index=False))
+        self.rows += len(df)
+        return df
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
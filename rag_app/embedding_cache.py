@@ -0,0 +1,123 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+from rag_app import telemetry
+
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+# hits refresh their LRU timestamp only when it is older than this, so most reads do not write
+EMBEDDING_CACHE_TOUCH_SECONDS = float(os.getenv("EMBEDDING_CACHE_TOUCH_SECONDS", 3600))
+# the cache is trimmed back to max_entries once every this many inserted rows
+EMBEDDING_CACHE_EVICT_EVERY = int(os.getenv("EMBEDDING_CACHE_EVICT_EVERY", 1000))
+
+
+def content_key(model: str, content) -> str:
+    """Cache key for content embedded by model; the model name carries its version."""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(model.encode("utf-8") + b"\x00" + content).hexdigest()
+
+
+def _to_blob(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _from_blob(blob: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """Size-bounded LRU embedding cache stored in SQLite, safe to share between processes."""
+
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        touch_seconds: float = EMBEDDING_CACHE_TOUCH_SECONDS,
+        evict_every: int = EMBEDDING_CACHE_EVICT_EVERY,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_seconds = touch_seconds
+        self.evict_every = evict_every
+        self._inserted_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list[str]) -> dict:
+        found = {}
+        stale = []
+        unique_keys = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            # stay below SQLite's limit on bound parameters
+            for i in range(0, len(unique_keys), 500):
+                chunk = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector, last_access FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, vector, last_access in rows:
+                    found[key] = _from_blob(vector)
+                    if now - last_access > self.touch_seconds:
+                        stale.append(key)
+            if stale:
+                self._conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in stale])
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+        telemetry.incr("embedding_cache_hits_total", len(found))
+        telemetry.incr("embedding_cache_misses_total", len(unique_keys) - len(found))
+        return found
+
+    def put(self, key: str, model: str, vector):
+        self.put_many({key: vector}, model)
+
+    def put_many(self, vectors: dict, model: str):
+        if not vectors:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?)",
+                [(key, model, _to_blob(vector), now) for key, vector in vectors.items()],
+            )
+            self._inserted_since_evict += len(vectors)
+            if self._inserted_since_evict >= self.evict_every:
+                self._evict()
+                self._inserted_since_evict = 0
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count}
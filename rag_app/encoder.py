@@ -1,85 +1,347 @@
-import streamlit as st
+import time
+
+# import-time phases are recorded in STARTUP_TIMINGS, see startup_report()
+_module_start = time.perf_counter()
+
 import google.generativeai as genai
-import torch
-import sys
 import os
+import json
+import random
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
 
-# necessary for the FlagEmbedding import to work
-SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
-sys.path.append(os.path.dirname(SCRIPT_DIR))
-
-from FlagEmbedding.research.visual_bge.modeling import Visualized_BGE
+from rag_app.embedding_cache import EmbeddingCache, content_key
+from rag_app import telemetry
 
+STARTUP_TIMINGS = {"import_encoder": time.perf_counter() - _module_start}
 
-class ImageEncoder:
-    def __init__(self, model_name: str, model_path: str):
-        self.model = Visualized_BGE(model_name_bge=model_name, model_weight=model_path)
-        self.model.eval()
 
-    def encode_query(self, image_path: str, text: str) -> list[float]:
-        with torch.no_grad():
-            query_emb = self.model.encode(image=image_path, text=text)
-        return query_emb.tolist()[0]
+IMAGE_BATCH_SIZE = int(os.getenv("IMAGE_BATCH_SIZE", 16))
+IMAGE_PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", os.cpu_count() or 1))
+IMAGE_ENCODER_THREADS = int(os.getenv("IMAGE_ENCODER_THREADS", 0))
 
-    def encode_image(self, image_path: str) -> list[float]:
-        with torch.no_grad():
-            query_emb = self.model.encode(image=image_path)
-        return query_emb.tolist()[0]
-    
-    def encode_text(self, text: str) -> list[float]:
-        with torch.no_grad():
-            query_emb = self.model.encode(text=text)
-        return query_emb.tolist()[0]
 
+TEXT_EMBEDDING_MODEL = "models/text-embedding-004"
+# Gemini accepts at most 100 texts per batch embedding request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 100))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", 4))
+EMBED_REQUESTS_PER_MINUTE = int(os.getenv("EMBED_REQUESTS_PER_MINUTE", 1500))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 5))
 
 model_name = "BAAI/bge-base-en-v1.5"
 model_path = "./Visualized_base_en_v1.5.pth"
-encoder = ImageEncoder(model_name, model_path)
+# the checkpoint file name carries the weights version
+IMAGE_EMBEDDING_MODEL = f"{model_name}:{os.path.basename(model_path)}"
+
+_image_encoder = None
+_image_encoder_lock = threading.Lock()
+
+
+@contextmanager
+def _startup_phase(name: str):
+    start = time.perf_counter()
+    yield
+    STARTUP_TIMINGS[name] = time.perf_counter() - start
+
+
+def get_image_encoder():
+    """Loads torch and the Visualized-BGE weights on first use, then returns the shared encoder."""
+    global _image_encoder
+    if _image_encoder is None:
+        with _image_encoder_lock:
+            if _image_encoder is None:
+                with _startup_phase("import_torch"):
+                    import torch  # noqa: F401
+                with _startup_phase("import_visual_bge"):
+                    from rag_app.image_encoder import ImageEncoder
+                with _startup_phase("load_image_encoder"):
+                    _image_encoder = ImageEncoder(model_name, model_path, num_threads=IMAGE_ENCODER_THREADS)
+    return _image_encoder
+
+
+def warm_image_encoder() -> threading.Thread:
+    """Loads the image encoder in a background thread so the first image query does not pay for it."""
+    thread = threading.Thread(target=get_image_encoder, name="warm-image-encoder", daemon=True)
+    thread.start()
+    return thread
+
+
+def image_encoder_loaded() -> bool:
+    return _image_encoder is not None
+
+
+def startup_report() -> dict:
+    return dict(STARTUP_TIMINGS)
+
+
+# Embeddings cache shared by the app and the ingest scripts
+@lru_cache(maxsize=None)
+def get_embedding_cache() -> EmbeddingCache:
+    return EmbeddingCache()
+
+
+def emb_text(text, model: str = TEXT_EMBEDDING_MODEL):
+    cache = get_embedding_cache()
+    texts = [text] if type(text) == str else list(text)
+    keys = [content_key(model, el) for el in texts]
+
+    cached = cache.get_many(keys)
+    missing = {key: el for key, el in zip(keys, texts) if key not in cached}
+    if missing:
+        with telemetry.span("embed_text", texts=len(missing)):
+            embedding = genai.embed_content(
+                model=model, content=list(missing.values())
+            )["embedding"]
+        new_embeddings = dict(zip(missing, embedding))
+        cache.put_many(new_embeddings, model)
+        cached.update(new_embeddings)
+
+    embeddings = [cached[key] for key in keys]
+    return embeddings[0] if type(text) == str else embeddings
+
+
+class RateLimiter:
+    """Spaces out calls so that no more than requests_per_minute start in any minute."""
+
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60.0 / requests_per_minute
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
 
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
 
-# Cache for text embeddings
-@st.cache_resource
-def get_text_embedding_cache():
-    return {}
 
+def load_embedding_checkpoint(checkpoint_path: str) -> dict:
+    embeddings = {}
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by an interrupted run
+                    continue
+                embeddings[record["key"]] = record["embedding"]
+    return embeddings
 
-# Cache for image embeddings
-@st.cache_resource
-def get_image_embedding_cache():
-    return {}
 
+def _embed_batch(texts: list[str], model: str, rate_limiter: RateLimiter, max_retries: int) -> list:
+    for attempt in range(max_retries + 1):
+        rate_limiter.acquire()
+        try:
+            with telemetry.span("embed_text_batch", texts=len(texts), attempt=attempt):
+                return genai.embed_content(model=model, content=texts)["embedding"]
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            telemetry.incr("embed_retries_total")
+            delay = 2 ** attempt + random.uniform(0, 1)
+            print(f"Embedding batch failed ({e}). Retrying in {delay:.1f}s.")
+            time.sleep(delay)
 
-text_embedding_cache = get_text_embedding_cache()
-image_embedding_cache = get_image_embedding_cache()
 
-def emb_text(text, model: str = "models/text-embedding-004"):
-    if type(text) == str and text in text_embedding_cache:
-        return text_embedding_cache[text]
-    embedding = genai.embed_content(
-        model=model, content=text
-    )["embedding"]
-    if type(text) != str:
-        for index, el in enumerate(embedding):
-            text_embedding_cache[text[index]] = el
-    else:
-        text_embedding_cache[text] = embedding
-    return embedding
-    
+def emb_text_batched(
+    texts: list[str],
+    model: str = TEXT_EMBEDDING_MODEL,
+    batch_size: int = EMBED_BATCH_SIZE,
+    max_workers: int = EMBED_MAX_WORKERS,
+    requests_per_minute: int = EMBED_REQUESTS_PER_MINUTE,
+    max_retries: int = EMBED_MAX_RETRIES,
+    checkpoint_path: str = None,
+) -> list:
+    """Embeds texts in concurrent, rate-limited batches.
+
+    Finished vectors are appended to checkpoint_path, so a rerun after a failure
+    only requests the embeddings that are still missing.
+    """
+    keys = [content_key(model, text) for text in texts]
+    embeddings = load_embedding_checkpoint(checkpoint_path)
+    cache = get_embedding_cache()
+    embeddings.update(cache.get_many([key for key in keys if key not in embeddings]))
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in embeddings:
+            missing[key] = text
+    missing_keys = list(missing)
+    batches = [missing_keys[i:i + batch_size] for i in range(0, len(missing_keys), batch_size)]
+    if len(embeddings):
+        print(f"Reusing {len(texts) - len(missing_keys)} of {len(texts)} embeddings from checkpoint and cache")
+
+    rate_limiter = RateLimiter(requests_per_minute)
+    checkpoint_file = open(checkpoint_path, "a") if checkpoint_path else None
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            executor.submit(_embed_batch, [missing[key] for key in batch], model, rate_limiter, max_retries): batch
+            for batch in batches
+        }
+        with tqdm(total=len(missing_keys), desc="Generating text embeddings: ") as progress:
+            for future in as_completed(futures):
+                batch = futures[future]
+                batch_embeddings = dict(zip(batch, future.result()))
+                cache.put_many(batch_embeddings, model)
+                for key, embedding in batch_embeddings.items():
+                    embeddings[key] = embedding
+                    if checkpoint_file:
+                        checkpoint_file.write(json.dumps({"key": key, "embedding": embedding}) + "\n")
+                if checkpoint_file:
+                    checkpoint_file.flush()
+                progress.update(len(batch))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if checkpoint_file:
+            checkpoint_file.close()
+
+    return [embeddings[key] for key in keys]
+
+
+def emb_text_batch(
+    texts: list[str],
+    rate_limiter: RateLimiter,
+    model: str = TEXT_EMBEDDING_MODEL,
+    max_retries: int = EMBED_MAX_RETRIES,
+) -> list:
+    """Embeds at most one request's worth of texts, only requesting the ones missing from the embedding cache.
+
+    Callers running several batches at once share rate_limiter.
+    """
+    cache = get_embedding_cache()
+    keys = [content_key(model, text) for text in texts]
+    embeddings = cache.get_many(keys)
+    missing = {key: text for key, text in zip(keys, texts) if key not in embeddings}
+    if missing:
+        new_embeddings = dict(zip(missing, _embed_batch(list(missing.values()), model, rate_limiter, max_retries)))
+        cache.put_many(new_embeddings, model)
+        embeddings.update(new_embeddings)
+    return [embeddings[key] for key in keys]
+
 
 def emb_image(image_path: str):
-    if image_path in image_embedding_cache:
-        return image_embedding_cache[image_path]
+    cache = get_embedding_cache()
     try:
-        embedding = encoder.encode_image(image_path)
-        image_embedding_cache[image_path] = embedding
+        with open(image_path, "rb") as file:
+            key = content_key(IMAGE_EMBEDDING_MODEL, file.read())
+        embedding = cache.get(key)
+        if embedding is None:
+            with telemetry.span("encode_image"):
+                embedding = get_image_encoder().encode_image(image_path)
+            cache.put(key, IMAGE_EMBEDDING_MODEL, embedding)
         return embedding
     except Exception as e:
         print(f"Failed to generate embedding for {image_path}. Skipped.")
 
 
+def emb_images(image_paths: list[str], batch_size: int = IMAGE_BATCH_SIZE) -> dict:
+    """Batch variant of emb_image; images that fail to encode are left out of the result."""
+    cache = get_embedding_cache()
+    keys = {}
+    for image_path in image_paths:
+        try:
+            with open(image_path, "rb") as file:
+                keys[image_path] = content_key(IMAGE_EMBEDDING_MODEL, file.read())
+        except OSError:
+            print(f"Failed to read {image_path}. Skipped.")
+
+    cached = cache.get_many(list(keys.values()))
+    embeddings = {path: cached[key] for path, key in keys.items() if key in cached}
+    missing = [path for path in keys if path not in embeddings]
+
+    new_embeddings = {}
+    for image_path, embedding in tqdm(
+        get_image_encoder().encode_images(
+            missing, batch_size=batch_size, num_workers=IMAGE_PREPROCESS_WORKERS
+        ), total=len(missing), desc="Generating image embeddings: "
+    ):
+        if embedding is None:
+            telemetry.incr("encode_image_failures_total")
+        else:
+            embeddings[image_path] = embedding
+            new_embeddings[keys[image_path]] = embedding
+            if len(new_embeddings) >= batch_size:
+                cache.put_many(new_embeddings, IMAGE_EMBEDDING_MODEL)
+                new_embeddings = {}
+    cache.put_many(new_embeddings, IMAGE_EMBEDDING_MODEL)
+
+    return {path: embeddings[path] for path in image_paths if path in embeddings}
+
+
+class ImageEmbeddingStream:
+    """emb_images for images that arrive one at a time, with one encoder pass and progress bar for all of them.
+
+    put() returns the (image_path, embedding) pairs that are ready: the image itself when
+    its embedding is cached, otherwise the batches the encoder finished meanwhile.
+    flush() returns the rest. Images that fail to encode are left out.
+    """
+
+    def __init__(self, batch_size: int = IMAGE_BATCH_SIZE):
+        # imported here, the module loads torch
+        from rag_app.image_encoder import ImageEncodeStream
+
+        self.batch_size = batch_size
+        self.cache = get_embedding_cache()
+        self.encoder = ImageEncodeStream(get_image_encoder(), batch_size, IMAGE_PREPROCESS_WORKERS)
+        self.progress = tqdm(desc="Generating image embeddings: ", unit="image")
+        self._keys = {}
+        self._new_embeddings = {}
+
+    def put(self, image_path: str) -> list[tuple]:
+        try:
+            with open(image_path, "rb") as file:
+                key = content_key(IMAGE_EMBEDDING_MODEL, file.read())
+        except OSError:
+            print(f"Failed to read {image_path}. Skipped.")
+            return []
+        embedding = self.cache.get(key)
+        if embedding is not None:
+            return [(image_path, embedding)]
+        self._keys[image_path] = key
+        return self._collect(self.encoder.put(image_path))
+
+    def flush(self) -> list[tuple]:
+        encoded = self._collect(self.encoder.flush())
+        self.cache.put_many(self._new_embeddings, IMAGE_EMBEDDING_MODEL)
+        self._new_embeddings = {}
+        return encoded
+
+    def _collect(self, pairs: list[tuple]) -> list[tuple]:
+        encoded = []
+        for image_path, embedding in pairs:
+            key = self._keys.pop(image_path)
+            if embedding is None:
+                telemetry.incr("encode_image_failures_total")
+                continue
+            encoded.append((image_path, embedding))
+            self._new_embeddings[key] = embedding
+        if len(self._new_embeddings) >= self.batch_size:
+            self.cache.put_many(self._new_embeddings, IMAGE_EMBEDDING_MODEL)
+            self._new_embeddings = {}
+        self.progress.update(len(pairs))
+        return encoded
+
+    def close(self):
+        self.encoder.close()
+        self.progress.close()
+
+
 def emb_image_text(text: str):
+    cache = get_embedding_cache()
+    key = content_key(IMAGE_EMBEDDING_MODEL, f"text:{text}")
     try:
-        embedding = encoder.encode_text(text)
+        embedding = cache.get(key)
+        if embedding is None:
+            with telemetry.span("encode_image_text"):
+                embedding = get_image_encoder().encode_text(text)
+            cache.put(key, IMAGE_EMBEDDING_MODEL, embedding)
         return embedding
     except Exception as e:
         print(f"Failed to generate embedding for {text}. Skipped.")
@@ -0,0 +1,115 @@
+import os
+import sys
+import torch
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+# necessary for the FlagEmbedding import to work
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from FlagEmbedding.research.visual_bge.modeling import Visualized_BGE
+from rag_app import telemetry
+
+
+class ImageEncoder:
+    def __init__(self, model_name: str, model_path: str, num_threads: int = 0):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model = Visualized_BGE(model_name_bge=model_name, model_weight=model_path)
+        self.model.eval()
+
+    def encode_query(self, image_path: str, text: str) -> list[float]:
+        with torch.no_grad():
+            query_emb = self.model.encode(image=image_path, text=text)
+        return query_emb.tolist()[0]
+
+    def encode_image(self, image_path: str) -> list[float]:
+        with torch.no_grad():
+            query_emb = self.model.encode(image=image_path)
+        return query_emb.tolist()[0]
+    
+    def encode_text(self, text: str) -> list[float]:
+        with torch.no_grad():
+            query_emb = self.model.encode(text=text)
+        return query_emb.tolist()[0]
+
+    def preprocess_image(self, image_path: str) -> torch.Tensor:
+        # same decoding and transforms as Visualized_BGE.encode
+        return self.model.preprocess_val(Image.open(image_path))
+
+    def _encode_batch(self, image_paths: list[str], futures: list):
+        tensors, encoded_paths = [], []
+        for image_path, future in zip(image_paths, futures):
+            try:
+                tensors.append(future.result())
+                encoded_paths.append(image_path)
+            except Exception as e:
+                print(f"Failed to preprocess {image_path}: {e}. Skipped.")
+                yield image_path, None
+        if tensors:
+            with telemetry.span("encode_image_batch", images=len(tensors)), torch.no_grad():
+                embeddings = self.model.encode_image(torch.stack(tensors).to(self.model.device))
+            yield from zip(encoded_paths, embeddings.tolist())
+
+    def encode_images(
+        self,
+        image_paths,
+        batch_size: int = 16,
+        num_workers: int = None,
+        prefetch_batches: int = 2,
+    ):
+        """Yields (image_path, embedding) pairs, encoding images in stacked batches.
+
+        Decoding and preprocessing run in a worker pool that stays up to
+        prefetch_batches ahead of the model. The embedding is None for images
+        that could not be decoded.
+        """
+        stream = ImageEncodeStream(self, batch_size, num_workers, prefetch_batches)
+        try:
+            for image_path in image_paths:
+                yield from stream.put(image_path)
+            yield from stream.flush()
+        finally:
+            stream.close()
+
+
+class ImageEncodeStream:
+    """One encoding pass that is fed one image at a time, e.g. by a streaming ingest stage.
+
+    put() starts preprocessing the image and returns the (image_path, embedding) pairs
+    of the batches the model finished meanwhile; flush() encodes what is left.
+    """
+
+    def __init__(self, encoder: ImageEncoder, batch_size: int = 16, num_workers: int = None, prefetch_batches: int = 2):
+        self.encoder = encoder
+        self.batch_size = batch_size
+        self.prefetch_batches = prefetch_batches
+        self._pool = ThreadPoolExecutor(max_workers=num_workers)
+        self._batch = ([], [])
+        self._pending = deque()
+
+    def put(self, image_path: str) -> list[tuple]:
+        paths, futures = self._batch
+        paths.append(image_path)
+        futures.append(self._pool.submit(self.encoder.preprocess_image, image_path))
+        if len(paths) == self.batch_size:
+            self._pending.append(self._batch)
+            self._batch = ([], [])
+        encoded = []
+        while len(self._pending) > self.prefetch_batches:
+            encoded.extend(self.encoder._encode_batch(*self._pending.popleft()))
+        return encoded
+
+    def flush(self) -> list[tuple]:
+        if self._batch[0]:
+            self._pending.append(self._batch)
+            self._batch = ([], [])
+        encoded = []
+        while self._pending:
+            encoded.extend(self.encoder._encode_batch(*self._pending.popleft()))
+        return encoded
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
@@ -0,0 +1,74 @@
+import os
+import json
+from dataclasses import dataclass, field
+
+
+# build and search parameters used when only the index type is configured
+INDEX_PRESETS = {
+    "AUTOINDEX": ({}, {}),
+    "FLAT": ({}, {}),
+    "HNSW": ({"M": 16, "efConstruction": 200}, {"ef": 64}),
+    "IVF_FLAT": ({"nlist": 1024}, {"nprobe": 16}),
+    "IVF_PQ": ({"nlist": 1024, "m": 16, "nbits": 8}, {"nprobe": 16}),
+    "DISKANN": ({}, {"search_list": 100}),
+    # binary vectors, see rag_app/quantization.py
+    "BIN_FLAT": ({}, {}),
+    "BIN_IVF_FLAT": ({"nlist": 1024}, {"nprobe": 16}),
+}
+
+CONSISTENCY_LEVELS = ["Strong", "Bounded", "Session", "Eventually"]
+
+
+@dataclass
+class IndexSpec:
+    index_type: str = "AUTOINDEX"
+    metric_type: str = "IP"
+    build_params: dict = field(default_factory=dict)
+    search_params: dict = field(default_factory=dict)
+    consistency_level: str = "Bounded"
+
+    def __post_init__(self):
+        self.index_type = self.index_type.upper()
+        if self.index_type not in INDEX_PRESETS:
+            raise ValueError(f"Unsupported index type {self.index_type}. Choose one of {list(INDEX_PRESETS)}.")
+        if self.consistency_level not in CONSISTENCY_LEVELS:
+            raise ValueError(
+                f"Unsupported consistency level {self.consistency_level}. Choose one of {CONSISTENCY_LEVELS}."
+            )
+
+    def milvus_search_params(self, **overrides) -> dict:
+        return {"metric_type": self.metric_type, "params": {**self.search_params, **overrides}}
+
+
+def get_index_spec(
+    index_type: str,
+    metric_type: str,
+    build_params: dict = None,
+    search_params: dict = None,
+    consistency_level: str = "Bounded",
+) -> IndexSpec:
+    if index_type.upper() not in INDEX_PRESETS:
+        raise ValueError(f"Unsupported index type {index_type}. Choose one of {list(INDEX_PRESETS)}.")
+    default_build_params, default_search_params = INDEX_PRESETS[index_type.upper()]
+    return IndexSpec(
+        index_type=index_type,
+        metric_type=metric_type,
+        build_params={**default_build_params, **(build_params or {})},
+        search_params={**default_search_params, **(search_params or {})},
+        consistency_level=consistency_level,
+    )
+
+
+def index_spec_from_env(prefix: str, metric_type: str, consistency_level: str = "Bounded") -> IndexSpec:
+    """Reads <prefix>_INDEX_TYPE, <prefix>_INDEX_PARAMS, <prefix>_SEARCH_PARAMS and <prefix>_CONSISTENCY_LEVEL."""
+    return get_index_spec(
+        index_type=os.getenv(f"{prefix}_INDEX_TYPE", "AUTOINDEX"),
+        metric_type=metric_type,
+        build_params=json.loads(os.getenv(f"{prefix}_INDEX_PARAMS", "{}")),
+        search_params=json.loads(os.getenv(f"{prefix}_SEARCH_PARAMS", "{}")),
+        consistency_level=os.getenv(f"{prefix}_CONSISTENCY_LEVEL", consistency_level),
+    )
+
+
+TEXT_INDEX_SPEC = index_spec_from_env("TEXT", "IP", consistency_level="Strong")
+IMAGE_INDEX_SPEC = index_spec_from_env("IMAGE", "COSINE")
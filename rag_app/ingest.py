@@ -0,0 +1,57 @@
+import os
+import hashlib
+from pymilvus import MilvusClient, DataType
+
+from rag_app.quantization import QuantizationSpec, TEXT_QUANTIZATION, IMAGE_QUANTIZATION, get_full_vector_store
+from rag_app.milvus_utils import has_content_hash_ids, has_field
+
+
+def image_row_id(image_path: str) -> str:
+    with open(image_path, "rb") as file:
+        content = file.read()
+    return hashlib.sha256(os.path.basename(image_path).encode("utf-8") + b"\x00" + content).hexdigest()
+
+
+def diff_ids(stored_ids: set, current_ids: set) -> tuple[set, set]:
+    """Returns the ids to add and the ids to delete to turn stored_ids into current_ids."""
+    return current_ids - stored_ids, stored_ids - current_ids
+
+
+def store_full_vectors(
+    collection_name: str, quantization: QuantizationSpec, vectors: dict, ids_to_delete: set, rebuild: bool
+):
+    """Keeps the full-precision vectors used to rescore searches on a quantized collection."""
+    store = get_full_vector_store()
+    if rebuild:
+        store.drop(collection_name)
+    if quantization.quantized:
+        store.put_many(collection_name, vectors)
+    store.delete_many(collection_name, list(ids_to_delete))
+
+
+def can_update_text_collection(
+    milvus_client: MilvusClient, collection_name: str, quantization: QuantizationSpec = TEXT_QUANTIZATION
+) -> bool:
+    """True if the text collection can be updated incrementally, otherwise says why it has to be rebuilt."""
+    if not has_content_hash_ids(milvus_client, collection_name):
+        print(f"{collection_name} has no content-hash ids yet, rebuilding it")
+        return False
+    if not has_field(milvus_client, collection_name, "image_url", DataType.ARRAY):
+        print(f"{collection_name} stores image_url as a string, rebuilding it")
+        return False
+    if not has_field(milvus_client, collection_name, "vector", quantization.datatype):
+        print(f"{collection_name} stores vectors as another type than {quantization.storage}, rebuilding it")
+        return False
+    return True
+
+
+def can_update_image_collection(
+    milvus_client: MilvusClient, collection_name: str, quantization: QuantizationSpec = IMAGE_QUANTIZATION
+) -> bool:
+    if not has_content_hash_ids(milvus_client, collection_name):
+        print(f"{collection_name} has no content-hash ids yet, rebuilding it")
+        return False
+    if not has_field(milvus_client, collection_name, "vector", quantization.datatype):
+        print(f"{collection_name} stores vectors as another type than {quantization.storage}, rebuilding it")
+        return False
+    return True
@@ -0,0 +1,99 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter
+
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./lexical_index.json")
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return WORD_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over the text chunks, used for exact-term matches the dense search misses."""
+
+    def __init__(self, ids: list[str], doc_lengths: list[int], postings: dict, k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+
+    @classmethod
+    def build(cls, ids: list[str], texts: list[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        doc_lengths, postings = [], {}
+        for doc, text in enumerate(texts):
+            term_counts = Counter(tokenize(text))
+            doc_lengths.append(sum(term_counts.values()))
+            for term, count in term_counts.items():
+                postings.setdefault(term, {})[doc] = count
+        return cls(list(ids), doc_lengths, postings, k1, b)
+
+    def idf(self, term: str) -> float:
+        doc_freq = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.ids) - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float]]:
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc, count in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc] / self.avg_doc_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(self.ids[doc], score) for doc, score in best]
+
+    def save(self, path: str = LEXICAL_INDEX_PATH):
+        with open(f"{path}.tmp", "w") as file:
+            json.dump({
+                "k1": self.k1, "b": self.b, "ids": self.ids,
+                "doc_lengths": self.doc_lengths, "postings": self.postings,
+            }, file)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str = LEXICAL_INDEX_PATH) -> "BM25Index":
+        with open(path) as file:
+            data = json.load(file)
+        # JSON object keys are strings, document numbers are list positions
+        postings = {
+            term: {int(doc): count for doc, count in docs.items()} for term, docs in data["postings"].items()
+        }
+        return cls(data["ids"], data["doc_lengths"], postings, data["k1"], data["b"])
+
+
+_loaded_index = (None, None)
+_loaded_index_lock = threading.Lock()
+
+
+def get_lexical_index(path: str = LEXICAL_INDEX_PATH) -> BM25Index:
+    """Returns the index stored at path, reloading it after it was rebuilt; None if there is none."""
+    global _loaded_index
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _loaded_index_lock:
+        if _loaded_index[0] != mtime:
+            _loaded_index = (mtime, BM25Index.load(path))
+        return _loaded_index[1]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], weights: list[float] = None, k: int = 60) -> list[tuple[str, float]]:
+    """Fuses ranked id lists; each list contributes weight / (k + rank) for every id it contains."""
+    weights = weights or [1.0] * len(rankings)
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item_id in enumerate(ranking, 1):
+            scores[item_id] = scores.get(item_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
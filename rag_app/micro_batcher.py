@@ -0,0 +1,81 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+from rag_app import telemetry
+
+
+SEARCH_BATCHING = os.getenv("SEARCH_BATCHING", "true").lower() == "true"
+SEARCH_BATCH_MAX_SIZE = int(os.getenv("SEARCH_BATCH_MAX_SIZE", 32))
+SEARCH_BATCH_WAIT_MS = float(os.getenv("SEARCH_BATCH_WAIT_MS", 2))
+
+
+class MicroBatcher:
+    """Coalesces concurrent calls into batches for a function that handles many items at once.
+
+    batch_fn takes a list of items and returns one result per item. A worker takes the
+    first waiting item, collects the items that arrive within max_wait_ms (at most
+    max_batch_size of them), calls batch_fn once and hands every caller its own result.
+    Items that queue up while a batch is running go into the next batch without waiting.
+    """
+
+    def __init__(
+        self,
+        batch_fn,
+        name: str,
+        max_batch_size: int = SEARCH_BATCH_MAX_SIZE,
+        max_wait_ms: float = SEARCH_BATCH_WAIT_MS,
+        num_workers: int = 1,
+    ):
+        self.batch_fn = batch_fn
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"{name}-batcher-{i}", daemon=True) for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._collect()
+            telemetry.incr("micro_batches_total", batcher=self.name)
+            telemetry.incr("micro_batched_items_total", len(batch), batcher=self.name)
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
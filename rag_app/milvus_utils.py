@@ -1,14 +1,40 @@
+import os
+import json
+import time
 import streamlit as st
-from pymilvus import MilvusClient
+from pymilvus import MilvusClient, DataType
+
+from rag_app.index_specs import IndexSpec, TEXT_INDEX_SPEC, IMAGE_INDEX_SPEC
+from rag_app.quantization import QuantizationSpec, TEXT_QUANTIZATION, IMAGE_QUANTIZATION, rescore_hits
+from rag_app.mmap_backend import MmapVectorClient, MMAP_VECTORS_DIR
+from rag_app import telemetry
+
+# primary keys are SHA-256 hex digests of the row content
+ID_MAX_LENGTH = 64
+# image_url of the text chunks is an ARRAY of VARCHAR, so hits carry real lists
+IMAGE_URLS_MAX_CAPACITY = int(os.getenv("IMAGE_URLS_MAX_CAPACITY", 256))
+URL_MAX_LENGTH = 2048
+# ingest timestamps per collection, used to invalidate caches built on top of them
+COLLECTION_VERSIONS_FILE = os.getenv("COLLECTION_VERSIONS_FILE", "./collection_versions.json")
+# milvus, or mmap for in-process exact search over memory-mapped files in MMAP_VECTORS_DIR
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "milvus").lower()
+VECTOR_BACKENDS = ["milvus", "mmap"]
 
 
 @st.cache_resource
-def get_milvus_client(uri: str, token: str = None) -> MilvusClient:
+def get_milvus_client(uri: str, token: str = None, backend: str = None) -> MilvusClient:
+    """Client of the configured vector backend; the mmap backend implements the MilvusClient methods used here."""
+    backend = (backend or VECTOR_BACKEND).lower()
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Unsupported vector backend {backend}. Choose one of {VECTOR_BACKENDS}.")
+    if backend == "mmap":
+        return MmapVectorClient(MMAP_VECTORS_DIR)
     return MilvusClient(uri=uri, token=token)
 
 
-def create_text_collection(
-    milvus_client: MilvusClient, collection_name: str, dim: int, drop_old: bool = True
+def _create_collection(
+    milvus_client: MilvusClient, collection_name: str, dim: int, index_spec: IndexSpec, drop_old: bool,
+    extra_fields: list[dict] = (), quantization: QuantizationSpec = QuantizationSpec()
 ):
     if milvus_client.has_collection(collection_name) and drop_old:
         milvus_client.drop_collection(collection_name)
@@ -16,51 +42,221 @@ def create_text_collection(
         raise RuntimeError(
             f"Collection {collection_name} already exists. Set drop_old=True to create a new one instead."
         )
+    schema = MilvusClient.create_schema(auto_id=False, enable_dynamic_field=True)
+    schema.add_field(field_name="id", datatype=DataType.VARCHAR, is_primary=True, max_length=ID_MAX_LENGTH)
+    schema.add_field(field_name="vector", datatype=quantization.datatype, dim=quantization.stored_dim(dim))
+    for field in extra_fields:
+        schema.add_field(**field)
     return milvus_client.create_collection(
         collection_name=collection_name,
-        dimension=dim,
-        metric_type="IP",
-        consistency_level="Strong",
-        auto_id=True,
+        schema=schema,
+        index_params=build_index_params(milvus_client, quantization.index_spec(index_spec)),
+        consistency_level=index_spec.consistency_level,
+    )
+
+
+def build_index_params(milvus_client: MilvusClient, index_spec: IndexSpec):
+    index_params = milvus_client.prepare_index_params()
+    index_params.add_index(
+        field_name="vector",
+        index_type=index_spec.index_type,
+        metric_type=index_spec.metric_type,
+        params=index_spec.build_params,
+    )
+    return index_params
+
+
+def create_text_collection(
+    milvus_client: MilvusClient, collection_name: str, dim: int, drop_old: bool = True,
+    index_spec: IndexSpec = TEXT_INDEX_SPEC, quantization: QuantizationSpec = TEXT_QUANTIZATION
+):
+    image_url_field = {
+        "field_name": "image_url", "datatype": DataType.ARRAY, "element_type": DataType.VARCHAR,
+        "max_capacity": IMAGE_URLS_MAX_CAPACITY, "max_length": URL_MAX_LENGTH,
+    }
+    return _create_collection(
+        milvus_client, collection_name, dim, index_spec, drop_old, [image_url_field], quantization
     )
 
 
 def create_image_collection(
-    milvus_client: MilvusClient, collection_name: str, dim: int, drop_old: bool = True
+    milvus_client: MilvusClient, collection_name: str, dim: int, drop_old: bool = True,
+    index_spec: IndexSpec = IMAGE_INDEX_SPEC, quantization: QuantizationSpec = IMAGE_QUANTIZATION
 ):
-    if milvus_client.has_collection(collection_name) and drop_old:
-        milvus_client.drop_collection(collection_name)
-    if milvus_client.has_collection(collection_name):
-        raise RuntimeError(
-            f"Collection {collection_name} already exists. Set drop_old=True to create a new one instead."
-        )
-    return milvus_client.create_collection(
-        collection_name=collection_name,
-        auto_id=True,
-        dimension=dim,
-        enable_dynamic_field=True,
-        metric_type="COSINE"
+    return _create_collection(milvus_client, collection_name, dim, index_spec, drop_old, quantization=quantization)
+
+
+def rebuild_index(milvus_client: MilvusClient, collection_name: str, index_spec: IndexSpec):
+    """Replaces the vector index of an existing collection, e.g. to try different build parameters."""
+    milvus_client.release_collection(collection_name)
+    for index_name in milvus_client.list_indexes(collection_name, field_name="vector"):
+        milvus_client.drop_index(collection_name, index_name)
+    milvus_client.create_index(collection_name, build_index_params(milvus_client, index_spec))
+    milvus_client.load_collection(collection_name)
+
+
+def has_content_hash_ids(milvus_client: MilvusClient, collection_name: str) -> bool:
+    """True if the collection exists and is keyed by content hashes, i.e. supports incremental upserts."""
+    if not milvus_client.has_collection(collection_name):
+        return False
+    fields = milvus_client.describe_collection(collection_name)["fields"]
+    return any(field.get("is_primary") and field["type"] == DataType.VARCHAR for field in fields)
+
+
+def has_field(milvus_client: MilvusClient, collection_name: str, field_name: str, datatype: DataType) -> bool:
+    if not milvus_client.has_collection(collection_name):
+        return False
+    fields = milvus_client.describe_collection(collection_name)["fields"]
+    return any(field["name"] == field_name and field["type"] == datatype for field in fields)
+
+
+def iter_stored_ids(milvus_client: MilvusClient, collection_name: str, batch_size: int = 1000):
+    """Yields the primary keys of the collection in batches of up to batch_size."""
+    iterator = milvus_client.query_iterator(
+        collection_name=collection_name, batch_size=batch_size, filter="", output_fields=["id"]
     )
+    try:
+        while batch := iterator.next():
+            yield [row["id"] for row in batch]
+    finally:
+        iterator.close()
+
+
+def get_stored_ids(milvus_client: MilvusClient, collection_name: str, batch_size: int = 1000) -> set:
+    stored_ids = set()
+    for batch in iter_stored_ids(milvus_client, collection_name, batch_size):
+        stored_ids.update(batch)
+    return stored_ids
+
 
+def swap_collection(milvus_client: MilvusClient, staging_name: str, collection_name: str):
+    """Replaces collection_name with the collection built under staging_name.
 
-def get_search_text_results(milvus_client: MilvusClient, collection_name: str, query_vector, output_fields):
+    The old collection keeps serving searches until the new one is complete.
+    """
+    if milvus_client.has_collection(collection_name):
+        milvus_client.drop_collection(collection_name)
+    milvus_client.rename_collection(staging_name, collection_name)
+    # Milvus releases a renamed collection
+    milvus_client.load_collection(collection_name)
+
+
+def upsert_rows(milvus_client: MilvusClient, collection_name: str, rows: list[dict], batch_size: int = 1000) -> int:
+    upserted = 0
+    for i in range(0, len(rows), batch_size):
+        with telemetry.span("milvus_upsert", collection=collection_name, rows=len(rows[i:i + batch_size])):
+            res = milvus_client.upsert(collection_name=collection_name, data=rows[i:i + batch_size])
+        upserted += res["upsert_count"]
+    return upserted
+
+
+def delete_rows(milvus_client: MilvusClient, collection_name: str, ids: list[str], batch_size: int = 1000) -> int:
+    deleted = 0
+    for i in range(0, len(ids), batch_size):
+        with telemetry.span("milvus_delete", collection=collection_name, rows=len(ids[i:i + batch_size])):
+            res = milvus_client.delete(collection_name=collection_name, ids=ids[i:i + batch_size])
+        # Milvus Lite returns the deleted primary keys instead of a count
+        deleted += len(res) if isinstance(res, list) else res["delete_count"]
+    return deleted
+
+
+def get_rows_by_ids(milvus_client: MilvusClient, collection_name: str, ids: list[str], output_fields) -> list[dict]:
+    if not ids:
+        return []
+    with telemetry.span("milvus_get", collection=collection_name, rows=len(ids)):
+        return milvus_client.get(collection_name=collection_name, ids=ids, output_fields=output_fields)
+
+
+def mark_collection_updated(collection_name: str, versions_file: str = COLLECTION_VERSIONS_FILE):
+    versions = {}
+    if os.path.exists(versions_file):
+        with open(versions_file) as file:
+            versions = json.load(file)
+    versions[collection_name] = time.time()
+    with open(f"{versions_file}.tmp", "w") as file:
+        json.dump(versions, file)
+    os.replace(f"{versions_file}.tmp", versions_file)
+
+
+def get_collection_version(collection_name: str, versions_file: str = COLLECTION_VERSIONS_FILE) -> float:
+    try:
+        with open(versions_file) as file:
+            return json.load(file).get(collection_name)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def search_vectors_batch(
+    milvus_client: MilvusClient, collection_name: str, query_vectors: list, output_fields, limit: int,
+    index_spec: IndexSpec, quantization: QuantizationSpec, **search_overrides
+) -> list[list]:
+    """Hits of every query vector from a single search call; quantized collections are rescored per query."""
+    search_spec = quantization.index_spec(index_spec)
     search_res = milvus_client.search(
         collection_name=collection_name,
-        data=[query_vector],
-        limit=2,
-        search_params={"metric_type": "IP", "params": {}},
+        data=quantization.encode(query_vectors),
+        limit=quantization.candidate_limit(limit),
+        search_params=search_spec.milvus_search_params(**search_overrides),
         output_fields=output_fields,
+        consistency_level=index_spec.consistency_level,
     )
-    return search_res
+    if quantization.quantized:
+        return [
+            rescore_hits(collection_name, hits, query_vector, index_spec.metric_type, limit)
+            for hits, query_vector in zip(search_res, query_vectors)
+        ]
+    return list(search_res)
 
 
-def get_search_image_results(milvus_client, collection_name, query_vector, output_fields=["image_path"]):
-    search_results = milvus_client.search(
-        collection_name=collection_name,
-        data=[query_vector],
-        output_fields=output_fields,
-        limit=3,
-        search_params={"metric_type": "COSINE", "params": {}},
+def search_vectors(
+    milvus_client: MilvusClient, collection_name: str, query_vector, output_fields, limit: int,
+    index_spec: IndexSpec, quantization: QuantizationSpec, **search_overrides
+) -> list:
+    return search_vectors_batch(
+        milvus_client, collection_name, [query_vector], output_fields, limit, index_spec, quantization,
+        **search_overrides
     )[0]
 
-    return [hit.get("entity").get("image_path") for hit in search_results]
\ No newline at end of file
+
+def get_search_text_results_batch(
+    milvus_client: MilvusClient, collection_name: str, query_vectors: list, output_fields, limit: int = 2,
+    index_spec: IndexSpec = TEXT_INDEX_SPEC, quantization: QuantizationSpec = TEXT_QUANTIZATION, **search_overrides
+) -> list[list]:
+    with telemetry.span("milvus_search_text", collection=collection_name, limit=limit, queries=len(query_vectors)):
+        return search_vectors_batch(
+            milvus_client, collection_name, query_vectors, output_fields, limit, index_spec, quantization,
+            **search_overrides
+        )
+
+
+def get_search_text_results(
+    milvus_client: MilvusClient, collection_name: str, query_vector, output_fields, limit: int = 2,
+    index_spec: IndexSpec = TEXT_INDEX_SPEC, quantization: QuantizationSpec = TEXT_QUANTIZATION, **search_overrides
+):
+    return get_search_text_results_batch(
+        milvus_client, collection_name, [query_vector], output_fields, limit, index_spec, quantization,
+        **search_overrides
+    )
+
+
+def get_search_image_results_batch(
+    milvus_client, collection_name, query_vectors: list, output_fields=["image_path"], limit: int = 3,
+    index_spec: IndexSpec = IMAGE_INDEX_SPEC, quantization: QuantizationSpec = IMAGE_QUANTIZATION, **search_overrides
+) -> list[list[str]]:
+    with telemetry.span("milvus_search_image", collection=collection_name, limit=limit, queries=len(query_vectors)):
+        search_results = search_vectors_batch(
+            milvus_client, collection_name, query_vectors, output_fields, limit, index_spec, quantization,
+            **search_overrides
+        )
+
+    return [[hit.get("entity").get("image_path") for hit in hits] for hits in search_results]
+
+
+def get_search_image_results(
+    milvus_client, collection_name, query_vector, output_fields=["image_path"], limit: int = 3,
+    index_spec: IndexSpec = IMAGE_INDEX_SPEC, quantization: QuantizationSpec = IMAGE_QUANTIZATION, **search_overrides
+):
+    return get_search_image_results_batch(
+        milvus_client, collection_name, [query_vector], output_fields, limit, index_spec, quantization,
+        **search_overrides
+    )[0]
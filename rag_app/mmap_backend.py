@@ -0,0 +1,647 @@
+import os
+import sys
+import json
+import uuid
+import shutil
+import argparse
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# makes the rag_app package importable when run as `python rag_app/mmap_backend.py`
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from pymilvus import MilvusClient, DataType
+
+
+MMAP_VECTORS_DIR = os.getenv("MMAP_VECTORS_DIR", "./mmap_vectors")
+# row blocks scored at a time and threads scoring them; NumPy releases the GIL in matrix products
+MMAP_SEARCH_BLOCK_ROWS = int(os.getenv("MMAP_SEARCH_BLOCK_ROWS", 16384))
+MMAP_SEARCH_THREADS = int(os.getenv("MMAP_SEARCH_THREADS", 1))
+
+VECTOR_DTYPES = {
+    DataType.FLOAT_VECTOR: np.float32,
+    DataType.FLOAT16_VECTOR: np.float16,
+    DataType.BINARY_VECTOR: np.uint8,
+}
+# metrics reported as distances, smaller is better
+DISTANCE_METRICS = ["L2", "HAMMING"]
+ARRAY_FILES = ["ids", "vectors", "norms", "meta", "offsets"]
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def _restore_field(field: dict) -> dict:
+    field = dict(field)
+    for key in ["type", "element_type"]:
+        if key in field:
+            field[key] = DataType(field[key])
+    return field
+
+
+def _pack(parts: list[tuple]) -> dict:
+    """Concatenates (arrays, deleted mask) parts into the arrays of one segment, without the deleted rows."""
+    arrays = {name: [] for name in ARRAY_FILES}
+    meta_end = 0
+    for part, deleted in parts:
+        rows = np.arange(len(part["ids"])) if deleted is None else np.flatnonzero(~deleted)
+        starts = part["offsets"][:-1][rows]
+        lengths = part["offsets"][1:][rows] - starts
+        ends = np.cumsum(lengths)
+        # byte positions of the kept documents, gathered in one indexing operation
+        positions = np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+        arrays["ids"].append(part["ids"][rows])
+        arrays["vectors"].append(part["vectors"][rows])
+        arrays["norms"].append(part["norms"][rows])
+        arrays["meta"].append(part["meta"][positions])
+        arrays["offsets"].append(ends + meta_end)
+        meta_end += ends[-1] if len(ends) else 0
+    packed = {name: np.concatenate(arrays[name]) for name in ["ids", "vectors", "norms", "meta"]}
+    packed["offsets"] = np.concatenate([np.zeros(1, dtype=np.int64)] + arrays["offsets"]).astype(np.int64)
+    return packed
+
+
+class _Segment:
+    """Rows written by one upsert or merge: memory-mapped arrays that are never modified.
+
+    Rows keep their non-vector fields as JSON documents concatenated in `meta`,
+    row i spans meta[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, segment_id: int, vector_type: DataType, ids, vectors, norms, meta, offsets):
+        self.segment_id = segment_id
+        self.vector_type = vector_type
+        self.ids = ids
+        self.vectors = vectors
+        self.norms = norms
+        self.meta = meta
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.ids)
+
+    def arrays(self) -> dict:
+        return {name: getattr(self, name) for name in ARRAY_FILES}
+
+    def id(self, row: int) -> str:
+        return self.ids[row].decode("utf-8")
+
+    def id_list(self, rows) -> list[str]:
+        return [row_id.decode("utf-8") for row_id in self.ids[rows].tolist()]
+
+    def document(self, row: int) -> dict:
+        return json.loads(self.meta[self.offsets[row]:self.offsets[row + 1]].tobytes())
+
+    def vector(self, row: int):
+        vector = self.vectors[row]
+        if self.vector_type == DataType.BINARY_VECTOR:
+            return vector.tobytes()
+        if self.vector_type == DataType.FLOAT16_VECTOR:
+            return np.array(vector)
+        return vector.tolist()
+
+    def entity(self, row: int, output_fields) -> dict:
+        output_fields = output_fields or []
+        document = self.document(row)
+        if "*" in output_fields:
+            entity = document
+        else:
+            entity = {field: document[field] for field in output_fields if field in document}
+        if "vector" in output_fields:
+            entity["vector"] = self.vector(row)
+        return entity
+
+
+class _Collection:
+    """Segments of a collection in write order, their deletion masks and an id -> (segment id, row) lookup.
+
+    The lookup is updated in place when segments are added, merged or get deleted rows,
+    so picking up a write costs time proportional to the rows it touched.
+    """
+
+    def __init__(self, manifest: dict):
+        self.created = manifest["created"]
+        self.fields = [_restore_field(field) for field in manifest["fields"]]
+        vector_field = next(field for field in self.fields if field["name"] == "vector")
+        self.vector_type = vector_field["type"]
+        self.dtype = VECTOR_DTYPES[self.vector_type]
+        dim = int(vector_field["params"]["dim"])
+        self.width = dim // 8 if self.dtype == np.uint8 else dim
+        self.version = None
+        self.manifest = manifest
+        # (segment, deleted mask or None) pairs, replaced as a whole so searches see a consistent list
+        self.segments = []
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def update(self, manifest: dict, segments: list[tuple]):
+        old = {segment.segment_id: (segment, deleted) for segment, deleted in self.segments}
+        new_ids = {segment.segment_id for segment, _ in segments}
+        for segment_id, (segment, _) in old.items():
+            if segment_id not in new_ids:
+                self._forget(segment, np.arange(len(segment)))
+        for segment, deleted in segments:
+            if segment.segment_id in old:
+                old_deleted = old[segment.segment_id][1]
+                if deleted is not None and deleted is not old_deleted:
+                    newly_deleted = deleted if old_deleted is None else deleted & ~old_deleted
+                    self._forget(segment, np.flatnonzero(newly_deleted))
+            else:
+                rows = np.arange(len(segment)) if deleted is None else np.flatnonzero(~deleted)
+                self.rows.update(zip(segment.id_list(rows), ((segment.segment_id, int(row)) for row in rows)))
+        self.segments = segments
+        self.manifest = manifest
+
+    def _forget(self, segment: _Segment, rows):
+        for row_id, row in zip(segment.id_list(rows), rows):
+            if self.rows.get(row_id) == (segment.segment_id, row):
+                del self.rows[row_id]
+
+    def encode_vectors(self, vectors: list) -> np.ndarray:
+        if not vectors:
+            return np.empty((0, self.width), dtype=self.dtype)
+        return np.stack([
+            np.frombuffer(vector, dtype=self.dtype) if isinstance(vector, bytes) else np.asarray(vector, self.dtype)
+            for vector in vectors
+        ]).reshape(len(vectors), self.width)
+
+
+class _QueryIterator:
+    def __init__(self, segments: list[tuple], batch_size: int, output_fields):
+        self._rows = (
+            (segment, row)
+            for segment, deleted in segments
+            for row in (range(len(segment)) if deleted is None else np.flatnonzero(~deleted))
+        )
+        self._batch_size = batch_size
+        self._output_fields = output_fields
+
+    def next(self) -> list[dict]:
+        return [
+            {"id": segment.id(row), **segment.entity(row, self._output_fields)}
+            for segment, row in islice(self._rows, self._batch_size)
+        ]
+
+    def close(self):
+        pass
+
+
+class MmapVectorClient:
+    """In-process exact vector search over memory-mapped NumPy files.
+
+    Implements the MilvusClient methods used by rag_app/milvus_utils.py and the tools,
+    so it can replace Milvus Lite for a corpus that fits on one machine. Each collection
+    is a directory with a manifest and a list of segments, one set of .npy files each.
+    An upsert appends its rows as a new segment and marks replaced rows in a deletion
+    mask; trailing segments no larger than the new one are merged into it, so a
+    collection holds a logarithmic number of segments. compact() merges everything
+    and drops deleted rows. Readers map the files without copying and pick up writes
+    made by other processes.
+    """
+
+    def __init__(
+        self, path: str = MMAP_VECTORS_DIR, block_rows: int = MMAP_SEARCH_BLOCK_ROWS,
+        threads: int = MMAP_SEARCH_THREADS
+    ):
+        self.path = path
+        self.block_rows = block_rows
+        self._executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        self._collections = {}
+        self._write_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    # storage
+
+    def _collection_dir(self, collection_name: str) -> str:
+        return os.path.join(self.path, collection_name)
+
+    def _manifest_path(self, collection_name: str) -> str:
+        return os.path.join(self._collection_dir(collection_name), "manifest.json")
+
+    def _array_path(self, collection_name: str, segment_id: int, name: str) -> str:
+        return os.path.join(self._collection_dir(collection_name), f"{segment_id}.{name}.npy")
+
+    def _deleted_path(self, collection_name: str, segment_id: int, version: int) -> str:
+        return os.path.join(self._collection_dir(collection_name), f"{segment_id}.deleted.{version}.npy")
+
+    def _read_manifest(self, collection_name: str) -> dict:
+        with open(self._manifest_path(collection_name)) as file:
+            return json.load(file)
+
+    def _load_segments(self, collection_name: str, manifest: dict, state: _Collection) -> list[tuple]:
+        """Maps the segments added since state was loaded and reads changed deletion masks."""
+        loaded = {segment.segment_id: (segment, deleted) for segment, deleted in state.segments}
+        mask_versions = {entry["id"]: entry["deleted"] for entry in state.manifest["segments"]}
+        segments = []
+        for entry in manifest["segments"]:
+            if entry["id"] in loaded and entry["deleted"] == mask_versions.get(entry["id"]):
+                segments.append(loaded[entry["id"]])
+                continue
+            if entry["id"] in loaded:
+                segment = loaded[entry["id"]][0]
+            else:
+                segment = _Segment(entry["id"], state.vector_type, *[
+                    np.load(self._array_path(collection_name, entry["id"], name), mmap_mode="r")
+                    for name in ARRAY_FILES
+                ])
+            deleted = None
+            if entry["deleted"] is not None:
+                deleted = np.load(self._deleted_path(collection_name, entry["id"], entry["deleted"]))
+            segments.append((segment, deleted))
+        return segments
+
+    def _collection(self, collection_name: str) -> _Collection:
+        try:
+            stat = os.stat(self._manifest_path(collection_name))
+        except FileNotFoundError:
+            raise ValueError(f"Collection {collection_name} does not exist in {self.path}.")
+        # every write replaces the manifest, which gives it a new inode
+        version = (stat.st_ino, stat.st_mtime_ns)
+        with self._load_lock:
+            state = self._collections.get(collection_name)
+            if state is not None and state.version == version:
+                return state
+            # a writer may replace the manifest and remove merged segments between the two reads
+            for attempt in range(3):
+                manifest = self._read_manifest(collection_name)
+                if state is None or state.created != manifest["created"]:
+                    state = _Collection(manifest)
+                try:
+                    segments = self._load_segments(collection_name, manifest, state)
+                    break
+                except FileNotFoundError:
+                    if attempt == 2:
+                        raise
+            state.update(manifest, segments)
+            state.version = version
+            self._collections[collection_name] = state
+            return state
+
+    def _commit(self, collection_name: str, state: _Collection, deleted: dict, new_rows: dict = None,
+                merge_all: bool = False):
+        """Writes new rows and deletion masks as the next version of the collection.
+
+        deleted maps segment ids to their updated deletion masks. Trailing segments
+        with no more live rows than the new ones are merged into them, or all segments
+        with merge_all.
+        """
+        manifest = state.manifest
+        version = manifest["version"] + 1
+        entries = []
+        for entry, (segment, segment_deleted) in zip(manifest["segments"], state.segments):
+            segment_deleted = deleted.get(entry["id"], segment_deleted)
+            live = len(segment) - (int(segment_deleted.sum()) if segment_deleted is not None else 0)
+            if live:
+                entries.append({**entry, "live": live, "_segment": segment, "_deleted": segment_deleted})
+
+        parts = [(new_rows, None)] if new_rows is not None and len(new_rows["ids"]) else []
+        pending = len(new_rows["ids"]) if parts else 0
+        while entries and (merge_all or (parts and entries[-1]["live"] <= pending)):
+            entry = entries.pop()
+            parts.insert(0, (entry["_segment"].arrays(), entry["_deleted"]))
+            pending += entry["live"]
+        next_segment = manifest["next_segment"]
+        if parts:
+            packed = _pack(parts)
+            for name in ARRAY_FILES:
+                np.save(self._array_path(collection_name, next_segment, name), packed[name])
+            entries.append({"id": next_segment, "rows": pending, "live": pending, "_deleted": None})
+            next_segment += 1
+        for entry in entries:
+            if entry["id"] in deleted and entry["_deleted"] is not None:
+                np.save(self._deleted_path(collection_name, entry["id"], version), entry["_deleted"])
+                entry["deleted"] = version
+            elif entry["_deleted"] is None:
+                entry["deleted"] = None
+
+        self._write_manifest(collection_name, {
+            **{key: value for key, value in manifest.items() if key != "segments"},
+            "version": version,
+            "next_segment": next_segment,
+            "segments": [{key: value for key, value in entry.items() if not key.startswith("_")} for entry in entries],
+        })
+        self._remove_unreferenced(collection_name)
+
+    def _write_manifest(self, collection_name: str, manifest: dict):
+        manifest_path = self._manifest_path(collection_name)
+        with open(f"{manifest_path}.tmp", "w") as file:
+            json.dump(manifest, file, default=_json_default)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    def _remove_unreferenced(self, collection_name: str):
+        manifest = self._read_manifest(collection_name)
+        referenced = {f"{entry['id']}.{name}.npy" for entry in manifest["segments"] for name in ARRAY_FILES}
+        referenced |= {
+            f"{entry['id']}.deleted.{entry['deleted']}.npy" for entry in manifest["segments"] if entry["deleted"] is not None
+        }
+        # mapped files stay readable after they are unlinked
+        for file_name in os.listdir(self._collection_dir(collection_name)):
+            if file_name.endswith(".npy") and file_name not in referenced:
+                try:
+                    os.remove(os.path.join(self._collection_dir(collection_name), file_name))
+                except FileNotFoundError:
+                    pass
+
+    # collections
+
+    def has_collection(self, collection_name: str, **kwargs) -> bool:
+        return os.path.exists(self._manifest_path(collection_name))
+
+    def list_collections(self, **kwargs) -> list[str]:
+        return sorted(name for name in os.listdir(self.path) if self.has_collection(name))
+
+    def create_collection(self, collection_name: str, schema=None, index_params=None, **kwargs):
+        """Creates an empty collection from a pymilvus CollectionSchema; the vector field must be named `vector`."""
+        self.create_collection_from_fields(
+            collection_name, [field.to_dict() for field in schema.fields], schema.enable_dynamic_field
+        )
+
+    def create_collection_from_fields(self, collection_name: str, fields: list[dict], enable_dynamic_field: bool):
+        fields = [_restore_field(field) for field in fields]
+        vector_field = next((field for field in fields if field["name"] == "vector"), None)
+        if vector_field is None or vector_field["type"] not in VECTOR_DTYPES:
+            raise ValueError(f"The mmap backend needs a vector field named `vector` of type {list(VECTOR_DTYPES)}.")
+
+        with self._write_lock:
+            if self.has_collection(collection_name):
+                raise RuntimeError(f"Collection {collection_name} already exists.")
+            os.makedirs(self._collection_dir(collection_name), exist_ok=True)
+            self._write_manifest(collection_name, {
+                "version": 0, "created": uuid.uuid4().hex, "next_segment": 0, "segments": [],
+                "fields": fields, "enable_dynamic_field": enable_dynamic_field,
+            })
+
+    def drop_collection(self, collection_name: str, **kwargs):
+        with self._write_lock:
+            shutil.rmtree(self._collection_dir(collection_name), ignore_errors=True)
+            self._collections.pop(collection_name, None)
+
+    def rename_collection(self, old_name: str, new_name: str, **kwargs):
+        with self._write_lock:
+            if self.has_collection(new_name):
+                raise RuntimeError(f"Collection {new_name} already exists.")
+            os.rename(self._collection_dir(old_name), self._collection_dir(new_name))
+            self._collections.pop(old_name, None)
+            self._collections.pop(new_name, None)
+
+    def describe_collection(self, collection_name: str, **kwargs) -> dict:
+        manifest = self._read_manifest(collection_name)
+        return {
+            "collection_name": collection_name,
+            "fields": [_restore_field(field) for field in manifest["fields"]],
+            "enable_dynamic_field": manifest["enable_dynamic_field"],
+        }
+
+    def get_collection_stats(self, collection_name: str, **kwargs) -> dict:
+        return {"row_count": len(self._collection(collection_name))}
+
+    def compact(self, collection_name: str, **kwargs):
+        """Merges all segments into one without the deleted rows."""
+        with self._write_lock:
+            state = self._collection(collection_name)
+            if len(state.segments) > 1 or any(deleted is not None for _, deleted in state.segments):
+                self._commit(collection_name, state, {}, merge_all=True)
+
+    # search is always exact, so indexes and loading are no-ops
+
+    @staticmethod
+    def prepare_index_params(*args, **kwargs):
+        return MilvusClient.prepare_index_params(*args, **kwargs)
+
+    def create_index(self, collection_name: str, index_params=None, **kwargs):
+        pass
+
+    def list_indexes(self, collection_name: str, field_name: str = "", **kwargs) -> list[str]:
+        return ["vector"]
+
+    def drop_index(self, collection_name: str, index_name: str, **kwargs):
+        pass
+
+    def load_collection(self, collection_name: str, **kwargs):
+        pass
+
+    def release_collection(self, collection_name: str, **kwargs):
+        pass
+
+    def flush(self, collection_name: str, **kwargs):
+        pass
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    # rows
+
+    @staticmethod
+    def _mark_deleted(state: _Collection, ids, deleted: dict) -> int:
+        """Sets the deletion mask bits of the stored rows of ids in deleted, copying masks on first change."""
+        masks = {segment.segment_id: (segment, mask) for segment, mask in state.segments}
+        count = 0
+        for row_id in ids:
+            located = state.rows.get(row_id)
+            if located is None:
+                continue
+            segment_id, row = located
+            if segment_id not in deleted:
+                segment, mask = masks[segment_id]
+                deleted[segment_id] = np.zeros(len(segment), dtype=bool) if mask is None else mask.copy()
+            deleted[segment_id][row] = True
+            count += 1
+        return count
+
+    def upsert(self, collection_name: str, data, **kwargs) -> dict:
+        rows = {row["id"]: row for row in ([data] if isinstance(data, dict) else data)}
+        if not rows:
+            return {"upsert_count": 0}
+        with self._write_lock:
+            state = self._collection(collection_name)
+            deleted = {}
+            self._mark_deleted(state, rows, deleted)
+
+            vectors = state.encode_vectors([row["vector"] for row in rows.values()])
+            documents = [
+                json.dumps(
+                    {field: value for field, value in row.items() if field not in ("id", "vector")},
+                    default=_json_default,
+                ).encode("utf-8")
+                for row in rows.values()
+            ]
+            # row norms are computed once here, for cosine and L2 search
+            if vectors.dtype == np.uint8:
+                norms = np.zeros(len(vectors), dtype=np.float32)
+            else:
+                norms = np.linalg.norm(vectors.astype(np.float32), axis=1)
+            new_rows = {
+                "ids": np.array([row_id.encode("utf-8") for row_id in rows], dtype=bytes),
+                "vectors": vectors,
+                "norms": norms,
+                "meta": np.frombuffer(b"".join(documents), dtype=np.uint8),
+                "offsets": np.concatenate([[0], np.cumsum([len(document) for document in documents])]).astype(np.int64),
+            }
+            self._commit(collection_name, state, deleted, new_rows)
+        return {"upsert_count": len(rows)}
+
+    def delete(self, collection_name: str, ids=None, filter: str = "", **kwargs) -> dict:
+        if filter:
+            raise ValueError("The mmap backend deletes by ids only.")
+        ids = set([ids] if isinstance(ids, str) else ids or [])
+        with self._write_lock:
+            state = self._collection(collection_name)
+            deleted = {}
+            count = self._mark_deleted(state, ids, deleted)
+            if count:
+                self._commit(collection_name, state, deleted)
+        return {"delete_count": count}
+
+    def get(self, collection_name: str, ids, output_fields=None, **kwargs) -> list[dict]:
+        state = self._collection(collection_name)
+        segments = {segment.segment_id: segment for segment, _ in state.segments}
+        located = [state.rows.get(row_id) for row_id in ([ids] if isinstance(ids, str) else ids)]
+        return [
+            {"id": segments[segment_id].id(row), **segments[segment_id].entity(row, output_fields or ["*"])}
+            for segment_id, row in filter(None, located)
+        ]
+
+    def query_iterator(self, collection_name: str, batch_size: int = 1000, filter: str = "", output_fields=None,
+                       **kwargs) -> _QueryIterator:
+        if filter:
+            raise ValueError("The mmap backend iterates over whole collections only.")
+        return _QueryIterator(self._collection(collection_name).segments, batch_size, output_fields)
+
+    # search
+
+    def _score_block(self, segment: _Segment, deleted, start: int, queries: np.ndarray, query_norms: np.ndarray,
+                     metric_type: str, limit: int) -> tuple[np.ndarray, np.ndarray]:
+        """Top-limit rows of one block per query, as (rows, scores) of shape limit x queries; higher is better."""
+        block = segment.vectors[start:start + self.block_rows]
+        if metric_type == "HAMMING":
+            scores = -np.unpackbits(block[:, None, :] ^ queries[None, :, :], axis=2).sum(axis=2, dtype=np.float32)
+        else:
+            products = block.astype(np.float32, copy=False) @ queries.T
+            norms = segment.norms[start:start + len(block), None]
+            if metric_type == "COSINE":
+                scores = products / np.maximum(norms * query_norms[None, :], 1e-12)
+            elif metric_type == "L2":
+                scores = 2 * products - norms ** 2 - query_norms[None, :] ** 2
+            else:
+                scores = products
+        if deleted is not None:
+            scores[deleted[start:start + len(block)]] = -np.inf
+        k = min(limit, len(block))
+        rows = np.argpartition(-scores, k - 1, axis=0)[:k]
+        return rows + start, np.take_along_axis(scores, rows, axis=0)
+
+    def search(self, collection_name: str, data: list, limit: int = 10, output_fields=None, search_params=None,
+               filter: str = "", **kwargs) -> list[list[dict]]:
+        """Exact top-limit search; the metric comes from search_params like in Milvus."""
+        if filter:
+            raise ValueError("The mmap backend does not support filtered search.")
+        state = self._collection(collection_name)
+        segments = state.segments
+        metric_type = (search_params or {}).get("metric_type", "IP").upper()
+        if not segments or not data:
+            return [[] for _ in data]
+
+        if state.vector_type == DataType.BINARY_VECTOR:
+            queries = np.stack([np.frombuffer(query, dtype=np.uint8) for query in data])
+            query_norms = None
+        else:
+            queries = np.asarray(data, dtype=np.float32).reshape(len(data), -1)
+            query_norms = np.linalg.norm(queries, axis=1)
+
+        # blocks of all segments, with rows numbered across segments
+        bases = np.cumsum([0] + [len(segment) for segment, _ in segments])
+        tasks = [
+            (index, start) for index, (segment, _) in enumerate(segments) for start in range(0, len(segment), self.block_rows)
+        ]
+
+        def score_block(task):
+            index, start = task
+            segment, deleted = segments[index]
+            rows, scores = self._score_block(segment, deleted, start, queries, query_norms, metric_type, limit)
+            return rows + bases[index], scores
+
+        if self._executor and len(tasks) > 1:
+            blocks = list(self._executor.map(score_block, tasks))
+        else:
+            blocks = [score_block(task) for task in tasks]
+        rows = np.concatenate([block_rows for block_rows, _ in blocks])
+        scores = np.concatenate([block_scores for _, block_scores in blocks])
+
+        order = np.argsort(-scores, axis=0, kind="stable")[:limit]
+        rows, scores = np.take_along_axis(rows, order, axis=0), np.take_along_axis(scores, order, axis=0)
+        found = np.isfinite(scores)
+        if metric_type == "L2":
+            # Milvus reports squared L2 distances
+            scores = np.maximum(-scores, 0)
+        elif metric_type in DISTANCE_METRICS:
+            scores = -scores
+
+        segment_indexes = np.searchsorted(bases, rows, side="right") - 1
+        results = []
+        for query in range(len(data)):
+            hits = []
+            for row, index, score in zip(rows[found[:, query], query], segment_indexes[found[:, query], query],
+                                         scores[found[:, query], query]):
+                segment = segments[index][0]
+                local_row = int(row - bases[index])
+                hits.append({
+                    "id": segment.id(local_row), "distance": float(score),
+                    "entity": segment.entity(local_row, output_fields),
+                })
+            results.append(hits)
+        return results
+
+
+def export_collection(milvus_client: MilvusClient, mmap_client: MmapVectorClient, collection_name: str,
+                      batch_size: int = 1000) -> int:
+    """Copies a Milvus collection, rows and schema, into the mmap backend."""
+    description = milvus_client.describe_collection(collection_name)
+    mmap_client.drop_collection(collection_name)
+    mmap_client.create_collection_from_fields(
+        collection_name, description["fields"], description.get("enable_dynamic_field", False)
+    )
+    milvus_client.load_collection(collection_name)
+    iterator = milvus_client.query_iterator(
+        collection_name=collection_name, batch_size=batch_size, filter="", output_fields=["*"]
+    )
+    count = 0
+    try:
+        while batch := iterator.next():
+            mmap_client.upsert(collection_name, batch)
+            count += len(batch)
+    finally:
+        iterator.close()
+    mmap_client.compact(collection_name)
+    return count
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv(override=True)
+
+    parser = argparse.ArgumentParser(description="Copy Milvus collections into the memory-mapped vector backend.")
+    parser.add_argument("--milvus-endpoint", default=os.getenv("MILVUS_ENDPOINT"))
+    parser.add_argument("--path", default=os.getenv("MMAP_VECTORS_DIR", MMAP_VECTORS_DIR))
+    parser.add_argument(
+        "--collections", nargs="+",
+        default=[os.getenv("TEXT_COLLECTION_NAME"), os.getenv("IMAGE_COLLECTION_NAME")],
+    )
+    args = parser.parse_args()
+
+    milvus_client = MilvusClient(uri=args.milvus_endpoint)
+    mmap_client = MmapVectorClient(args.path)
+    for collection_name in args.collections:
+        print(f"{collection_name}: {export_collection(milvus_client, mmap_client, collection_name)} rows exported to {args.path}")
@@ -0,0 +1,212 @@
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+from dataclasses import dataclass, replace
+import numpy as np
+from pymilvus import DataType
+
+from rag_app.index_specs import IndexSpec, INDEX_PRESETS
+from rag_app import telemetry
+
+
+FULL_VECTORS_PATH = os.getenv("FULL_VECTORS_PATH", "./full_vectors.db")
+
+# Milvus 2.5 has no int8 vectors, float16 is the closest scalar quantization it stores
+VECTOR_STORAGE_TYPES = {
+    "float32": DataType.FLOAT_VECTOR,
+    "float16": DataType.FLOAT16_VECTOR,
+    "binary": DataType.BINARY_VECTOR,
+}
+BYTES_PER_DIM = {"float32": 4, "float16": 2, "binary": 1 / 8}
+
+
+@dataclass
+class QuantizationSpec:
+    """How vectors are stored in Milvus.
+
+    `dim` keeps only the first dim components (Matryoshka truncation) and `storage`
+    selects float32, float16 or sign-binarized vectors. Quantized searches fetch
+    rescore_factor times more candidates and reorder them by their full-precision
+    vectors, which are kept in a SQLite sidecar store.
+    """
+    storage: str = "float32"
+    dim: int = None
+    rescore_factor: int = 4
+
+    def __post_init__(self):
+        self.storage = self.storage.lower()
+        if self.storage not in VECTOR_STORAGE_TYPES:
+            raise ValueError(f"Unsupported vector storage {self.storage}. Choose one of {list(VECTOR_STORAGE_TYPES)}.")
+        if self.storage == "binary" and self.dim is not None and self.dim % 8:
+            raise ValueError(f"Binary vectors need a dimension divisible by 8, got {self.dim}.")
+        if self.rescore_factor < 1:
+            raise ValueError(f"The rescore factor must be at least 1, got {self.rescore_factor}.")
+
+    @property
+    def quantized(self) -> bool:
+        return self.storage != "float32" or self.dim is not None
+
+    @property
+    def datatype(self) -> DataType:
+        return VECTOR_STORAGE_TYPES[self.storage]
+
+    def stored_dim(self, dim: int) -> int:
+        return min(self.dim, dim) if self.dim else dim
+
+    def bytes_per_vector(self, dim: int) -> float:
+        return self.stored_dim(dim) * BYTES_PER_DIM[self.storage]
+
+    def candidate_limit(self, limit: int) -> int:
+        return limit * self.rescore_factor if self.quantized else limit
+
+    def index_spec(self, index_spec: IndexSpec) -> IndexSpec:
+        """Binary vectors need a binary index and the Hamming metric; other storages keep index_spec."""
+        if self.storage != "binary":
+            return index_spec
+        index_type = "BIN_IVF_FLAT" if index_spec.index_type.startswith("IVF") else "BIN_FLAT"
+        build_params, search_params = INDEX_PRESETS[index_type]
+        return replace(
+            index_spec, index_type=index_type, metric_type="HAMMING",
+            build_params=build_params, search_params=search_params,
+        )
+
+    def encode(self, vectors) -> list:
+        """Converts full-precision vectors to the values Milvus stores for this spec."""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if self.dim:
+            # truncated Matryoshka embeddings are renormalized to unit length
+            matrix = matrix[:, :self.dim]
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms > 0, norms, 1)
+        if self.storage == "float16":
+            return list(matrix.astype(np.float16))
+        if self.storage == "binary":
+            return [row.tobytes() for row in np.packbits(matrix > 0, axis=1)]
+        return matrix.tolist()
+
+
+def quantization_from_env(prefix: str) -> QuantizationSpec:
+    """Reads <prefix>_VECTOR_STORAGE, <prefix>_VECTOR_DIM and <prefix>_RESCORE_FACTOR."""
+    dim = os.getenv(f"{prefix}_VECTOR_DIM")
+    return QuantizationSpec(
+        storage=os.getenv(f"{prefix}_VECTOR_STORAGE", "float32"),
+        dim=int(dim) if dim else None,
+        rescore_factor=int(os.getenv(f"{prefix}_RESCORE_FACTOR", 4)),
+    )
+
+
+TEXT_QUANTIZATION = quantization_from_env("TEXT")
+IMAGE_QUANTIZATION = quantization_from_env("IMAGE")
+
+
+class FullVectorStore:
+    """Full-precision float32 vectors of quantized collections, stored in SQLite by collection and row id."""
+
+    def __init__(self, path: str = FULL_VECTORS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "collection TEXT NOT NULL, id TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (collection, id))"
+        )
+        self._conn.commit()
+
+    def get_many(self, collection_name: str, ids: list[str]) -> dict:
+        found = {}
+        with self._lock:
+            # stay below SQLite's limit on bound parameters
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id, vector FROM vectors WHERE collection = ? AND id IN ({placeholders})",
+                    [collection_name, *chunk],
+                ).fetchall()
+                found.update({row_id: np.frombuffer(vector, dtype=np.float32) for row_id, vector in rows})
+        return found
+
+    def get_all(self, collection_name: str) -> tuple[list[str], np.ndarray]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, vector FROM vectors WHERE collection = ? ORDER BY id", (collection_name,)
+            ).fetchall()
+        if not rows:
+            return [], np.empty((0, 0), dtype=np.float32)
+        return [row_id for row_id, _ in rows], np.stack([np.frombuffer(vector, dtype=np.float32) for _, vector in rows])
+
+    def put_many(self, collection_name: str, vectors: dict):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (collection, id, vector) VALUES (?, ?, ?)",
+                [
+                    (collection_name, row_id, np.asarray(vector, dtype=np.float32).tobytes())
+                    for row_id, vector in vectors.items()
+                ],
+            )
+            self._conn.commit()
+
+    def delete_many(self, collection_name: str, ids: list[str]):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM vectors WHERE collection = ? AND id = ?", [(collection_name, row_id) for row_id in ids]
+            )
+            self._conn.commit()
+
+    def drop(self, collection_name: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM vectors WHERE collection = ?", (collection_name,))
+            self._conn.commit()
+
+    def rename(self, old_name: str, new_name: str):
+        """Moves the vectors of old_name to new_name, replacing the ones stored there."""
+        with self._lock:
+            self._conn.execute("DELETE FROM vectors WHERE collection = ?", (new_name,))
+            self._conn.execute("UPDATE vectors SET collection = ? WHERE collection = ?", (new_name, old_name))
+            self._conn.commit()
+
+
+@lru_cache(maxsize=1)
+def get_full_vector_store() -> FullVectorStore:
+    return FullVectorStore()
+
+
+def exact_scores(matrix: np.ndarray, query: np.ndarray, metric_type: str) -> np.ndarray:
+    """Scores of the rows of matrix for query, higher is better for every metric."""
+    if metric_type == "COSINE":
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        return matrix @ query / np.where(norms > 0, norms, 1)
+    if metric_type == "L2":
+        return -((matrix - query) ** 2).sum(axis=1)
+    return matrix @ query
+
+
+def rescore_hits(
+    collection_name: str, hits: list, query_vector, metric_type: str, limit: int, store: FullVectorStore = None
+) -> list[dict]:
+    """Reorders quantized search hits by their full-precision score under metric_type and keeps the best limit.
+
+    Hits without a stored full-precision vector keep their order after the rescored ones.
+    """
+    store = store or get_full_vector_store()
+    with telemetry.span("rescore", collection=collection_name, candidates=len(hits)):
+        full_vectors = store.get_many(collection_name, [hit["id"] for hit in hits])
+        scored = [hit for hit in hits if hit["id"] in full_vectors]
+        unscored = [hit for hit in hits if hit["id"] not in full_vectors]
+        if scored:
+            scores = exact_scores(
+                np.stack([full_vectors[hit["id"]] for hit in scored]), np.asarray(query_vector, dtype=np.float32),
+                metric_type,
+            )
+            # Milvus reports L2 as a distance, so it goes back with its sign restored
+            sign = -1 if metric_type == "L2" else 1
+            scored = [
+                {**hit, "distance": sign * float(score)}
+                for hit, score in sorted(zip(scored, scores), key=lambda item: item[1], reverse=True)
+            ]
+    if unscored:
+        telemetry.incr("rescore_missing_vectors_total", len(unscored))
+    return (scored + unscored)[:limit]
@@ -0,0 +1,287 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+from pymilvus import MilvusClient
+
+from rag_app.encoder import emb_text, emb_image_text, get_embedding_cache, startup_report
+from rag_app.milvus_utils import (
+    get_search_text_results, get_search_image_results, get_search_text_results_batch,
+    get_search_image_results_batch, get_collection_version, get_rows_by_ids
+)
+from rag_app.micro_batcher import MicroBatcher, SEARCH_BATCHING
+from rag_app.ask_llm import get_llm_answer, stream_llm_answer, COMPLETE_FINISH_REASONS
+from rag_app.chunker import collapse_chunk_hits
+from rag_app.dataset import parse_image_list
+from rag_app.answer_cache import SemanticAnswerCache
+from rag_app.lexical_index import get_lexical_index, reciprocal_rank_fusion
+from rag_app.reranker import CrossEncoderReranker, rerank_hits, RERANK, RERANK_CANDIDATES
+from rag_app import telemetry
+
+
+TEXT_OUTPUT_FIELDS = ["article_id", "chunk_index", "article_url", "image_url", "text"]
+# chunks fetched from Milvus and the number of articles they are collapsed into
+TEXT_SEARCH_CHUNKS = int(os.getenv("TEXT_SEARCH_CHUNKS", 10))
+TEXT_SEARCH_ARTICLES = int(os.getenv("TEXT_SEARCH_ARTICLES", 2))
+# dense and BM25 results are fused when a lexical index has been built by data_insert.py
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", 1.0))
+HYBRID_SPARSE_WEIGHT = float(os.getenv("HYBRID_SPARSE_WEIGHT", 1.0))
+RRF_K = int(os.getenv("RRF_K", 60))
+# threads shared by all concurrent queries; each query runs its text and image paths in parallel
+QUERY_PIPELINE_WORKERS = int(os.getenv("QUERY_PIPELINE_WORKERS", 16))
+
+
+class StageTimer:
+    """Collects wall-clock timings of the pipeline stages of a single query."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, start: float, end: float):
+        with self._lock:
+            self.timings[name] = {
+                "start": start - self.started_at,
+                "duration": end - start,
+            }
+        telemetry.observe("query_stage_seconds", end - start, stage=name)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+
+# stages of each parallel query path; a streamed answer is generated after text_path has returned
+PATH_STAGES = {"text_path": ("text_path", "llm_answer"), "image_path": ("image_path",)}
+
+
+def critical_path(timings: dict) -> str:
+    """The query path that finished last, which bounds the latency of the query."""
+    ends = {}
+    for path, stages in PATH_STAGES.items():
+        stage_ends = [timings[stage]["start"] + timings[stage]["duration"] for stage in stages if stage in timings]
+        if stage_ends:
+            ends[path] = max(stage_ends)
+    return max(ends, key=ends.get) if ends else None
+
+
+def runtime_stats() -> dict:
+    """Startup phases, embedding cache statistics and telemetry of this process, shown in the UI."""
+    return {
+        "startup": startup_report(),
+        "embedding_cache": get_embedding_cache().stats(),
+        "telemetry": telemetry.telemetry.snapshot(),
+    }
+
+
+def build_context(articles: list) -> str:
+    return "\n".join([article[3] for article in articles])
+
+
+def parse_text_hit(hit: dict) -> tuple:
+    entity = hit["entity"]
+    image_url = entity["image_url"]
+    return (
+        hit["distance"],
+        entity["article_url"],
+        # collections built before image_url became an ARRAY field store the stringified list
+        image_url if isinstance(image_url, list) else parse_image_list(image_url),
+        entity["text"].replace(u'\u2019', u'\''),
+    )
+
+
+class QueryRun:
+    """Handle to an in-flight query; each accessor joins only the branch it needs."""
+
+    def __init__(self, question: str, timer: StageTimer, text_future, image_future, pipeline=None):
+        self.question = question
+        self.timer = timer
+        self._text_future = text_future
+        self._image_future = image_future
+        self._pipeline = pipeline
+        self._streamed_chunks = None
+
+    @property
+    def articles(self) -> list:
+        return self._text_future.result()[0]
+
+    @property
+    def answer(self) -> str:
+        if self._streamed_chunks is not None:
+            return "".join(self._streamed_chunks)
+        return self._text_future.result()[1]
+
+    def stream_answer(self):
+        """Yields answer chunks as Gemini produces them; only valid for runs submitted with stream=True."""
+        if self._pipeline is None:
+            raise RuntimeError("Query was not submitted in streaming mode.")
+        articles, cached_answer, cache_key = self._text_future.result()
+        if cached_answer is not None:
+            self._streamed_chunks = [cached_answer]
+            yield cached_answer
+            return
+
+        self._streamed_chunks = []
+        outcome = {}
+        with self.timer.stage("llm_answer"):
+            start = time.perf_counter()
+            for chunk in stream_llm_answer(
+                self._pipeline.gemini_model, build_context(articles), self.question, outcome
+            ):
+                if not self._streamed_chunks:
+                    self.timer.record("llm_first_token", start, time.perf_counter())
+                self._streamed_chunks.append(chunk)
+                yield chunk
+        # an answer Gemini stopped early ends with a notice and is not served to similar questions
+        if outcome.get("finish_reason") in COMPLETE_FINISH_REASONS:
+            self._pipeline.store_answer(cache_key, self.answer)
+
+    @property
+    def images(self) -> list:
+        return self._image_future.result()
+
+    @property
+    def timings(self) -> dict:
+        return self.timer.timings
+
+    @property
+    def critical_path(self) -> str:
+        return critical_path(self.timer.timings)
+
+    def wait(self):
+        self._text_future.result()
+        self._image_future.result()
+        self.timer.record("total", self.timer.started_at, time.perf_counter())
+        telemetry.incr("query_critical_path_total", path=self.critical_path)
+
+
+class QueryPipeline:
+    def __init__(
+        self,
+        milvus_client: MilvusClient,
+        gemini_model: genai.GenerativeModel,
+        text_collection_name: str,
+        image_collection_name: str,
+        max_workers: int = QUERY_PIPELINE_WORKERS,
+        answer_cache: SemanticAnswerCache = None,
+        reranker: CrossEncoderReranker = None,
+        search_batching: bool = SEARCH_BATCHING,
+    ):
+        self.milvus_client = milvus_client
+        self.gemini_model = gemini_model
+        self.text_collection_name = text_collection_name
+        self.image_collection_name = image_collection_name
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query")
+        # separate pool, so text path tasks never wait on work queued behind them
+        self.lexical_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lexical")
+        self.answer_cache = answer_cache or SemanticAnswerCache(
+            version_fn=lambda: get_collection_version(text_collection_name)
+        )
+        self.reranker = reranker or (CrossEncoderReranker() if RERANK else None)
+        # the reranker picks from a larger candidate pool than the prompt needs
+        self.candidate_limit = max(TEXT_SEARCH_CHUNKS, RERANK_CANDIDATES) if self.reranker else TEXT_SEARCH_CHUNKS
+        # concurrent queries share Milvus search calls
+        self.text_batcher = MicroBatcher(
+            lambda vectors: get_search_text_results_batch(
+                milvus_client, text_collection_name, vectors, TEXT_OUTPUT_FIELDS, limit=self.candidate_limit
+            ),
+            name="search_text",
+        ) if search_batching else None
+        self.image_batcher = MicroBatcher(
+            lambda vectors: get_search_image_results_batch(milvus_client, image_collection_name, vectors),
+            name="search_image",
+        ) if search_batching else None
+
+    def store_answer(self, cache_key: tuple, answer: str):
+        query_vector, article_keys = cache_key
+        self.answer_cache.store(query_vector, article_keys, answer)
+
+    def _search_lexical(self, question: str, timer: StageTimer) -> list:
+        with timer.stage("search_lexical"):
+            lexical_index = get_lexical_index()
+            return lexical_index.search(question, self.candidate_limit) if lexical_index else []
+
+    def _fuse_hits(self, dense_hits: list, lexical_hits: list) -> list:
+        """Orders chunk hits by reciprocal-rank fusion; distance becomes the fused score."""
+        hits_by_id = {hit["id"]: hit for hit in dense_hits}
+        fused = reciprocal_rank_fusion(
+            [[hit["id"] for hit in dense_hits], [chunk_id for chunk_id, _ in lexical_hits]],
+            [HYBRID_DENSE_WEIGHT, HYBRID_SPARSE_WEIGHT],
+            k=RRF_K,
+        )[:self.candidate_limit]
+        missing_ids = [chunk_id for chunk_id, _ in fused if chunk_id not in hits_by_id]
+        for row in get_rows_by_ids(self.milvus_client, self.text_collection_name, missing_ids, TEXT_OUTPUT_FIELDS):
+            hits_by_id[row["id"]] = {"id": row["id"], "entity": {field: row.get(field) for field in TEXT_OUTPUT_FIELDS}}
+        return [
+            {**hits_by_id[chunk_id], "distance": score} for chunk_id, score in fused if chunk_id in hits_by_id
+        ]
+
+    def _run_text_path(self, question: str, timer: StageTimer, generate: bool = True):
+        with timer.stage("text_path"):
+            lexical_future = self.lexical_executor.submit(self._search_lexical, question, timer) if HYBRID_SEARCH else None
+            with timer.stage("emb_text"):
+                query_vector = emb_text(question)
+            with timer.stage("search_text"):
+                if self.text_batcher:
+                    chunk_hits = self.text_batcher(query_vector)
+                else:
+                    chunk_hits = get_search_text_results(
+                        self.milvus_client, self.text_collection_name, query_vector, TEXT_OUTPUT_FIELDS,
+                        limit=self.candidate_limit,
+                    )[0]
+            lexical_hits = lexical_future.result() if lexical_future else []
+            if lexical_hits:
+                with timer.stage("fuse"):
+                    chunk_hits = self._fuse_hits(chunk_hits, lexical_hits)
+            if self.reranker:
+                with timer.stage("rerank"):
+                    chunk_hits = rerank_hits(self.reranker, question, chunk_hits)
+            hits = collapse_chunk_hits(chunk_hits, TEXT_SEARCH_ARTICLES)
+            articles = [parse_text_hit(hit) for hit in hits]
+
+            cache_key = (query_vector, [hit["entity"]["article_id"] for hit in hits])
+            with timer.stage("answer_cache"):
+                cached_answer = self.answer_cache.lookup(*cache_key)
+            if not generate or cached_answer is not None:
+                return articles, cached_answer, cache_key
+
+            with timer.stage("llm_answer"):
+                answer = get_llm_answer(self.gemini_model, build_context(articles), question)
+            self.store_answer(cache_key, answer)
+        return articles, answer, cache_key
+
+    def _run_image_path(self, question: str, timer: StageTimer):
+        with timer.stage("image_path"):
+            with timer.stage("emb_image_text"):
+                img_query_vector = emb_image_text(question)
+            with timer.stage("search_image"):
+                if self.image_batcher:
+                    return self.image_batcher(img_query_vector)
+                return get_search_image_results(
+                    self.milvus_client, self.image_collection_name, img_query_vector
+                )
+
+    def search_images(self, question: str) -> list[str]:
+        """Runs the image path alone, for callers that only need similar images."""
+        return self._run_image_path(question, StageTimer())
+
+    def submit(self, question: str, stream: bool = False) -> QueryRun:
+        """Starts both paths; with stream=True the answer is generated by QueryRun.stream_answer."""
+        timer = StageTimer()
+        text_future = self.executor.submit(self._run_text_path, question, timer, not stream)
+        image_future = self.executor.submit(self._run_image_path, question, timer)
+        return QueryRun(question, timer, text_future, image_future, self if stream else None)
+
+    def run(self, question: str) -> QueryRun:
+        query_run = self.submit(question)
+        query_run.wait()
+        return query_run
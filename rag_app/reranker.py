@@ -0,0 +1,108 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from rag_app.chunker import count_tokens
+from rag_app import telemetry
+
+
+RERANK = os.getenv("RERANK", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 20))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 16))
+RERANK_LATENCY_BUDGET_MS = float(os.getenv("RERANK_LATENCY_BUDGET_MS", 300))
+RERANK_TOKEN_BUDGET = int(os.getenv("RERANK_TOKEN_BUDGET", 1500))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", 10000))
+
+
+class CrossEncoderReranker:
+    """Scores (question, passage) pairs with a small cross-encoder on CPU.
+
+    The model is loaded on first use. Scores are cached per question and chunk id,
+    and scoring stops at the deadline; unscored passages keep their retrieval order.
+    """
+
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL,
+        batch_size: int = RERANK_BATCH_SIZE,
+        cache_size: int = RERANK_CACHE_SIZE,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._model = None
+        self._tokenizer = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+                with telemetry.span("rerank_load", model=self.model_name):
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                    self._model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+                    self._model.eval()
+        return self._tokenizer, self._model
+
+    def _score_batch(self, question: str, texts: list[str]) -> list[float]:
+        import torch
+
+        tokenizer, model = self._load()
+        features = tokenizer([question] * len(texts), texts, padding=True, truncation=True, return_tensors="pt")
+        with torch.no_grad():
+            logits = model(**features).logits
+        return logits[:, 0].tolist()
+
+    def score(self, question: str, passages: list[tuple[str, str]], deadline: float = None) -> dict:
+        """Returns {passage_id: score} for the passages scored before the deadline (a time.perf_counter value)."""
+        scores = {}
+        with self._lock:
+            for passage_id, _ in passages:
+                if (question, passage_id) in self._cache:
+                    scores[passage_id] = self._cache[(question, passage_id)]
+                    self._cache.move_to_end((question, passage_id))
+        telemetry.incr("rerank_cache_hits_total", len(scores))
+
+        pending = [(passage_id, text) for passage_id, text in passages if passage_id not in scores]
+        for i in range(0, len(pending), self.batch_size):
+            if deadline is not None and time.perf_counter() > deadline:
+                telemetry.incr("rerank_deadline_exceeded_total")
+                break
+            batch = pending[i:i + self.batch_size]
+            with telemetry.span("rerank_batch", passages=len(batch)):
+                batch_scores = self._score_batch(question, [text for _, text in batch])
+            with self._lock:
+                for (passage_id, _), score in zip(batch, batch_scores):
+                    scores[passage_id] = score
+                    self._cache[(question, passage_id)] = score
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+
+def rerank_hits(
+    reranker: CrossEncoderReranker,
+    question: str,
+    hits: list[dict],
+    latency_budget_ms: float = RERANK_LATENCY_BUDGET_MS,
+    token_budget: int = RERANK_TOKEN_BUDGET,
+) -> list[dict]:
+    """Reorders chunk hits by cross-encoder score and keeps the best ones that fit into token_budget."""
+    deadline = time.perf_counter() + latency_budget_ms / 1000
+    scores = reranker.score(question, [(hit["id"], hit["entity"]["text"]) for hit in hits], deadline)
+
+    scored = sorted((hit for hit in hits if hit["id"] in scores), key=lambda hit: scores[hit["id"]], reverse=True)
+    unscored = [hit for hit in hits if hit["id"] not in scores]
+
+    selected, used_tokens = [], 0
+    for hit in scored + unscored:
+        tokens = count_tokens(hit["entity"]["text"])
+        if selected and used_tokens + tokens > token_budget:
+            continue
+        selected.append(hit)
+        used_tokens += tokens
+    return selected
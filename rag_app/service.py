@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import asyncio
+from contextlib import asynccontextmanager
+
+# makes the rag_app package importable when run as `python rag_app/service.py`
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from dotenv import load_dotenv
+
+
+# settings are read when the rag_app modules are imported
+load_dotenv(override=True)
+
+from rag_app.ask_llm import create_gemini_model
+from rag_app.encoder import warm_image_encoder
+from rag_app.milvus_utils import get_milvus_client
+from rag_app.query_pipeline import QueryPipeline, runtime_stats
+from rag_app.thumbnails import get_thumbnail
+from rag_app import telemetry
+
+
+TEXT_COLLECTION_NAME = os.getenv("TEXT_COLLECTION_NAME")
+IMAGE_COLLECTION_NAME = os.getenv("IMAGE_COLLECTION_NAME")
+MILVUS_ENDPOINT = os.getenv("MILVUS_ENDPOINT")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+IMAGES_DATA_DIR = os.getenv("IMAGES_DATA_DIR", "./data/images/")
+QUERY_SERVICE_HOST = os.getenv("QUERY_SERVICE_HOST", "127.0.0.1")
+QUERY_SERVICE_PORT = int(os.getenv("QUERY_SERVICE_PORT", 8000))
+QUERY_SERVICE_WORKERS = int(os.getenv("QUERY_SERVICE_WORKERS", 1))
+
+
+class QueryRequest(BaseModel):
+    question: str
+    stream: bool = False
+
+
+class ImageSearchRequest(BaseModel):
+    question: str
+
+
+def serialize_articles(articles: list) -> list[dict]:
+    return [
+        {"distance": distance, "article_url": article_url, "images": images, "text": text}
+        for distance, article_url, images, text in articles
+    ]
+
+
+def event(event_type: str, **fields) -> str:
+    return json.dumps({"type": event_type, **fields}) + "\n"
+
+
+def stream_query_events(pipeline: QueryPipeline, question: str):
+    """NDJSON events in the order the UI renders them: articles, answer chunks, images, timings."""
+    try:
+        query_run = pipeline.submit(question, stream=True)
+        yield event("articles", articles=serialize_articles(query_run.articles))
+        for chunk in query_run.stream_answer():
+            yield event("answer", text=chunk)
+        yield event("images", images=query_run.images)
+        query_run.wait()
+        yield event("timings", timings=query_run.timings)
+    except Exception as e:
+        # the status line is already sent, so errors are reported in the stream
+        yield event("error", detail=str(e))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one Milvus client, Gemini model, pipeline and set of caches per worker process
+    app.state.pipeline = QueryPipeline(
+        get_milvus_client(uri=MILVUS_ENDPOINT),
+        create_gemini_model(GEMINI_API_KEY),
+        TEXT_COLLECTION_NAME,
+        IMAGE_COLLECTION_NAME,
+    )
+    warm_image_encoder()
+    yield
+
+
+app = FastAPI(title="Multimodal RAG query service", lifespan=lifespan)
+
+
+@app.post("/query")
+async def query(request: QueryRequest):
+    pipeline = app.state.pipeline
+    if request.stream:
+        return StreamingResponse(stream_query_events(pipeline, request.question), media_type="application/x-ndjson")
+    query_run = await asyncio.to_thread(pipeline.run, request.question)
+    return {
+        "answer": query_run.answer,
+        "articles": serialize_articles(query_run.articles),
+        "images": query_run.images,
+        "timings": query_run.timings,
+        "critical_path": query_run.critical_path,
+    }
+
+
+@app.post("/search/images")
+async def search_images(request: ImageSearchRequest):
+    return {"images": await asyncio.to_thread(app.state.pipeline.search_images, request.question)}
+
+
+@app.get("/images/thumbnail")
+async def image_thumbnail(path: str):
+    images_dir = os.path.realpath(IMAGES_DATA_DIR)
+    image_path = os.path.realpath(path)
+    # only images returned by the image search can be read
+    if os.path.commonpath([images_dir, image_path]) != images_dir or not os.path.isfile(image_path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(await asyncio.to_thread(get_thumbnail, image_path))
+
+
+@app.get("/stats")
+async def stats():
+    return runtime_stats()
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(telemetry.telemetry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "rag_app.service:app", host=QUERY_SERVICE_HOST, port=QUERY_SERVICE_PORT, workers=QUERY_SERVICE_WORKERS
+    )
@@ -0,0 +1,125 @@
+import os
+import json
+import requests
+
+from rag_app.query_pipeline import critical_path
+
+
+QUERY_SERVICE_TIMEOUT = float(os.getenv("QUERY_SERVICE_TIMEOUT", 120))
+
+
+class RemoteQueryRun:
+    """QueryRun counterpart backed by the NDJSON event stream of the query service.
+
+    Events arrive in the order the UI renders them, so each accessor only reads
+    the stream as far as it needs.
+    """
+
+    def __init__(self, response: requests.Response):
+        self._response = response
+        self._events = (json.loads(line) for line in response.iter_lines() if line)
+        self._articles = None
+        self._chunks = []
+        self._images = None
+        self._timings = None
+
+    def _read_event(self):
+        event = next(self._events, None)
+        if event is None:
+            raise RuntimeError("The query service closed the stream before the query finished.")
+        if event["type"] == "error":
+            raise RuntimeError(f"The query service failed: {event['detail']}")
+        if event["type"] == "articles":
+            self._articles = [
+                (article["distance"], article["article_url"], article["images"], article["text"])
+                for article in event["articles"]
+            ]
+        elif event["type"] == "answer":
+            self._chunks.append(event["text"])
+        elif event["type"] == "images":
+            self._images = event["images"]
+        elif event["type"] == "timings":
+            self._timings = event["timings"]
+            self._response.close()
+
+    @property
+    def articles(self) -> list:
+        while self._articles is None:
+            self._read_event()
+        return self._articles
+
+    @property
+    def answer(self) -> str:
+        return "".join(self._chunks)
+
+    def stream_answer(self):
+        # the images event follows the last answer chunk
+        yielded = 0
+        while True:
+            while yielded < len(self._chunks):
+                yield self._chunks[yielded]
+                yielded += 1
+            if self._images is not None:
+                return
+            self._read_event()
+
+    @property
+    def images(self) -> list:
+        while self._images is None:
+            self._read_event()
+        return self._images
+
+    def wait(self):
+        while self._timings is None:
+            self._read_event()
+
+    @property
+    def timings(self) -> dict:
+        return self._timings or {}
+
+    @property
+    def critical_path(self) -> str:
+        return critical_path(self.timings)
+
+
+class QueryServiceClient:
+    """Client of rag_app/service.py with the submit() interface of QueryPipeline."""
+
+    def __init__(self, base_url: str, timeout: float = QUERY_SERVICE_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def submit(self, question: str, stream: bool = True) -> RemoteQueryRun:
+        # answers are always streamed, RemoteQueryRun.answer collects them for non-streaming callers
+        response = self.session.post(
+            f"{self.base_url}/query", json={"question": question, "stream": True}, stream=True, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return RemoteQueryRun(response)
+
+    def run(self, question: str) -> RemoteQueryRun:
+        query_run = self.submit(question)
+        for _ in query_run.stream_answer():
+            pass
+        query_run.wait()
+        return query_run
+
+    def search_images(self, question: str) -> list[str]:
+        response = self.session.post(
+            f"{self.base_url}/search/images", json={"question": question}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()["images"]
+
+    def thumbnail(self, image_path: str) -> bytes:
+        response = self.session.get(
+            f"{self.base_url}/images/thumbnail", params={"path": image_path}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.content
+
+    def stats(self) -> dict:
+        response = self.session.get(f"{self.base_url}/stats", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
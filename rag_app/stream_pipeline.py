@@ -0,0 +1,240 @@
+import os
+import time
+import queue
+import threading
+
+from rag_app import telemetry
+
+
+# items waiting in front of each stage; producers block when it is full
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 512))
+INGEST_PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", 10))
+
+_END = object()
+_POLL_SECONDS = 0.1
+
+
+class _Cancelled(Exception):
+    """Raised in the workers of all stages once one stage has failed."""
+
+
+class Stage:
+    """One step of a streaming Pipeline, run by `workers` threads.
+
+    fn takes one input item, or a list of up to batch_size items when batch_size is set,
+    and returns a list of output items. Outputs go to the bounded input queue of every
+    downstream stage, so a slow stage holds back its producers instead of letting the
+    corpus pile up in memory. A source stage has no fn and emits the items of `source`.
+    finish, if set, is called once after the last input item and returns the stage's
+    remaining outputs, for stages that hold items back across calls.
+    """
+
+    def __init__(
+        self, name: str, fn=None, workers: int = 1, batch_size: int = None, queue_size: int = INGEST_QUEUE_SIZE,
+        source=None, finish=None,
+    ):
+        if (fn is None) == (source is None):
+            raise ValueError(f"Stage {name} needs either fn or source.")
+        if source is not None and workers != 1:
+            raise ValueError(f"Source stage {name} runs in a single worker.")
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch_size = batch_size
+        self.source = source
+        self.finish = finish
+        self.queue = None if source is not None else queue.Queue(maxsize=queue_size)
+        self.downstream = []
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self._running = workers
+        self._lock = threading.Lock()
+        self._cancelled = None
+
+    def then(self, stage: "Stage") -> "Stage":
+        """Sends the outputs of this stage to stage as well; returns stage for chaining."""
+        if stage.source is not None:
+            raise ValueError(f"Source stage {stage.name} cannot have an upstream stage.")
+        self.downstream.append(stage)
+        return stage
+
+    def _put(self, item):
+        while True:
+            if self._cancelled.is_set():
+                raise _Cancelled()
+            try:
+                self.queue.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+    def _get(self):
+        while True:
+            if self._cancelled.is_set():
+                raise _Cancelled()
+            try:
+                return self.queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                pass
+
+    def _take(self) -> tuple[list, bool]:
+        """The next input items and whether the upstream stage is done."""
+        items = []
+        while len(items) < (self.batch_size or 1):
+            item = self._get()
+            if item is _END:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _emit(self, outputs):
+        for item in outputs or ():
+            for stage in self.downstream:
+                stage._put(item)
+            with self._lock:
+                self.items_out += 1
+
+    def _run_source(self):
+        source = iter(self.source)
+        try:
+            while True:
+                start = time.perf_counter()
+                item = next(source, _END)
+                self.busy_seconds += time.perf_counter() - start
+                if item is _END:
+                    return
+                self._emit([item])
+        finally:
+            # a failed or cancelled run closes the source in its own thread, which runs the generator's
+            # cleanup, e.g. flushing writers and shutting down worker processes
+            if hasattr(source, "close"):
+                source.close()
+
+    def _run(self):
+        while True:
+            items, done = self._take()
+            if items:
+                start = time.perf_counter()
+                with telemetry.span(f"ingest_{self.name}", items=len(items)):
+                    outputs = self.fn(items if self.batch_size else items[0])
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.items_in += len(items)
+                    self.busy_seconds += elapsed
+                telemetry.incr("ingest_items_total", len(items), stage=self.name)
+                self._emit(outputs)
+            if done:
+                return
+
+    def _finish(self):
+        start = time.perf_counter()
+        with telemetry.span(f"ingest_{self.name}_finish"):
+            outputs = self.finish()
+        with self._lock:
+            self.busy_seconds += time.perf_counter() - start
+        self._emit(outputs)
+
+    def _work(self, pipeline: "Pipeline"):
+        try:
+            self._run_source() if self.source is not None else self._run()
+            with self._lock:
+                self._running -= 1
+                last = self._running == 0
+            if last and self.finish is not None:
+                self._finish()
+        except _Cancelled:
+            return
+        except BaseException as e:
+            pipeline._fail(self, e)
+            return
+        if last:
+            # every worker of a downstream stage stops at its own end marker
+            try:
+                for stage in self.downstream:
+                    for _ in range(stage.workers):
+                        stage._put(_END)
+            except _Cancelled:
+                pass
+
+    def progress(self) -> str:
+        queued = f", {self.queue.qsize()} queued" if self.queue is not None else ""
+        return f"{self.name}: {self.items_in} in, {self.items_out} out{queued}"
+
+
+class Pipeline:
+    """Runs a tree of stages concurrently, starting at a source stage, and reports per-stage progress.
+
+    The first exception raised by a stage stops all stages and is raised again by run().
+    """
+
+    def __init__(self, source: Stage, progress_interval: float = INGEST_PROGRESS_INTERVAL):
+        self.stages = []
+        pending = [source]
+        while pending:
+            stage = pending.pop(0)
+            if stage not in self.stages:
+                self.stages.append(stage)
+                pending.extend(stage.downstream)
+        self.progress_interval = progress_interval
+        self._cancelled = threading.Event()
+        self._error = None
+        self._error_lock = threading.Lock()
+
+    def _fail(self, stage: Stage, error: BaseException):
+        with self._error_lock:
+            if self._error is None:
+                print(f"Stage {stage.name} failed: {error}")
+                self._error = error
+        self._cancelled.set()
+
+    def _print_progress(self, done: threading.Event):
+        while not done.wait(self.progress_interval):
+            print(" | ".join(stage.progress() for stage in self.stages))
+
+    def run(self) -> dict:
+        for stage in self.stages:
+            stage._cancelled = self._cancelled
+        workers = [(stage, i) for stage in self.stages for i in range(stage.workers)]
+        threads = [
+            threading.Thread(target=stage._work, args=(self,), name=f"{stage.name}-{i}", daemon=True)
+            for stage, i in workers
+        ]
+        done = threading.Event()
+        progress = threading.Thread(target=self._print_progress, args=(done,), daemon=True)
+
+        start = time.perf_counter()
+        progress.start()
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            self._cancelled.set()
+            # the source stops at its next item and closes its generator
+            for thread, (stage, _) in zip(threads, workers):
+                if stage.source is not None:
+                    thread.join()
+            raise
+        finally:
+            done.set()
+        if self._error is not None:
+            raise self._error
+        return self.report(time.perf_counter() - start)
+
+    def report(self, wall_time: float) -> dict:
+        """Per-stage item counts and busy time; utilization near 1 marks the stage that bounds the run."""
+        return {
+            "wall_time_s": wall_time,
+            "stages": {
+                stage.name: {
+                    "workers": stage.workers,
+                    "items_in": stage.items_in,
+                    "items_out": stage.items_out,
+                    "busy_s": stage.busy_seconds,
+                    "utilization": stage.busy_seconds / (wall_time * stage.workers) if wall_time else 0.0,
+                }
+                for stage in self.stages
+            },
+        }
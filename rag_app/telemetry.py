@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# spans are appended to this JSONL file when set
+TRACE_FILE = os.getenv("TRACE_FILE")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_PREFIX = "rag"
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_key: tuple, **extra) -> str:
+    labels = list(label_key) + [(key, str(value)) for key, value in extra.items()]
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Telemetry:
+    """Process-wide counters, timing summaries and spans shared by ingest and query code."""
+
+    def __init__(self, trace_file: str = TRACE_FILE, window: int = 1024):
+        self.trace_file = trace_file
+        self.window = window
+        self._counters = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            timing = self._timings.setdefault(key, {"count": 0, "sum": 0.0, "recent": deque(maxlen=self.window)})
+            timing["count"] += 1
+            timing["sum"] += seconds
+            timing["recent"].append(seconds)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Times the block as <name>_seconds; attributes added to the yielded dict end up in the trace."""
+        span_attrs = dict(attrs)
+        start_time = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield span_attrs
+        except Exception as e:
+            error = type(e).__name__
+            self.incr(f"{name}_errors_total")
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.observe(f"{name}_seconds", duration)
+            if self.trace_file:
+                self._write_trace({
+                    "name": name,
+                    "start": start_time,
+                    "duration": duration,
+                    "thread": threading.current_thread().name,
+                    "error": error,
+                    "attrs": span_attrs,
+                })
+
+    def _write_trace(self, record: dict):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.trace_file, "a") as file:
+                file.write(line + "\n")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = {
+                name + _format_labels(labels): value for (name, labels), value in self._counters.items()
+            }
+            timings = {}
+            for (name, labels), timing in self._timings.items():
+                recent = sorted(timing["recent"])
+                timings[name + _format_labels(labels)] = {
+                    "count": timing["count"],
+                    "mean_ms": timing["sum"] / timing["count"] * 1000,
+                    "p50_ms": recent[len(recent) // 2] * 1000,
+                    "p95_ms": recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000,
+                }
+        return {"counters": counters, "timings": timings}
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{METRICS_PREFIX}_{name}{_format_labels(labels)} {value}")
+            for (name, labels), timing in sorted(self._timings.items()):
+                recent = sorted(timing["recent"])
+                metric = f"{METRICS_PREFIX}_{name}"
+                for quantile in (0.5, 0.95, 0.99):
+                    value = recent[min(len(recent) - 1, int(len(recent) * quantile))]
+                    lines.append(f"{metric}{_format_labels(labels, quantile=quantile)} {value}")
+                lines.append(f"{metric}_count{_format_labels(labels)} {timing['count']}")
+                lines.append(f"{metric}_sum{_format_labels(labels)} {timing['sum']}")
+        return "\n".join(lines) + "\n"
+
+    def start_metrics_server(self, port: int = METRICS_PORT) -> ThreadingHTTPServer:
+        """Serves render_prometheus() on http://0.0.0.0:<port>/metrics from a daemon thread."""
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+
+
+telemetry = Telemetry()
+
+span = telemetry.span
+incr = telemetry.incr
+observe = telemetry.observe
@@ -0,0 +1,51 @@
+import os
+import hashlib
+import threading
+from PIL import Image
+
+from rag_app import telemetry
+
+
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "./data/thumbnails")
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", 224))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", 75))
+
+
+def thumbnail_path(image_path: str, size: int = THUMBNAIL_SIZE, thumbnail_dir: str = THUMBNAIL_DIR) -> str:
+    # the modification time is part of the key, so a re-downloaded image gets a new thumbnail
+    key = f"{os.path.abspath(image_path)}\x00{os.path.getmtime(image_path)}\x00{size}"
+    return os.path.join(thumbnail_dir, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.webp")
+
+
+def get_thumbnail(
+    image_path: str, size: int = THUMBNAIL_SIZE, quality: int = THUMBNAIL_QUALITY, thumbnail_dir: str = THUMBNAIL_DIR
+) -> str:
+    """Returns the path of a WebP render of image_path, at most size pixels on each side.
+
+    Thumbnails are rendered on first request and kept in thumbnail_dir, which can be
+    deleted at any time. The original path is returned if the image cannot be rendered.
+    """
+    try:
+        output_path = thumbnail_path(image_path, size, thumbnail_dir)
+    except OSError:
+        return image_path
+    if os.path.exists(output_path):
+        telemetry.incr("thumbnail_cache_hits_total")
+        return output_path
+
+    telemetry.incr("thumbnail_cache_misses_total")
+    try:
+        with telemetry.span("render_thumbnail", size=size):
+            os.makedirs(thumbnail_dir, exist_ok=True)
+            with Image.open(image_path) as image:
+                image.thumbnail((size, size))
+                if image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA")
+                # written under a unique name and renamed, so concurrent sessions never see a partial file
+                tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                image.save(tmp_path, format="WEBP", quality=quality)
+            os.replace(tmp_path, output_path)
+    except OSError as e:
+        print(f"Failed to render a thumbnail of {image_path}: {e}")
+        return image_path
+    return output_path
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# makes the scripts and the rag_app package importable from the tests
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import subprocess
+
+import pandas as pd
+
+from bench.stand_ins import fake_vector
+from rag_app.milvus_utils import create_text_collection, create_image_collection
+from rag_app.mmap_backend import MmapVectorClient
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def test_bench_runs_with_stand_ins(tmp_path):
+    client = MmapVectorClient(str(tmp_path / "vectors"))
+    create_text_collection(client, "text", dim=768)
+    create_image_collection(client, "images", dim=768)
+    client.upsert("text", [
+        {
+            "id": f"chunk{i}", "vector": fake_vector(f"chunk{i}", 768), "text": f"article {i} about transformers",
+            "article_id": f"article{i}", "chunk_index": 0, "article_url": f"https://example.com/{i}",
+            "image_url": [f"https://example.com/{i}.png"],
+        }
+        for i in range(5)
+    ])
+    client.upsert("images", [
+        {"id": f"image{i}", "vector": fake_vector(f"image{i}", 768), "image_path": f"./data/images/{i}.png"}
+        for i in range(5)
+    ])
+    prompts_file = tmp_path / "prompts.csv"
+    pd.DataFrame({"prompt": ["What are transformers?", "Who wrote about robots?"]}).to_csv(prompts_file)
+
+    env = {
+        **os.environ,
+        "TEXT_COLLECTION_NAME": "text", "IMAGE_COLLECTION_NAME": "images",
+        "MMAP_VECTORS_DIR": str(tmp_path / "vectors"), "LEXICAL_INDEX_PATH": str(tmp_path / "lexical_index.json"),
+        "COLLECTION_VERSIONS_FILE": str(tmp_path / "collection_versions.json"),
+    }
+    output = tmp_path / "report.json"
+    for stream in (["--stream"], []):
+        subprocess.run(
+            [
+                sys.executable, os.path.join(REPO_DIR, "bench", "run_bench.py"), "--backend", "mmap",
+                "--prompts-file", str(prompts_file), "--concurrency", "1", "2", "--fake-image-encoder",
+                "--embed-latency", "0", "--first-token-latency", "0", "--tokens-per-second", "100000",
+                "--image-encoder-latency", "0", "--output", str(output), *stream,
+            ],
+            env=env, cwd=tmp_path, check=True,
+        )
+        report = json.loads(output.read_text())
+        assert set(report["levels"]) == {"1", "2"}
+        assert report["levels"]["1"]["queries"] == 2
+        assert "total" in report["levels"]["2"]["stages"]
@@ -0,0 +1,41 @@
+import sys
+import importlib
+
+import pandas as pd
+import pytest
+
+from rag_app.chunker import chunk_articles
+
+
+@pytest.fixture
+def data_insert(tmp_path, monkeypatch):
+    monkeypatch.setenv("VECTOR_BACKEND", "mmap")
+    monkeypatch.setenv("MMAP_VECTORS_DIR", str(tmp_path / "vectors"))
+    monkeypatch.setenv("TEXT_COLLECTION_NAME", "text")
+    monkeypatch.setenv("IMAGE_COLLECTION_NAME", "images")
+    monkeypatch.setenv("FULL_VECTORS_PATH", str(tmp_path / "full_vectors.db"))
+    monkeypatch.setenv("LEXICAL_INDEX_PATH", str(tmp_path / "lexical_index.json"))
+    monkeypatch.setenv("COLLECTION_VERSIONS_FILE", str(tmp_path / "collection_versions.json"))
+    monkeypatch.setenv("TEXT_EMBEDDINGS_CHECKPOINT", str(tmp_path / "text_embeddings.jsonl"))
+    for module in ["data_insert", "rag_app.milvus_utils", "rag_app.mmap_backend", "rag_app.lexical_index"]:
+        sys.modules.pop(module, None)
+    module = importlib.import_module("data_insert")
+    yield module
+    sys.modules.pop("data_insert", None)
+
+
+def test_full_rebuild_without_chunks_keeps_the_collection(data_insert, monkeypatch):
+    monkeypatch.setattr(data_insert, "chunk_articles", lambda articles: chunk_articles(pd.DataFrame(
+        columns=["article_id", "content_hash", "text", "article_url", "image"]
+    )))
+    monkeypatch.setattr(data_insert, "get_articles", lambda: None)
+    monkeypatch.setattr(data_insert, "emb_text_batched", lambda texts, checkpoint_path=None: [])
+    data_insert.insert_text_collection()
+    assert not data_insert.milvus_client.has_collection("text")
+
+
+def test_full_rebuild_without_encoded_images_keeps_the_collection(data_insert, monkeypatch):
+    monkeypatch.setattr(data_insert, "get_images", lambda: [])
+    monkeypatch.setattr(data_insert, "emb_images", lambda image_paths: {})
+    data_insert.insert_image_collection()
+    assert not data_insert.milvus_client.has_collection("images")
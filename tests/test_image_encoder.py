@@ -0,0 +1,61 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+from PIL import Image
+
+torch = pytest.importorskip("torch")
+
+
+class StubVisualizedBGE(torch.nn.Module):
+    """Follows Visualized_BGE: encode(image=...) preprocesses one image and runs encode_image on it."""
+
+    def __init__(self, model_name_bge=None, model_weight=None):
+        super().__init__()
+        torch.manual_seed(0)
+        self.projection = torch.nn.Linear(3 * 8 * 8, 16)
+        self.device = torch.device("cpu")
+
+    def preprocess_val(self, image):
+        pixels = np.asarray(image.convert("RGB").resize((8, 8)), dtype=np.float32) / 255
+        return torch.from_numpy(pixels).permute(2, 0, 1)
+
+    def encode_image(self, images):
+        return torch.nn.functional.normalize(self.projection(images.flatten(1)), dim=-1)
+
+    def encode(self, image=None, text=None):
+        return self.encode_image(self.preprocess_val(Image.open(image)).unsqueeze(0))
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    modeling = types.ModuleType("FlagEmbedding.research.visual_bge.modeling")
+    modeling.Visualized_BGE = StubVisualizedBGE
+    for name in ("FlagEmbedding", "FlagEmbedding.research", "FlagEmbedding.research.visual_bge"):
+        monkeypatch.setitem(sys.modules, name, types.ModuleType(name))
+    monkeypatch.setitem(sys.modules, modeling.__name__, modeling)
+    monkeypatch.delitem(sys.modules, "rag_app.image_encoder", raising=False)
+    from rag_app.image_encoder import ImageEncoder
+
+    return ImageEncoder("stub", "stub.pth")
+
+
+def test_batched_encoding_matches_per_image(encoder, tmp_path):
+    rng = np.random.default_rng(0)
+    image_paths = []
+    for i in range(7):
+        path = str(tmp_path / f"{i}.png")
+        Image.fromarray(rng.integers(0, 256, size=(12 + i, 10, 3), dtype=np.uint8)).save(path)
+        image_paths.append(path)
+    broken = str(tmp_path / "broken.png")
+    with open(broken, "wb") as file:
+        file.write(b"not an image")
+
+    encoded = list(encoder.encode_images(image_paths[:4] + [broken] + image_paths[4:], batch_size=3, prefetch_batches=1))
+
+    assert sorted(path for path, _ in encoded) == sorted(image_paths + [broken])
+    embeddings = dict(encoded)
+    assert embeddings.pop(broken) is None
+    for path in image_paths:
+        assert np.allclose(embeddings[path], encoder.encode_image(path), atol=1e-6)
@@ -0,0 +1,139 @@
+import io
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+import img_download
+from img_download import create_session, download_images, load_manifest, DOWNLOAD_MANIFEST_FILE
+
+
+def png_bytes(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ImageServer:
+    """Local stand-in for the image host; routes map a path to a function of (handler, request number)."""
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, self.headers.get("If-None-Match")))
+                count = sum(path == self.path for path, _ in server.requests)
+                server.routes[self.path](self, count)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def send_image(handler, content: bytes = png_bytes((200, 10, 10)), etag: str = '"v1"'):
+    if handler.headers.get("If-None-Match") == etag:
+        handler.send_response(304)
+        handler.end_headers()
+        return
+    handler.send_response(200)
+    handler.send_header("Content-Type", "image/png")
+    handler.send_header("Content-Length", str(len(content)))
+    handler.send_header("ETag", etag)
+    handler.end_headers()
+    handler.wfile.write(content)
+
+
+def send_error(handler, status: int):
+    handler.send_response(status)
+    handler.send_header("Content-Length", "0")
+    handler.end_headers()
+
+
+@pytest.fixture
+def server():
+    image_server = ImageServer()
+    yield image_server
+    image_server.close()
+
+
+def download(server, tmp_path, images: dict, retries: int = 0, **kwargs) -> dict:
+    dataset = {name: f"{server.url}/{path}" for name, path in images.items()}
+    return download_images(
+        dataset, str(tmp_path), session=create_session(4, retries), max_workers=4, process_workers=1,
+        image_format="png", **kwargs
+    )
+
+
+def test_existing_images_are_skipped(server, tmp_path):
+    server.routes["/a.png"] = lambda handler, count: send_image(handler)
+    assert download(server, tmp_path, {"a": "a.png"})["downloaded"] == 1
+    assert load_manifest(str(tmp_path))["a"] == {"url": f"{server.url}/a.png", "etag": '"v1"'}
+
+    stats = download(server, tmp_path, {"a": "a.png"})
+    assert stats == {"downloaded": 0, "skipped": 1, "failed": 0}
+    assert len(server.requests) == 1
+
+
+def test_revalidation_keeps_unchanged_images(server, tmp_path):
+    server.routes["/a.png"] = lambda handler, count: send_image(handler)
+    download(server, tmp_path, {"a": "a.png"})
+    modified = os.path.getmtime(tmp_path / "a.png")
+
+    stats = download(server, tmp_path, {"a": "a.png"}, revalidate=True)
+    assert stats == {"downloaded": 0, "skipped": 1, "failed": 0}
+    assert server.requests[-1] == ("/a.png", '"v1"')
+    assert os.path.getmtime(tmp_path / "a.png") == modified
+
+
+def test_server_errors_are_retried(server, tmp_path):
+    server.routes["/a.png"] = lambda handler, count: send_error(handler, 503) if count == 1 else send_image(handler)
+    stats = download(server, tmp_path, {"a": "a.png"}, retries=2)
+    assert stats["downloaded"] == 1
+    assert len(server.requests) == 2
+
+
+def test_timeouts_fail_without_a_manifest_entry(server, tmp_path):
+    def slow(handler, count):
+        time.sleep(1)
+        send_image(handler)
+
+    server.routes["/a.png"] = slow
+    stats = download(server, tmp_path, {"a": "a.png"}, timeout=0.2)
+    assert stats == {"downloaded": 0, "skipped": 0, "failed": 1}
+    assert "a" not in load_manifest(str(tmp_path))
+    assert not os.path.exists(tmp_path / "a.png")
+
+
+def test_manifest_is_saved_while_downloads_are_running(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(img_download, "MANIFEST_SAVE_EVERY", 1)
+    manifest_path = tmp_path / DOWNLOAD_MANIFEST_FILE
+    seen_while_running = []
+
+    def blocked_until_saved(handler, count):
+        # an interrupt at this point must not lose the image that is already on disk
+        deadline = time.time() + 5
+        while time.time() < deadline and not seen_while_running:
+            if manifest_path.exists() and "a" in json.loads(manifest_path.read_text()):
+                seen_while_running.append(True)
+            time.sleep(0.05)
+        send_image(handler)
+
+    server.routes["/a.png"] = lambda handler, count: send_image(handler)
+    server.routes["/b.png"] = blocked_until_saved
+    stats = download(server, tmp_path, {"a": "a.png", "b": "b.png"})
+    assert stats["downloaded"] == 2
+    assert seen_while_running == [True]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import rag_app.quantization as quantization
+from index_tool import load_vectors, exact_top_k, measure_recall
+from rag_app.index_specs import get_index_spec
+from rag_app.milvus_utils import create_text_collection, rebuild_index
+from rag_app.mmap_backend import MmapVectorClient
+from rag_app.quantization import QuantizationSpec, FullVectorStore
+
+
+@pytest.fixture
+def full_vectors(tmp_path, monkeypatch):
+    store = FullVectorStore(str(tmp_path / "full_vectors.db"))
+    monkeypatch.setattr(quantization, "get_full_vector_store", lambda: store)
+    monkeypatch.setattr("index_tool.get_full_vector_store", lambda: store)
+    return store
+
+
+@pytest.mark.parametrize("storage", ["float32", "float16", "binary"])
+def test_recall_of_quantized_collections(tmp_path, full_vectors, storage):
+    spec = QuantizationSpec(storage=storage, rescore_factor=8)
+    index_spec = get_index_spec("HNSW", "COSINE")
+    vectors = np.random.default_rng(0).standard_normal((200, 64)).astype(np.float32)
+    ids = [f"row{i:03d}" for i in range(len(vectors))]
+
+    client = MmapVectorClient(str(tmp_path / "vectors"))
+    create_text_collection(client, "text", dim=64, index_spec=index_spec, quantization=spec)
+    client.upsert("text", [
+        {"id": row_id, "vector": vector, "text": "", "article_id": "", "chunk_index": 0, "article_url": "",
+         "image_url": []}
+        for row_id, vector in zip(ids, spec.encode(vectors))
+    ])
+    if spec.quantized:
+        full_vectors.put_many("text", dict(zip(ids, vectors)))
+    rebuild_index(client, "text", spec.index_spec(index_spec))
+
+    loaded_ids, matrix = load_vectors(client, "text", spec)
+    assert matrix.dtype == np.float32 and matrix.shape == vectors.shape
+    assert np.allclose(matrix[np.argsort(loaded_ids)], vectors)
+    assert exact_top_k(matrix, matrix[:3], 1, "COSINE")[:, 0].tolist() == [0, 1, 2]
+
+    report = measure_recall(client, "text", index_spec, spec, loaded_ids, matrix, n_queries=20, k=5)
+    assert report["storage"] == storage
+    assert report["metric_type"] == ("HAMMING" if storage == "binary" else "COSINE")
+    # rescoring by the full-precision vectors recovers the exact neighbours
+    assert report["recall@5"] >= (0.6 if storage == "binary" else 0.99)
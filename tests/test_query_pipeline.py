@@ -0,0 +1,87 @@
+from concurrent.futures import Future
+
+import pytest
+
+from bench.stand_ins import FakeChunk, FakeGenerativeModel, FakeResponse
+from rag_app.query_pipeline import QueryRun, StageTimer, critical_path
+
+
+class StoppingModel:
+    """Streams part of an answer, then stops with finish_reason, or raises if finish_reason is an exception."""
+
+    def __init__(self, finish_reason):
+        self.finish_reason = finish_reason
+
+    def _chunks(self):
+        yield FakeChunk("partial answer ")
+        if isinstance(self.finish_reason, Exception):
+            raise self.finish_reason
+        yield FakeChunk("", self.finish_reason)
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        return FakeResponse(self._chunks(), 10, 2)
+
+
+class RecordingPipeline:
+    def __init__(self, gemini_model):
+        self.gemini_model = gemini_model
+        self.stored = []
+
+    def store_answer(self, cache_key, answer):
+        self.stored.append(answer)
+
+
+def done(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def stream(gemini_model) -> tuple[QueryRun, RecordingPipeline]:
+    pipeline = RecordingPipeline(gemini_model)
+    articles = [(0.9, "https://example.com/a", [], "some context")]
+    query_run = QueryRun(
+        "question", StageTimer(), done((articles, None, ([0.1], ["a"]))), done([]), pipeline
+    )
+    return query_run, pipeline
+
+
+def test_complete_answers_are_cached():
+    query_run, pipeline = stream(FakeGenerativeModel(0, 100000, answer_tokens=20))
+    answer = "".join(query_run.stream_answer())
+    assert pipeline.stored == [answer]
+
+
+@pytest.mark.parametrize("finish_reason", ["SAFETY", "RECITATION"])
+def test_answers_stopped_early_are_not_cached(finish_reason):
+    query_run, pipeline = stream(StoppingModel(finish_reason))
+    answer = "".join(query_run.stream_answer())
+    assert finish_reason in answer
+    assert pipeline.stored == []
+
+
+def test_answers_of_failed_streams_are_not_cached():
+    query_run, pipeline = stream(StoppingModel(RuntimeError("connection reset")))
+    with pytest.raises(RuntimeError):
+        for _ in query_run.stream_answer():
+            pass
+    assert pipeline.stored == []
+
+
+def test_streamed_generation_counts_towards_the_text_path():
+    timings = {
+        "text_path": {"start": 0.0, "duration": 0.2},
+        "image_path": {"start": 0.0, "duration": 0.5},
+        "llm_answer": {"start": 0.3, "duration": 1.0},
+    }
+    assert critical_path(timings) == "text_path"
+    assert critical_path({**timings, "llm_answer": {"start": 0.3, "duration": 0.1}}) == "image_path"
+
+
+def test_streamed_run_records_generation_stages():
+    query_run, _ = stream(FakeGenerativeModel(0.05, 1000, answer_tokens=20))
+    for _ in query_run.stream_answer():
+        pass
+    query_run.wait()
+    assert {"llm_answer", "llm_first_token", "total"} <= set(query_run.timings)
+    assert query_run.critical_path == "text_path"
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from rag_app.stream_pipeline import Stage, Pipeline
+
+
+class Source:
+    """Generator source that records how far it got and whether its cleanup ran."""
+
+    def __init__(self, items: int):
+        self.items = items
+        self.emitted = 0
+        self.closed = threading.Event()
+
+    def __call__(self):
+        try:
+            for item in range(self.items):
+                self.emitted += 1
+                yield item
+        finally:
+            self.closed.set()
+
+
+def test_failed_run_closes_the_source():
+    source = Source(10_000)
+
+    def fail_after_ten(item):
+        if item == 10:
+            raise RuntimeError("stage failed")
+        return [item]
+
+    first = Stage("source", source=source())
+    first.then(Stage("fail", fail_after_ten, queue_size=4)).then(Stage("sink", lambda items: [], batch_size=8))
+    with pytest.raises(RuntimeError, match="stage failed"):
+        Pipeline(first, progress_interval=60).run()
+    assert source.closed.is_set()
+    assert source.emitted < source.items
+
+
+def test_completed_run_drains_every_stage():
+    source = Source(100)
+    outputs = []
+    lock = threading.Lock()
+
+    def collect(items):
+        with lock:
+            outputs.extend(items)
+        return []
+
+    def flush():
+        return ["flushed"]
+
+    first = Stage("source", source=source())
+    double = first.then(Stage("double", lambda item: [item * 2], workers=3))
+    held = double.then(Stage("hold", lambda items: items, batch_size=7, finish=flush))
+    held.then(Stage("collect", collect, batch_size=5))
+    report = Pipeline(first, progress_interval=60).run()
+
+    assert sorted(item for item in outputs if item != "flushed") == [item * 2 for item in range(100)]
+    assert outputs.count("flushed") == 1
+    assert source.closed.is_set()
+    assert report["stages"]["double"]["items_in"] == 100